@@ -0,0 +1,352 @@
+# Copyright 2022 Ben North
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+"""Benchmarks of program generation, both solvers, and the comparison
+tool's parsing and canonicalization
+
+`run` writes the timings as JSON; `compare` checks one set of timings
+against another (say, a stored baseline) and flags regressions.
+Each benchmark is timed as the best of several repeats, and reported
+as seconds per item, where an item is a call, a game, or a solution,
+as given by the benchmark's `unit`.
+"""
+
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Callable
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import click
+
+Repo_Root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Repo_Root / "tree-programs"))
+sys.path.insert(0, str(Repo_Root / "compare-solutions"))
+
+import compile_trees as ct  # noqa: E402
+import compare_solutions as cs  # noqa: E402
+
+
+def game_corpus(n_games, seed):
+    """Fixed list of `(target, cards)` six-card games for the given
+    seed, made as the comparison campaigns make theirs"""
+    rnd = random.Random(seed)
+    return [cs.random_game(rnd) for _ in range(n_games)]
+
+
+@dataclass
+class Benchmark:
+    """`run()` does the work being timed, for `n_items` items of the
+    given unit; `setup()`, if given, is called, untimed, before each
+    repeat"""
+
+    name: str
+    unit: str
+    n_items: int
+    run: Callable[[], object]
+    setup: Callable[[], object] = lambda: None
+
+
+def best_seconds(benchmark, n_repeats):
+    best = None
+    for _ in range(n_repeats):
+        benchmark.setup()
+        t0 = time.perf_counter()
+        benchmark.run()
+        elapsed = time.perf_counter() - t0
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def program_benchmarks():
+    for n_cards in range(4, 8):
+        yield Benchmark(
+            f"compile_trees.all_programs[{n_cards}]",
+            "call",
+            1,
+            lambda n_cards=n_cards: ct.all_programs(n_cards),
+        )
+    for n_cards in range(4, 9):
+        yield Benchmark(
+            f"compile_trees.total_n_programs[{n_cards}]",
+            "call",
+            1,
+            lambda n_cards=n_cards: ct.total_n_programs(n_cards),
+            # Time it without its cached polynomials.
+            ct._tree_and_forest_polynomials.cache_clear,
+        )
+
+
+def canonical_ids(trees):
+    canonicalizer = cs.Canonicalizer()
+    return [canonicalizer.canonical_id(tree) for tree in trees]
+
+
+def solver_benchmarks(games, tree_solver, rpn_solver, wanted=lambda name: True):
+    """Benchmarks of the solvers, and of parsing and canonicalizing
+    their output, or none for a solver which is missing
+
+    The solvers are only run to get output to parse if `wanted()` is
+    true for the name of some benchmark of parsing it.
+    """
+    if os.path.exists(tree_solver):
+        batch_input = "".join(
+            " ".join(str(n) for n in [target] + cards) + "\n"
+            for target, cards in games
+        )
+        yield Benchmark(
+            "evaluator-cli --batch",
+            "game",
+            len(games),
+            lambda: subprocess.run(
+                [tree_solver, "--batch"],
+                input=batch_input,
+                capture_output=True,
+                encoding="utf-8",
+                check=True,
+            ),
+        )
+
+    for solver_name, solver in [("evaluator-cli", tree_solver),
+                                ("rpn-solve", rpn_solver)]:
+        if not os.path.exists(solver):
+            continue
+
+        yield Benchmark(
+            f"{solver_name} per-game",
+            "game",
+            len(games),
+            lambda solver=solver: [
+                subprocess.run(
+                    [solver] + [str(n) for n in [target] + cards],
+                    capture_output=True,
+                    check=True,
+                )
+                for target, cards in games
+            ],
+        )
+
+        if solver_name == "rpn-solve":
+            yield Benchmark(
+                "rpn-solve --memo per-game",
+                "game",
+                len(games),
+                lambda: [
+                    subprocess.run(
+                        [rpn_solver, "--memo"]
+                        + [str(n) for n in [target] + cards],
+                        capture_output=True,
+                        check=True,
+                    )
+                    for target, cards in games
+                ],
+            )
+
+        parse_names = [
+            f"{prefix}[{solver_name}]"
+            for prefix in ["tree_from_string", "canonical key", "Canonicalizer"]
+        ]
+        if not any(map(wanted, parse_names)):
+            continue
+
+        lines = [
+            line
+            for target, cards in games
+            for line in subprocess.run(
+                [solver] + [str(n) for n in [target] + cards],
+                capture_output=True,
+                encoding="utf-8",
+                check=True,
+            ).stdout.splitlines()
+        ]
+        trees = [cs.tree_from_string(line) for line in lines]
+
+        yield Benchmark(
+            parse_names[0],
+            "solution",
+            len(lines),
+            lambda lines=lines: [cs.tree_from_string(line) for line in lines],
+        )
+        yield Benchmark(
+            parse_names[1],
+            "solution",
+            len(trees),
+            lambda trees=trees: [
+                tree.absorbing_like_children().in_canonical_order().key()
+                for tree in trees
+            ],
+        )
+        yield Benchmark(
+            parse_names[2],
+            "solution",
+            len(trees),
+            lambda trees=trees: canonical_ids(trees),
+        )
+
+
+def run_benchmarks(benchmarks, n_repeats, report_fun=None):
+    results = {}
+    for benchmark in benchmarks:
+        seconds = best_seconds(benchmark, n_repeats)
+        results[benchmark.name] = {
+            "unit": benchmark.unit,
+            "n_items": benchmark.n_items,
+            "seconds": seconds,
+            "seconds_per_item": seconds / max(benchmark.n_items, 1),
+        }
+        if report_fun is not None:
+            report_fun(benchmark.name, results[benchmark.name])
+    return results
+
+
+def git_commit():
+    result = subprocess.run(
+        ["git", "rev-parse", "HEAD"],
+        cwd=Repo_Root,
+        capture_output=True,
+        encoding="utf-8",
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def compare_results(baseline, current, threshold):
+    """For each benchmark in both, its name, the ratio of its current to
+    its baseline time per item, and "regression", "improvement" or
+    "same", according to whether that ratio is beyond `1 + threshold`
+    or `1 / (1 + threshold)`"""
+    comparisons = []
+    for name, current_result in current["results"].items():
+        baseline_result = baseline["results"].get(name)
+        if baseline_result is None:
+            continue
+        ratio = (
+            current_result["seconds_per_item"]
+            / baseline_result["seconds_per_item"]
+        )
+        if ratio > 1.0 + threshold:
+            verdict = "regression"
+        elif ratio < 1.0 / (1.0 + threshold):
+            verdict = "improvement"
+        else:
+            verdict = "same"
+        comparisons.append((name, ratio, verdict))
+    return comparisons
+
+
+def format_seconds(seconds):
+    for unit, scale in [("s", 1.0), ("ms", 1e-3), ("us", 1e-6)]:
+        if seconds >= scale:
+            return f"{seconds / scale:.3f}{unit}"
+    return f"{seconds / 1e-9:.1f}ns"
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command(name="run")
+@click.option(
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="file for the results, as JSON",
+)
+@click.option("--only", metavar="PATTERN", help="only run benchmarks matching")
+@click.option("--repeats", type=int, default=5, help="repeats of each")
+@click.option("--n-games", type=int, default=20, help="games in the corpus")
+@click.option("--seed", type=int, default=1, help="seed for the corpus")
+@click.option(
+    "--tree-solver",
+    default=str(Repo_Root / "evaluator" / "evaluator-cli"),
+    show_default=True,
+)
+@click.option(
+    "--rpn-solver",
+    default=str(Repo_Root / "other-solutions" / "rpn-solve"),
+    show_default=True,
+)
+def run(output, only, repeats, n_games, seed, tree_solver, rpn_solver):
+    "Run the benchmarks and write their timings"
+    def wanted(name):
+        return only is None or fnmatch(name, only)
+
+    games = game_corpus(n_games, seed)
+    benchmarks = [
+        *program_benchmarks(),
+        *solver_benchmarks(games, tree_solver, rpn_solver, wanted),
+    ]
+    benchmarks = [b for b in benchmarks if wanted(b.name)]
+
+    def report(name, result):
+        print(
+            f"{name}: {format_seconds(result['seconds_per_item'])}"
+            f" per {result['unit']}",
+            file=sys.stderr,
+        )
+
+    results = run_benchmarks(benchmarks, repeats, report)
+    json.dump(
+        {
+            "meta": {
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "n_games": n_games,
+                "seed": seed,
+                "repeats": repeats,
+            },
+            "results": results,
+        },
+        output,
+        indent=1,
+    )
+    output.write("\n")
+
+
+@cli.command(name="compare")
+@click.argument("baseline", type=click.File("r"))
+@click.argument("current", type=click.File("r"))
+@click.option(
+    "--threshold",
+    type=float,
+    default=0.1,
+    show_default=True,
+    help="fractional slow-down counted as a regression",
+)
+def compare(baseline, current, threshold):
+    """Compare timings with a baseline, exiting with failure if any
+    benchmark has regressed"""
+    comparisons = compare_results(
+        json.load(baseline), json.load(current), threshold
+    )
+    name_width = max((len(name) for name, _, _ in comparisons), default=0)
+    for name, ratio, verdict in comparisons:
+        flag = "" if verdict == "same" else f"  {verdict.upper()}"
+        print(f"{name:<{name_width}}  {ratio:6.3f}x{flag}")
+    if any(verdict == "regression" for _, _, verdict in comparisons):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
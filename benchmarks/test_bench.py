@@ -0,0 +1,89 @@
+# Copyright 2022 Ben North
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+import pytest
+
+import bench
+
+
+def results(seconds_per_item_by_name):
+    return {
+        "results": {
+            name: {"seconds_per_item": seconds}
+            for name, seconds in seconds_per_item_by_name.items()
+        }
+    }
+
+
+def test_game_corpus():
+    games = bench.game_corpus(5, 42)
+    assert games == bench.game_corpus(5, 42)
+    assert games != bench.game_corpus(5, 43)
+    assert all(len(cards) == 6 for _, cards in games)
+
+
+def test_solver_benchmarks_skip_unwanted_setup(tmp_path):
+    log_path = tmp_path / "runs.log"
+    rpn_solver = tmp_path / "rpn-solve"
+    rpn_solver.write_text(f"#!/bin/sh\necho run >> {log_path}\necho 'V(1) V(2) A(++) R'\n")
+    rpn_solver.chmod(0o755)
+    games = bench.game_corpus(2, 42)
+
+    def names(wanted):
+        return [
+            b.name
+            for b in bench.solver_benchmarks(
+                games, str(tmp_path / "missing"), str(rpn_solver), wanted
+            )
+        ]
+
+    assert names(lambda name: name.startswith("rpn")) == [
+        "rpn-solve per-game",
+        "rpn-solve --memo per-game",
+    ]
+    assert not log_path.exists()
+
+    assert "Canonicalizer[rpn-solve]" in names(lambda name: True)
+    assert log_path.read_text().splitlines() == ["run"] * len(games)
+
+
+def test_run_benchmarks():
+    calls = []
+    benchmark = bench.Benchmark(
+        "sum", "call", 4, lambda: calls.append("run"), lambda: calls.append("setup")
+    )
+    got_results = bench.run_benchmarks([benchmark], 3)
+    assert calls == ["setup", "run"] * 3
+    result = got_results["sum"]
+    assert result["unit"] == "call"
+    assert result["seconds_per_item"] == pytest.approx(result["seconds"] / 4)
+
+
+def test_compare_results():
+    baseline = results({"a": 1.0, "b": 1.0, "c": 1.0, "gone": 1.0})
+    current = results({"a": 1.05, "b": 1.5, "c": 0.5, "new": 1.0})
+    assert bench.compare_results(baseline, current, 0.1) == [
+        ("a", pytest.approx(1.05), "same"),
+        ("b", pytest.approx(1.5), "regression"),
+        ("c", pytest.approx(0.5), "improvement"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "seconds, exp_str",
+    [(2.5, "2.500s"), (0.0125, "12.500ms"), (3e-6, "3.000us"), (4e-9, "4.0ns")],
+)
+def test_format_seconds(seconds, exp_str):
+    assert bench.format_seconds(seconds) == exp_str
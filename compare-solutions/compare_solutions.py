@@ -13,10 +13,20 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see https://www.gnu.org/licenses/
 
-from dataclasses import dataclass
-from typing import List, Union
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Union
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from pathlib import Path
+import asyncio
+import hashlib
+import json
+import os
+import struct
 import subprocess
 import random
+import time
 from collections import Counter
 import click
 
@@ -46,6 +56,9 @@ class ValueNode:
     def pprint_expr(self):
         return str(self.value)
 
+    def pprint_toplevel(self):
+        return self.pprint_expr()
+
 
 @dataclass
 class OpNode:
@@ -146,8 +159,108 @@ def tree_from_string(s):
     return ops[0]
 
 
-def all_solutions_from_cmd(cmd, target, cards):
+# Opcode kinds, as in the C++ OpcodeKind:
+Kind_Value = 0
+Kind_MultiplyN = 1
+Kind_AddN = 2
+Kind_Return = 3
+
+
+def _ops_from_mask(kind, n_args, mask):
+    signs = ("+-" if kind == Kind_AddN else "*/")
+    return "".join(
+        signs[0] if mask & (1 << bit_idx) else signs[1]
+        for bit_idx in reversed(range(n_args))
+    )
+
+
+# All the strings of ops an OpNode can have, by (kind, n_args, mask), so
+# that decoding an opcode is one lookup.
+_ops_from_opcode = {
+    (kind, n_args, mask): _ops_from_mask(kind, n_args, mask)
+    for kind in (Kind_MultiplyN, Kind_AddN)
+    for n_args in range(2, 9)
+    for mask in range(1, 1 << n_args)
+}
+
+
+def tree_from_opcodes(opcodes, cards):
+    """Tree from concrete opcodes, three bytes (kind, arg0, arg1) each,
+    as in the C++ Opcode
+
+    For a Value, arg0 is the index into `cards`; for MultiplyN/AddN,
+    arg0 is the number of operands and arg1 the non-inverted-input mask,
+    whose bit 0 is for the last operand.
+    """
+    stack = []
+    for kind, arg0, arg1 in struct.iter_unpack("BBB", opcodes):
+        if kind == Kind_Value:
+            stack.append(ValueNode(cards[arg0]))
+        elif kind == Kind_Return:
+            break
+        else:
+            operands = stack[-arg0:]
+            del stack[-arg0:]
+            stack.append(OpNode(operands, _ops_from_opcode[kind, arg0, arg1]))
+    assert len(stack) == 1
+    return stack[0]
+
+
+def trees_from_binary(data, cards, pos=0):
+    """Trees from a solver's `--binary` output for one game
+
+    Each solution is a one-byte count of opcodes followed by that many
+    three-byte opcodes, as for `tree_from_opcodes()`; the game's
+    solutions end with a zero byte.  Slicing a `memoryview` of the
+    output avoids copying each solution.  The game's output starts at
+    `pos`; see `trees_from_binary_batch()` for several games.
+    """
+    return _trees_and_end_from_binary(memoryview(data), cards, pos)[0]
+
+
+def _trees_and_end_from_binary(data, cards, pos):
+    trees = []
+    while data[pos] != 0:
+        end = pos + 1 + 3 * data[pos]
+        trees.append(tree_from_opcodes(data[pos + 1 : end], cards))
+        pos = end
+    return trees, pos + 1
+
+
+def trees_from_binary_batch(data, games):
+    """Trees for each of the `(target, cards)` games, from the output
+    of a solver run with `--batch --binary`"""
+    data = memoryview(data)
+    all_trees = []
+    pos = 0
+    for _, cards in games:
+        trees, pos = _trees_and_end_from_binary(data, cards, pos)
+        all_trees.append(trees)
+    return all_trees
+
+
+def all_solutions_from_cmd_batch(cmd, games):
+    """All solutions of each of the `(target, cards)` games, from one
+    run of `cmd --batch --binary`"""
+    cmd_input = "".join(
+        " ".join(str(n) for n in [target] + cards) + "\n"
+        for target, cards in games
+    )
+    cmd_result = subprocess.run(
+        [cmd, "--batch", "--binary"],
+        input=cmd_input.encode(),
+        capture_output=True,
+        check=True,
+    )
+    return trees_from_binary_batch(cmd_result.stdout, games)
+
+
+def all_solutions_from_cmd(cmd, target, cards, binary=False):
     args = [cmd] + [str(n) for n in [target] + cards]
+    if binary:
+        args.insert(1, "--binary")
+        cmd_result = subprocess.run(args, capture_output=True)
+        return trees_from_binary(cmd_result.stdout, cards)
     cmd_result = subprocess.run(args, capture_output=True, encoding="utf-8")
     return list(
         tree_from_string(line)
@@ -155,6 +268,44 @@ def all_solutions_from_cmd(cmd, target, cards):
     )
 
 
+@dataclass
+class ReachableValue:
+    n_solutions: int
+    first_solution: Node
+
+
+def reachable_values_from_lines(lines):
+    """Map from value to ReachableValue, from `--all-targets` output
+
+    Each line is "VALUE N_SOLUTIONS FIRST_SOLUTION".
+    """
+    reachable_values = {}
+    for line in lines:
+        value, n_solutions, solution = line.split(maxsplit=2)
+        reachable_values[int(value)] = ReachableValue(
+            int(n_solutions),
+            tree_from_string(solution),
+        )
+    return reachable_values
+
+
+def reachable_values_from_cmd(cmd, cards, max_value=999):
+    args = [cmd, "--all-targets", "--max-value", str(max_value)]
+    args.extend(str(n) for n in cards)
+    cmd_result = subprocess.run(
+        args, capture_output=True, encoding="utf-8", check=True
+    )
+    return reachable_values_from_lines(cmd_result.stdout.splitlines())
+
+
+def nearest_reachable_value(reachable_values, target):
+    """The reachable value closest to `target`, preferring the lower of
+    two equally close ones, or None if no value is reachable"""
+    if not reachable_values:
+        return None
+    return min(reachable_values, key=lambda v: (abs(v - target), v))
+
+
 def compare_all_solutions(target, cards):
     return {
         "tree": all_solutions_from_cmd("./tree-solve", target, cards),
@@ -162,41 +313,395 @@ def compare_all_solutions(target, cards):
     }
 
 
+async def all_solutions_from_cmd_async(cmd, target, cards, binary=False):
+    """As `all_solutions_from_cmd()`, but without blocking, and decoding
+    each solution as it arrives on the solver's output"""
+    args = [str(n) for n in [target] + cards]
+    if binary:
+        args.insert(0, "--binary")
+    proc = await asyncio.create_subprocess_exec(
+        cmd, *args, stdout=asyncio.subprocess.PIPE
+    )
+    trees = []
+    if binary:
+        while (n_opcodes := (await proc.stdout.readexactly(1))[0]) != 0:
+            opcodes = await proc.stdout.readexactly(3 * n_opcodes)
+            trees.append(tree_from_opcodes(opcodes, cards))
+    else:
+        async for line in proc.stdout:
+            trees.append(tree_from_string(line.decode("utf-8")))
+    await proc.wait()
+    return trees
+
+
+def all_solutions_from_solver(solver, target, cards):
+    """All solutions from `solver`, which is either the path of a solver
+    executable, or an object with an `all_solutions()` method, such as
+    an `inprocess_solver.InProcessSolver`"""
+    if isinstance(solver, str):
+        return all_solutions_from_cmd(solver, target, cards)
+    return solver.all_solutions(target, cards)
+
+
 def solutions_from_cmd(cmd, target, cards):
     return list(
         (tree
          .absorbing_like_children()
          .in_canonical_order()
          .key())
-        for tree in all_solutions_from_cmd(cmd, target, cards)
+        for tree in all_solutions_from_solver(cmd, target, cards)
+    )
+
+
+class Canonicalizer:
+    """Canonical forms of trees, interned as small integer ids
+
+    Two trees get the same id exactly when they have the same
+    `.absorbing_like_children().in_canonical_order().key()`, but no
+    tree is rebuilt.  The canonical form of an operation is its kind
+    (1 for multiplication, 2 for addition) and the sorted tuple of its
+    terms, each `(inverted, id)`, with the terms of like children
+    absorbed; a value's is `(0, value)`.  Each distinct form is stored
+    once (hash-consing), and the id of an operation is memoized on its
+    ops and its children's ids, so subtrees shared between solutions
+    are canonicalized only once.
+    """
+
+    def __init__(self):
+        self.forms = []
+        self.ids = {}
+        self.op_node_ids = {}
+
+    def _intern(self, form):
+        canon_id = self.ids.get(form)
+        if canon_id is None:
+            canon_id = len(self.forms)
+            self.forms.append(form)
+            self.ids[form] = canon_id
+        return canon_id
+
+    def canonical_id(self, node):
+        if node.is_leaf:
+            return self._intern((0, node.value))
+
+        child_ids = tuple(self.canonical_id(ch) for ch in node.children)
+        memo_key = (node.ops, child_ids)
+        canon_id = self.op_node_ids.get(memo_key)
+        if canon_id is None:
+            kind = 2 if node.is_addition else 1
+            terms = []
+            for op, child_id in zip(node.ops, child_ids):
+                inverted = int(op not in "+*")
+                child_kind, child_terms = self.forms[child_id]
+                if child_kind == kind:
+                    terms.extend(
+                        (inverted ^ term_inverted, term_id)
+                        for term_inverted, term_id in child_terms
+                    )
+                else:
+                    terms.append((inverted, child_id))
+            canon_id = self._intern((kind, tuple(sorted(terms))))
+            self.op_node_ids[memo_key] = canon_id
+        return canon_id
+
+    def key(self, canon_id):
+        "The same key as `Node.key()` gives for the canonical tree"
+        kind, arg = self.forms[canon_id]
+        if kind == 0:
+            return (0, arg)
+        return (kind,) + tuple(sorted(
+            (inverted,) + self.key(term_id) for inverted, term_id in arg
+        ))
+
+
+def compare_solvers(
+    target,
+    cards,
+    tree_solver="./tree-solve",
+    rpn_solver="./rpn-solve",
+    canonicalizer=None,
+    solver_seconds=None,
+):
+    """Compare the solvers' solutions of the game
+
+    Solutions are compared by their canonical ids; "tree" and "rpn" are
+    lists of these, while the solutions found by only one solver are
+    given by their keys, as `Node.key()`.  If `solver_seconds` is
+    given, the time taken by each solver is added to it.
+    """
+
+    def timed_solutions(solver, solver_name):
+        t0 = time.perf_counter()
+        trees = all_solutions_from_solver(solver, target, cards)
+        if solver_seconds is not None:
+            solver_seconds[solver_name] += time.perf_counter() - t0
+        return trees
+
+    return compare_solutions_of(
+        target,
+        cards,
+        timed_solutions(tree_solver, "tree"),
+        timed_solutions(rpn_solver, "rpn"),
+        canonicalizer,
     )
 
 
-def compare_solvers(target, cards):
-    tree_solutions = solutions_from_cmd("./tree-solve", target, cards)
-    all_rpn_solutions = solutions_from_cmd("./rpn-solve", target, cards)
+def compare_solutions_of(
+    target, cards, tree_trees, rpn_trees, canonicalizer=None
+):
+    "Compare solutions already found by the solvers, as `compare_solvers()`"
+    if canonicalizer is None:
+        canonicalizer = Canonicalizer()
 
+    tree_solutions = [canonicalizer.canonical_id(t) for t in tree_trees]
+    all_rpn_solutions = [canonicalizer.canonical_id(t) for t in rpn_trees]
+
+    tree_solution_set = set(tree_solutions)
     rpn_solution_counts = Counter(all_rpn_solutions)
 
-    comparison = {
+    return {
         "target": target,
         "cards": cards,
         "tree": tree_solutions,
         "rpn": all_rpn_solutions,
-        "tree_not_rpn": [],
-        "rpn_not_tree": [],
+        "tree_not_rpn": [
+            canonicalizer.key(soln)
+            for soln in tree_solutions
+            if soln not in rpn_solution_counts
+        ],
+        "rpn_not_tree": [
+            canonicalizer.key(soln)
+            for soln in rpn_solution_counts
+            if soln not in tree_solution_set
+        ],
     }
 
-    for soln in tree_solutions:
-        n_rpn = rpn_solution_counts[soln]
-        if n_rpn == 0:
-            comparison["tree_not_rpn"].append(soln)
 
-    for soln in rpn_solution_counts:
-        if soln not in tree_solutions:
-            comparison["rpn_not_tree"].append(soln)
+async def compare_solvers_async(
+    target,
+    cards,
+    tree_solver="./tree-solve",
+    rpn_solver="./rpn-solve",
+    canonicalizer=None,
+    solver_seconds=None,
+    binary=False,
+):
+    """As `compare_solvers()`, running both solvers at once
+
+    The solvers must be executables, run with `binary` as for
+    `all_solutions_from_cmd_async()`.  Each solver's time is from its start to the end of its output, so
+    overlaps the other's.
+    """
+
+    async def timed_solutions(cmd, solver_name):
+        t0 = time.perf_counter()
+        trees = await all_solutions_from_cmd_async(cmd, target, cards, binary)
+        if solver_seconds is not None:
+            solver_seconds[solver_name] += time.perf_counter() - t0
+        return trees
+
+    tree_trees, rpn_trees = await asyncio.gather(
+        timed_solutions(tree_solver, "tree"),
+        timed_solutions(rpn_solver, "rpn"),
+    )
+    return compare_solutions_of(
+        target, cards, tree_trees, rpn_trees, canonicalizer
+    )
+
+
+async def compare_games_async(
+    games,
+    tree_solver="./tree-solve",
+    rpn_solver="./rpn-solve",
+    max_n_games_in_flight=4,
+    canonicalizer=None,
+    solver_seconds=None,
+    binary=False,
+):
+    """Comparisons, in order, of the solvers on each of the `(target,
+    cards)` games, with up to `max_n_games_in_flight` games being solved
+    at once"""
+    if canonicalizer is None:
+        canonicalizer = Canonicalizer()
+    semaphore = asyncio.Semaphore(max_n_games_in_flight)
+
+    async def compare_game(target, cards):
+        async with semaphore:
+            return await compare_solvers_async(
+                target,
+                cards,
+                tree_solver,
+                rpn_solver,
+                canonicalizer,
+                solver_seconds,
+                binary,
+            )
+
+    return await asyncio.gather(
+        *(compare_game(target, cards) for target, cards in games)
+    )
+
+
+def iter_solutions(solver, target, cards):
+    """Each solution from `solver`, as `all_solutions_from_solver()`
+    would give them, but, if `solver` is an executable, decoding each
+    as it is read from its `--binary` output
+
+    Any other solver's solutions are all got first, so are not streamed.
+    Raise RuntimeError if the executable's output ends early, and
+    subprocess.CalledProcessError if it fails.
+    """
+    if not isinstance(solver, str):
+        yield from solver.all_solutions(target, cards)
+        return
 
-    return comparison
+    args = [solver, "--binary"] + [str(n) for n in [target] + cards]
+    with subprocess.Popen(args, stdout=subprocess.PIPE) as proc:
+        while True:
+            n_opcodes_byte = proc.stdout.read(1)
+            if not n_opcodes_byte:
+                raise RuntimeError(f"{solver} output ended without a zero byte")
+            n_opcodes = n_opcodes_byte[0]
+            if n_opcodes == 0:
+                break
+            opcodes = proc.stdout.read(3 * n_opcodes)
+            if len(opcodes) != 3 * n_opcodes:
+                raise RuntimeError(f"{solver} output ended within a solution")
+            yield tree_from_opcodes(opcodes, cards)
+
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, args)
+
+
+def _canonical_terms(node):
+    """Kind and canonical terms `(inverted, digest)` of the node, or,
+    for a value, kind 0 and its digest; see `canonical_digest()`"""
+    if node.is_leaf:
+        return 0, hashlib.blake2b(
+            b"V%d" % node.value, digest_size=Digest_Size
+        ).digest()
+
+    kind = 2 if node.is_addition else 1
+    terms = []
+    for op, child in zip(node.ops, node.children):
+        inverted = int(op not in "+*")
+        child_kind, child_terms = _canonical_terms(child)
+        if child_kind == kind:
+            terms.extend(
+                (inverted ^ term_inverted, term_digest)
+                for term_inverted, term_digest in child_terms
+            )
+        else:
+            terms.append((inverted, _digest_of_terms(child_kind, child_terms)))
+    terms.sort()
+    return kind, terms
+
+
+def _digest_of_terms(kind, terms):
+    if kind == 0:
+        return terms
+    h = hashlib.blake2b(bytes([kind]), digest_size=Digest_Size)
+    for inverted, digest in terms:
+        h.update(bytes([inverted]))
+        h.update(digest)
+    return h.digest()
+
+
+Digest_Size = 16
+
+
+def canonical_digest(node):
+    """Fixed-size digest of the canonical form of the tree
+
+    Like the ids from a `Canonicalizer`, two trees have the same digest
+    exactly when they have the same canonical key (barring a hash
+    collision), but no state is kept between trees.
+    """
+    return _digest_of_terms(*_canonical_terms(node))
+
+
+def compare_solvers_streaming(
+    target, cards, tree_solver="./tree-solve", rpn_solver="./rpn-solve"
+):
+    """Compare the solvers' solutions of the game, in memory bounded by
+    the number of distinct solutions rather than the number of solutions
+
+    Each solution is reduced to its canonical digest as it is read, and
+    only the count of each digest is kept.  "tree" and "rpn" are these
+    counts.  For the (normally no) solutions found by only one solver,
+    that solver is run again to recover one tree for each, given by its
+    key, as `Node.key()`, as from `compare_solvers()`.
+    """
+
+    def digest_counts(solver):
+        return Counter(
+            canonical_digest(tree)
+            for tree in iter_solutions(solver, target, cards)
+        )
+
+    def keys_of_digests(solver, digests):
+        keys = {}
+        for tree in iter_solutions(solver, target, cards):
+            digest = canonical_digest(tree)
+            if digest in digests and digest not in keys:
+                keys[digest] = (
+                    tree.absorbing_like_children().in_canonical_order().key()
+                )
+        return list(keys.values())
+
+    tree_counts = digest_counts(tree_solver)
+    rpn_counts = digest_counts(rpn_solver)
+
+    tree_only = set(tree_counts) - set(rpn_counts)
+    rpn_only = set(rpn_counts) - set(tree_counts)
+
+    return {
+        "target": target,
+        "cards": cards,
+        "tree": tree_counts,
+        "rpn": rpn_counts,
+        "tree_not_rpn": (
+            keys_of_digests(tree_solver, tree_only) if tree_only else []
+        ),
+        "rpn_not_tree": (
+            keys_of_digests(rpn_solver, rpn_only) if rpn_only else []
+        ),
+    }
+
+
+def compare_rpn_memo(
+    target, cards, rpn_solver="./rpn-solve", memo_mb=None, canonicalizer=None
+):
+    """Compare the solutions of the game from `rpn_solver` with and
+    without `--memo`, and with `--memo-mb memo_mb` if given
+
+    The memoized search only skips states with no solutions, so should
+    give the same output.  "plain" and "memo" are the canonical ids of
+    each run's solutions, as from `compare_solvers()`, and
+    "plain_seconds" and "memo_seconds" the time each run took.
+    """
+    if canonicalizer is None:
+        canonicalizer = Canonicalizer()
+
+    card_args = [str(n) for n in [target] + cards]
+    memo_args = ["--memo"]
+    if memo_mb is not None:
+        memo_args += ["--memo-mb", str(memo_mb)]
+
+    result = {"target": target, "cards": cards}
+    for run_name, run_args in [("plain", []), ("memo", memo_args)]:
+        t0 = time.perf_counter()
+        cmd_result = subprocess.run(
+            [rpn_solver, "--binary"] + run_args + card_args,
+            capture_output=True,
+            check=True,
+        )
+        result[f"{run_name}_seconds"] = time.perf_counter() - t0
+        result[run_name] = [
+            canonicalizer.canonical_id(tree)
+            for tree in trees_from_binary(cmd_result.stdout, cards)
+        ]
+    return result
 
 
 All_Cards = [25, 50, 75, 100] + list(range(1, 11))
@@ -207,45 +712,414 @@ def cli():
     pass
 
 
-@cli.command(name="compare")
-def compare_solutions():
-    n_done = 0
-    while True:
-        if n_done % 100 == 0:
-            print(n_done)
-        target = random.randint(100, 999)
-        cards = random.choices(All_Cards, k=6)
-        cmp = compare_solvers(target, cards)
-        if cmp["tree_not_rpn"] or cmp["rpn_not_tree"]:
-            print(cmp)
-        n_done += 1
+def random_game(rnd):
+    return rnd.randint(100, 999), rnd.choices(All_Cards, k=6)
 
 
-@cli.command(name="find-rpn-dups")
-def find_rpn_dups():
-    max_n_rpn = 0
-    while True:
-        target = random.randint(100, 999)
-        cards = random.choices(All_Cards, k=6)
+@dataclass
+class CampaignState:
+    """Progress of a campaign of comparisons of random games
+
+    The games are made in batches, each from its own random-number
+    generator seeded from the campaign's seed and the batch's index, so
+    the games, and so the findings, depend only on the seed, however
+    many workers run the batches.
+    """
+
+    kind: str
+    seed: int
+    batch_size: int
+    n_batches_done: int = 0
+    n_games_done: int = 0
+    solver_seconds: Dict[str, float] = field(default_factory=dict)
+    findings: List[dict] = field(default_factory=list)
+
+    def batch_rng(self, batch_idx):
+        return random.Random(f"{self.seed}:{batch_idx}")
+
+    def record(self, batch_result):
+        self.n_batches_done += 1
+        self.n_games_done += batch_result["n_games"]
+        for solver, seconds in batch_result["solver_seconds"].items():
+            self.solver_seconds[solver] = (
+                self.solver_seconds.get(solver, 0.0) + seconds
+            )
+
+    def save(self, path):
+        # Write then rename, so that a checkpoint is never half-written.
+        path = Path(path)
+        partial_path = path.with_name(path.name + ".partial")
+        partial_path.write_text(json.dumps(asdict(self), indent=1))
+        partial_path.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        return cls(**json.loads(Path(path).read_text()))
+
+
+def solvers(in_process=False, cache_path=None, cache_max_bytes=None):
+    """The tree and RPN solvers, as `compare_solvers()` takes them,
+    made once per process for each choice of arguments
+
+    The tree solver runs in this process if `in_process`; otherwise,
+    if there is a `cache_path`, the solvers' solutions are cached.
+    The process id is part of the key, so a worker process forked from
+    one which already has solvers makes its own, rather than sharing
+    the parent's cache connection, which SQLite does not allow.
+    """
+    key = (os.getpid(), in_process, cache_path, cache_max_bytes)
+    if key not in _solvers:
+        tree_solver, rpn_solver = "./tree-solve", "./rpn-solve"
+        if cache_path is not None:
+            import solution_cache
+            cache = solution_cache.SolutionCache(cache_path, cache_max_bytes)
+            tree_solver = solution_cache.CachedSolver(cache, tree_solver)
+            rpn_solver = solution_cache.CachedSolver(cache, rpn_solver)
+        if in_process:
+            import inprocess_solver
+            tree_solver = inprocess_solver.InProcessSolver()
+        _solvers[key] = (tree_solver, rpn_solver)
+    return _solvers[key]
+
+
+_solvers = {}
+
+
+def compare_batch(
+    state,
+    batch_idx,
+    in_process=False,
+    n_in_flight=1,
+    streaming=False,
+    **cache_kwargs,
+):
+    """Compare the solvers on one batch of games, finding those where
+    they disagree
+
+    If `n_in_flight` is more than one, both solvers are run at once, for
+    up to that many games at a time.  Otherwise, `in_process` and
+    `cache_kwargs` are as for `solvers()`, and if `streaming`, games are
+    compared with `compare_solvers_streaming()`, which does not time
+    the solvers.
+    """
+    rnd = state.batch_rng(batch_idx)
+    games = [random_game(rnd) for _ in range(state.batch_size)]
+    canonicalizer = Canonicalizer()
+    solver_seconds = Counter()
+
+    tree_solver, rpn_solver = solvers(in_process, **cache_kwargs)
+    if n_in_flight > 1:
+        cmps = asyncio.run(compare_games_async(
+            games,
+            tree_solver,
+            rpn_solver,
+            n_in_flight,
+            canonicalizer,
+            solver_seconds,
+        ))
+    elif streaming:
+        cmps = [
+            compare_solvers_streaming(target, cards, tree_solver, rpn_solver)
+            for target, cards in games
+        ]
+    else:
+        cmps = [
+            compare_solvers(
+                target,
+                cards,
+                tree_solver,
+                rpn_solver,
+                canonicalizer,
+                solver_seconds,
+            )
+            for target, cards in games
+        ]
+
+    findings = [
+        {
+            "target": cmp["target"],
+            "cards": cmp["cards"],
+            "tree_not_rpn": cmp["tree_not_rpn"],
+            "rpn_not_tree": cmp["rpn_not_tree"],
+        }
+        for cmp in cmps
+        if cmp["tree_not_rpn"] or cmp["rpn_not_tree"]
+    ]
+    return {
+        "n_games": state.batch_size,
+        "solver_seconds": dict(solver_seconds),
+        "findings": findings,
+    }
+
+
+def rpn_dups_batch(state, batch_idx, **cache_kwargs):
+    """Find, in one batch of games with distinct cards and exactly one
+    tree solution, the first with the most RPN solutions"""
+    tree_solver, rpn_solver = solvers(**cache_kwargs)
+    rnd = state.batch_rng(batch_idx)
+    canonicalizer = Canonicalizer()
+    solver_seconds = Counter()
+    findings = []
+    for _ in range(state.batch_size):
+        target, cards = random_game(rnd)
         if len(set(cards)) < 6:
             continue
 
-        cmp = compare_solvers(target, cards)
+        cmp = compare_solvers(
+            target,
+            cards,
+            tree_solver,
+            rpn_solver,
+            canonicalizer,
+            solver_seconds,
+        )
         if len(cmp["tree"]) != 1:
             continue
 
         n_rpn = len(cmp["rpn"])
-        if n_rpn <= max_n_rpn:
-            continue
+        if not findings or n_rpn > findings[0]["n_rpn"]:
+            findings = [{"target": target, "cards": cards, "n_rpn": n_rpn}]
+    return {
+        "n_games": state.batch_size,
+        "solver_seconds": dict(solver_seconds),
+        "findings": findings,
+    }
+
+
+def run_campaign(
+    state,
+    batch_fun,
+    n_jobs=1,
+    n_games=None,
+    checkpoint_path=None,
+    finding_fun=None,
+    report_fun=None,
+):
+    """Run batches of games until `n_games` (rounded up to a whole
+    number of batches) have been done, or for ever if None
+
+    Batches are run `n_jobs` at a time in worker processes, and their
+    results recorded in order, calling `finding_fun(state, finding)` for
+    each finding; it should append to `state.findings` any it wants to
+    keep.  After each round of batches, the state is saved to
+    `checkpoint_path`, if given, and `report_fun(state, rate)` is called
+    with the number of games per second done by this run.
+    """
+    n_games_at_start = state.n_games_done
+    t_start = time.perf_counter()
+
+    def n_batches_wanted():
+        n_batches = 4 * n_jobs
+        if n_games is not None:
+            n_games_left = n_games - state.n_games_done
+            n_batches = min(n_batches, -(-n_games_left // state.batch_size))
+        return n_batches
+
+    with ProcessPoolExecutor(n_jobs) if n_jobs > 1 else nullcontext() as pool:
+        map_fun = map if pool is None else pool.map
+        while (n_batches := n_batches_wanted()) > 0:
+            batch_idxs = range(
+                state.n_batches_done, state.n_batches_done + n_batches
+            )
+            results = map_fun(
+                batch_fun, [state] * n_batches, batch_idxs
+            )
+            for result in results:
+                state.record(result)
+                for finding in result["findings"]:
+                    if finding_fun is not None:
+                        finding_fun(state, finding)
+                    else:
+                        state.findings.append(finding)
+
+            if checkpoint_path is not None:
+                state.save(checkpoint_path)
+            if report_fun is not None:
+                elapsed = time.perf_counter() - t_start
+                rate = (state.n_games_done - n_games_at_start) / elapsed
+                report_fun(state, rate)
 
-        max_n_rpn = n_rpn
 
-        # A bit wasteful to re-do these but never mind:
+def campaign_state(kind, seed, batch_size, checkpoint_path):
+    """State resumed from the checkpoint, if it exists, or a new one"""
+    if checkpoint_path is not None and Path(checkpoint_path).exists():
+        state = CampaignState.load(checkpoint_path)
+        if state.kind != kind:
+            raise click.ClickException(
+                f"checkpoint {checkpoint_path} is for {state.kind}"
+            )
+        if seed is not None and seed != state.seed:
+            raise click.ClickException(
+                f"checkpoint {checkpoint_path} has seed {state.seed}"
+            )
+        if batch_size != state.batch_size:
+            raise click.ClickException(
+                f"checkpoint {checkpoint_path} has batch size {state.batch_size}"
+            )
+        print(f"resuming after {state.n_games_done} games, seed {state.seed}")
+        return state
+
+    if seed is None:
+        seed = random.SystemRandom().randrange(1 << 32)
+    print(f"seed {seed}")
+    return CampaignState(kind, seed, batch_size)
+
+
+def report_progress(state, rate):
+    per_solver = ", ".join(
+        f"{solver} {state.n_games_done / seconds:.1f}"
+        for solver, seconds in sorted(state.solver_seconds.items())
+        if seconds > 0.0
+    )
+    per_worker = f" (per worker: {per_solver} games/s)" if per_solver else ""
+    print(
+        f"{state.n_games_done} games; {rate:.1f} games/s{per_worker}",
+        flush=True,
+    )
+
+
+def cache_options(fun):
+    options = [
+        click.option(
+            "--cache",
+            type=click.Path(dir_okay=False),
+            help="file of cached solutions, to use and add to",
+        ),
+        click.option(
+            "--cache-max-mb",
+            type=int,
+            default=256,
+            help="size above which least recently used solutions are evicted",
+        ),
+    ]
+    for option in reversed(options):
+        fun = option(fun)
+    return fun
+
+
+def campaign_options(fun):
+    options = [
+        click.option(
+            "--jobs", type=click.IntRange(min=1), default=1, help="number of worker processes"
+        ),
+        click.option(
+            "--seed",
+            type=int,
+            help="seed for the random games (default: chosen at random)",
+        ),
+        click.option(
+            "--n-games",
+            type=int,
+            help="stop after this many games (default: never)",
+        ),
+        click.option(
+            "--batch-size", type=click.IntRange(min=1), default=100, help="games per batch"
+        ),
+        click.option(
+            "--checkpoint",
+            type=click.Path(dir_okay=False),
+            help="file to save progress to, and resume from",
+        ),
+    ]
+    for option in reversed(options):
+        fun = option(fun)
+    return fun
+
+
+@cli.command(name="compare")
+@campaign_options
+@cache_options
+@click.option(
+    "--in-process",
+    is_flag=True,
+    help="run the tree solver in this process, from libcountdown-solver.so",
+)
+@click.option(
+    "--in-flight",
+    type=click.IntRange(min=1),
+    default=1,
+    help="if more than 1, run both solvers at once, for this many games"
+    " at a time in each worker",
+)
+@click.option(
+    "--streaming",
+    is_flag=True,
+    help="compare digests of solutions as they are read, in bounded memory",
+)
+def compare_solutions(
+    jobs,
+    seed,
+    n_games,
+    batch_size,
+    checkpoint,
+    cache,
+    cache_max_mb,
+    in_process,
+    in_flight,
+    streaming,
+):
+    if in_flight > 1 and (in_process or cache is not None or streaming):
+        raise click.UsageError(
+            "--in-process, --cache and --streaming cannot be used"
+            " with --in-flight"
+        )
+    # Solutions from the library or the cache are all got at once, so
+    # would not be streamed.
+    if streaming and (in_process or cache is not None):
+        raise click.UsageError(
+            "--in-process and --cache cannot be used with --streaming"
+        )
+    state = campaign_state("compare", seed, batch_size, checkpoint)
+
+    def print_finding(state, finding):
+        print(finding)
+        state.findings.append(finding)
+
+    run_campaign(
+        state,
+        partial(
+            compare_batch,
+            in_process=in_process,
+            n_in_flight=in_flight,
+            streaming=streaming,
+            cache_path=cache,
+            cache_max_bytes=cache_max_mb << 20,
+        ),
+        jobs,
+        n_games,
+        checkpoint,
+        print_finding,
+        report_progress,
+    )
+
+
+@cli.command(name="find-rpn-dups")
+@campaign_options
+@cache_options
+def find_rpn_dups(
+    jobs, seed, n_games, batch_size, checkpoint, cache, cache_max_mb
+):
+    state = campaign_state("find-rpn-dups", seed, batch_size, checkpoint)
+    cache_kwargs = {"cache_path": cache, "cache_max_bytes": cache_max_mb << 20}
+
+    def print_if_record(state, finding):
+        max_n_rpn = max((f["n_rpn"] for f in state.findings), default=0)
+        if finding["n_rpn"] <= max_n_rpn:
+            return
+        state.findings.append(finding)
+
+        target, cards = finding["target"], finding["cards"]
+        n_rpn = finding["n_rpn"]
+
+        # A bit wasteful to re-do these, unless cached, but never mind.
+        # The solvers are only made now, so that the worker processes,
+        # which already exist, do not inherit them.
+        tree_solver, rpn_solver = solvers(**cache_kwargs)
 
         print(f"\n{cards}: {target} --- {n_rpn}")
 
         tree_solns = pprint_all_solutions(
-            "./tree-solve",
+            tree_solver,
             target,
             cards,
             "tree"
@@ -253,16 +1127,26 @@ def find_rpn_dups():
         assert len(tree_solns) == 1
 
         rpn_solns = pprint_all_solutions(
-            "./rpn-solve",
+            rpn_solver,
             target,
             cards,
             " rpn"
         )
         assert len(rpn_solns) == n_rpn
 
+    run_campaign(
+        state,
+        partial(rpn_dups_batch, **cache_kwargs),
+        jobs,
+        n_games,
+        checkpoint,
+        print_if_record,
+        report_progress,
+    )
+
 
-def pprint_all_solutions(cmd, target, cards, output_tag):
-    solns = all_solutions_from_cmd(cmd, target, list(cards))
+def pprint_all_solutions(solver, target, cards, output_tag):
+    solns = all_solutions_from_solver(solver, target, list(cards))
     for soln in solns:
         print(f"  {output_tag}: {soln.pprint_toplevel()}")
     return solns
@@ -275,14 +1159,90 @@ def pprint_all_solutions(cmd, target, cards, output_tag):
     default="both",
     help="which solver to run",
 )
-@click.option("--target", required=True, metavar="TARGET")
+@click.option("--target", type=int, required=True, metavar="TARGET")
 @click.option("--cards", nargs=6, type=int, metavar="CARDS")
-def show_solutions(solver, target, cards):
+@cache_options
+def show_solutions(solver, target, cards, cache, cache_max_mb):
+    tree_solver, rpn_solver = solvers(
+        cache_path=cache, cache_max_bytes=cache_max_mb << 20
+    )
     print(f"\n{cards}: {target}\n")
     if solver in ["tree", "both"]:
-        pprint_all_solutions("./tree-solve", target, cards, "tree")
+        pprint_all_solutions(tree_solver, target, cards, "tree")
     if solver in ["rpn", "both"]:
-        pprint_all_solutions("./rpn-solve", target, cards, " rpn")
+        pprint_all_solutions(rpn_solver, target, cards, " rpn")
+
+
+@cli.command(name="bench-decode")
+@click.option("--n-games", type=int, default=100, help="number of random games")
+@click.option("--seed", type=int, default=42, help="random seed for the games")
+def bench_decode(n_games, seed):
+    """Compare the time taken to decode text and binary solver output
+
+    Each solver is run beforehand, so only decoding is timed.
+    """
+    rnd = random.Random(seed)
+    games = [
+        (rnd.randint(100, 999), rnd.choices(All_Cards, k=6))
+        for _ in range(n_games)
+    ]
+    for cmd in ["./tree-solve", "./rpn-solve"]:
+        outputs = []
+        for target, cards in games:
+            args = [cmd] + [str(n) for n in [target] + cards]
+            text = subprocess.run(args, capture_output=True, encoding="utf-8")
+            args.insert(1, "--binary")
+            binary = subprocess.run(args, capture_output=True)
+            outputs.append((cards, text.stdout, binary.stdout))
+
+        t0 = time.perf_counter()
+        text_trees = [
+            [tree_from_string(line) for line in text.splitlines()]
+            for _, text, _ in outputs
+        ]
+        t1 = time.perf_counter()
+        binary_trees = [
+            trees_from_binary(binary, cards)
+            for cards, _, binary in outputs
+        ]
+        t2 = time.perf_counter()
+
+        assert binary_trees == text_trees
+        n_solutions = sum(len(trees) for trees in text_trees)
+        print(
+            f"{cmd}: {n_solutions} solutions;"
+            f" text {t1 - t0:.3f}s, binary {t2 - t1:.3f}s"
+        )
+
+
+@cli.command(name="check-rpn-memo")
+@click.option("--n-games", type=int, default=100, help="number of random games")
+@click.option("--seed", type=int, default=42, help="random seed for the games")
+@click.option(
+    "--memo-mb", type=int, help="megabytes for rpn-solve's memo table"
+)
+def check_rpn_memo(n_games, seed, memo_mb):
+    """Check that `rpn-solve --memo` finds the same solutions as the
+    plain search, and compare the time each takes
+    """
+    rnd = random.Random(seed)
+    canonicalizer = Canonicalizer()
+    seconds = Counter()
+    n_mismatches = 0
+    for _ in range(n_games):
+        target, cards = random_game(rnd)
+        result = compare_rpn_memo(
+            target, cards, memo_mb=memo_mb, canonicalizer=canonicalizer
+        )
+        seconds["plain"] += result["plain_seconds"]
+        seconds["memo"] += result["memo_seconds"]
+        if Counter(result["plain"]) != Counter(result["memo"]):
+            n_mismatches += 1
+            print(f"mismatch: {target} {cards}")
+    print(
+        f"{n_games} games, {n_mismatches} mismatches;"
+        f" plain {seconds['plain']:.3f}s, memo {seconds['memo']:.3f}s"
+    )
 
 
 if __name__ == "__main__":
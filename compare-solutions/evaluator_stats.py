@@ -0,0 +1,153 @@
+# Copyright 2022 Ben North
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+"""Counts of the tree solver's evaluator work
+
+A tree solver built with `EVALUATOR_STATS` (`evaluator-cli-stats`) and
+run with `--stats` writes to stderr, after each game, a line of JSON
+with the game, the seconds taken to solve it, and how many programs
+were run, opcodes executed, and masks (choices of non-inverted inputs
+to an operation) tried, pruned because an operand was invalid, or
+pruned because the operation was invalid.  These are loaded here as
+one dict per game, and summed over games.
+"""
+
+import json
+import random
+import subprocess
+import click
+
+import compare_solutions as cs
+
+
+Count_Names = (
+    "n_programs",
+    "n_opcodes_executed",
+    "n_masks_tried",
+    "n_masks_operand_invalid",
+    "n_masks_operation_invalid",
+    "n_evaluations",
+)
+
+
+def stats_from_lines(lines):
+    """Per-game stats from the lines a solver wrote to stderr, ignoring
+    any which are not JSON objects"""
+    return [
+        json.loads(line)
+        for line in lines
+        if line.startswith("{")
+    ]
+
+
+def stats_from_cmd(cmd, games):
+    """Per-game stats for each of the `(target, cards)` games, from one
+    run of `cmd --batch --stats`"""
+    cmd_input = "".join(
+        " ".join(str(n) for n in [target] + cards) + "\n"
+        for target, cards in games
+    )
+    cmd_result = subprocess.run(
+        [cmd, "--batch", "--stats"],
+        input=cmd_input,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        encoding="utf-8",
+        check=True,
+    )
+    return stats_from_lines(cmd_result.stderr.splitlines())
+
+
+def aggregate_stats(game_stats):
+    """Number of games, and the total seconds and counts over them,
+    with the fraction of masks tried which each kind of pruning
+    removed"""
+    totals = {"n_games": len(game_stats)}
+    for name in ("seconds",) + Count_Names:
+        totals[name] = sum(stats[name] for stats in game_stats)
+
+    n_masks_tried = totals["n_masks_tried"]
+    for kind in ["operand", "operation"]:
+        n_pruned = totals[f"n_masks_{kind}_invalid"]
+        totals[f"fraction_{kind}_invalid"] = (
+            n_pruned / n_masks_tried if n_masks_tried else 0.0
+        )
+    return totals
+
+
+def summary_lines(totals):
+    n_games = totals["n_games"]
+    lines = [f"{n_games} games in {totals['seconds']:.3f}s"]
+    if n_games:
+        lines.extend(
+            f"{name:>26}: {totals[name] / n_games:14.1f} per game"
+            for name in Count_Names
+        )
+    lines.extend(
+        f"{kind + ' invalid':>26}: {totals[f'fraction_{kind}_invalid']:14.1%}"
+        " of masks tried"
+        for kind in ["operand", "operation"]
+    )
+    return lines
+
+
+def read_stats_files(paths):
+    game_stats = []
+    for path in paths:
+        with open(path, "rt") as f_in:
+            game_stats.extend(stats_from_lines(f_in))
+    return game_stats
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command(name="run")
+@click.option(
+    "--solver", default="./tree-solve-stats", show_default=True,
+    help="tree solver built with EVALUATOR_STATS",
+)
+@click.option("--n-games", type=int, default=100, help="number of random games")
+@click.option("--seed", type=int, default=42, help="random seed for the games")
+@click.option(
+    "--output", type=click.File("wt"),
+    help="also write the per-game stats, as JSON lines, to this file",
+)
+def run_stats(solver, n_games, seed, output):
+    """Solve random games, and summarize the evaluator's counts"""
+    rnd = random.Random(seed)
+    games = [cs.random_game(rnd) for _ in range(n_games)]
+    game_stats = stats_from_cmd(solver, games)
+    if output is not None:
+        for stats in game_stats:
+            output.write(json.dumps(stats) + "\n")
+    for line in summary_lines(aggregate_stats(game_stats)):
+        print(line)
+
+
+@cli.command(name="summarize")
+@click.argument(
+    "stats_files", nargs=-1, required=True, type=click.Path(exists=True)
+)
+def summarize_stats(stats_files):
+    """Summarize per-game stats saved from earlier runs"""
+    for line in summary_lines(aggregate_stats(read_stats_files(stats_files))):
+        print(line)
+
+
+if __name__ == "__main__":
+    cli()
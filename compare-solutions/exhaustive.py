@@ -0,0 +1,301 @@
+# Copyright 2022 Ben North
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+"""Exhaustive comparison of the solvers over every game
+
+Every game is a set of cards, as enumerated by
+`solution_db.all_card_sets()`, with a target.  The sets of cards are
+split, in their (stable) enumeration order, into N contiguous shards,
+which can be swept independently, on different machines.  A shard's
+results are written as JSON lines: a header, then one line per set of
+cards, with the number of solutions from each solver for every target,
+and the details of any targets where the solvers disagree.  Each line
+is flushed as it is written, so an interrupted sweep resumes from the
+first set of cards without a complete line.  The `merge` command
+checks that shards' results cover every game, and aggregates them.
+"""
+
+from pathlib import Path
+import json
+import click
+
+import compare_solutions as cs
+import solution_db as sdb
+
+
+def shard_bounds(n_items, shard_idx, n_shards):
+    "Start and end indexes of the `shard_idx`'th of `n_shards` shards"
+    return (
+        shard_idx * n_items // n_shards,
+        (shard_idx + 1) * n_items // n_shards,
+    )
+
+
+def sweep_card_set(cards, min_target, max_target, canonicalizer=None):
+    """Comparison of the solvers on every target for these cards
+
+    The tree solver solves all targets in one batch; the RPN solver is
+    run for each target.
+    """
+    cards = list(cards)
+    targets = range(min_target, max_target + 1)
+    all_tree_trees = cs.all_solutions_from_cmd_batch(
+        "./tree-solve", [(target, cards) for target in targets]
+    )
+
+    result = {"cards": cards, "n_tree": [], "n_rpn": [], "discrepancies": []}
+    for target, tree_trees in zip(targets, all_tree_trees):
+        rpn_trees = cs.all_solutions_from_cmd(
+            "./rpn-solve", target, cards, binary=True
+        )
+        cmp = cs.compare_solutions_of(
+            target, cards, tree_trees, rpn_trees, canonicalizer
+        )
+        result["n_tree"].append(len(cmp["tree"]))
+        result["n_rpn"].append(len(cmp["rpn"]))
+        if cmp["tree_not_rpn"] or cmp["rpn_not_tree"]:
+            result["discrepancies"].append({
+                "target": target,
+                "tree_not_rpn": cmp["tree_not_rpn"],
+                "rpn_not_tree": cmp["rpn_not_tree"],
+            })
+    return result
+
+
+def shard_file_path(output_dir, shard_idx, n_shards):
+    return Path(output_dir) / f"shard-{shard_idx:05d}-of-{n_shards:05d}.jsonl"
+
+
+def read_shard_file(path):
+    """Header and results of a shard file, ignoring any incomplete
+    last line"""
+    with open(path, "rb") as f_in:
+        lines = f_in.read().split(b"\n")
+    # The last element is either empty or an incomplete line.
+    complete_lines = lines[:-1]
+    if not complete_lines:
+        return None, []
+    return (
+        json.loads(complete_lines[0]),
+        [json.loads(line) for line in complete_lines[1:]],
+    )
+
+
+def sweep_shard(
+    output_dir,
+    shard_idx,
+    n_shards,
+    n_cards=6,
+    min_target=100,
+    max_target=999,
+    report_fun=None,
+):
+    """Sweep one shard, resuming from the results already in its file
+
+    Return the number of sets of cards swept by this call.
+    """
+    header = {
+        "shard_idx": shard_idx,
+        "n_shards": n_shards,
+        "n_cards": n_cards,
+        "min_target": min_target,
+        "max_target": max_target,
+    }
+    card_sets = sdb.all_card_sets(n_cards)
+    start, end = shard_bounds(len(card_sets), shard_idx, n_shards)
+
+    path = shard_file_path(output_dir, shard_idx, n_shards)
+    n_done = 0
+    if path.exists():
+        got_header, results = read_shard_file(path)
+        if got_header is not None:
+            if got_header != header:
+                raise click.ClickException(
+                    f"{path} is for a different sweep: {got_header}"
+                )
+            n_done = len(results)
+
+    # Rewrite the complete lines, dropping any incomplete last line.
+    with open(path, "rb+" if path.exists() else "wb") as f_out:
+        if n_done == 0:
+            f_out.truncate(0)
+            f_out.write(json.dumps(header).encode() + b"\n")
+        else:
+            content = f_out.read()
+            f_out.seek(content.rindex(b"\n") + 1)
+            f_out.truncate()
+        f_out.flush()
+
+        canonicalizer = cs.Canonicalizer()
+        for card_set_idx in range(start + n_done, end):
+            cards = card_sets[card_set_idx]
+            result = sweep_card_set(cards, min_target, max_target, canonicalizer)
+            f_out.write(json.dumps(result, separators=(",", ":")).encode())
+            f_out.write(b"\n")
+            f_out.flush()
+            if report_fun is not None:
+                report_fun(card_set_idx - start + 1, end - start, result)
+
+            # Bound the memory used for interning.
+            if len(canonicalizer.forms) > 1_000_000:
+                canonicalizer = cs.Canonicalizer()
+
+    return end - start - n_done
+
+
+def merge_shards(paths):
+    """Statistics over the results in all the given shard files, which
+    must together cover every game exactly once"""
+    headers = []
+    all_results = []
+    for path in paths:
+        header, results = read_shard_file(path)
+        if header is None:
+            raise click.ClickException(f"{path} has no header")
+        headers.append(header)
+        all_results.append((header, results))
+
+    sweep_keys = ["n_shards", "n_cards", "min_target", "max_target"]
+    sweep = {k: headers[0][k] for k in sweep_keys}
+    if any({k: h[k] for k in sweep_keys} != sweep for h in headers):
+        raise click.ClickException("shards are from different sweeps")
+
+    card_sets = sdb.all_card_sets(sweep["n_cards"])
+    shard_idxs = sorted(h["shard_idx"] for h in headers)
+    if shard_idxs != list(range(sweep["n_shards"])):
+        raise click.ClickException(
+            f"need each of the {sweep['n_shards']} shards exactly once"
+        )
+
+    stats = {
+        **sweep,
+        "n_card_sets": 0,
+        "n_games": 0,
+        "n_solvable_games": 0,
+        "n_tree_solutions": 0,
+        "n_rpn_solutions": 0,
+        "max_n_tree_solutions": None,
+        "max_n_rpn_solutions": None,
+        "n_discrepancies": 0,
+        "discrepancies": [],
+    }
+
+    def update_max(stat_name, n_solutions, cards, target):
+        best = stats[stat_name]
+        if best is None or n_solutions > best["n_solutions"]:
+            stats[stat_name] = {
+                "n_solutions": n_solutions, "target": target, "cards": cards,
+            }
+
+    for header, results in all_results:
+        start, end = shard_bounds(
+            len(card_sets), header["shard_idx"], sweep["n_shards"]
+        )
+        if len(results) != end - start:
+            raise click.ClickException(
+                f"shard {header['shard_idx']} is incomplete:"
+                f" {len(results)} of {end - start} sets of cards"
+            )
+        for card_set_idx, result in zip(range(start, end), results):
+            cards = result["cards"]
+            if tuple(cards) != card_sets[card_set_idx]:
+                raise click.ClickException(
+                    f"shard {header['shard_idx']} has unexpected cards {cards}"
+                )
+            stats["n_card_sets"] += 1
+            stats["n_games"] += len(result["n_tree"])
+            stats["n_solvable_games"] += sum(n > 0 for n in result["n_tree"])
+            stats["n_tree_solutions"] += sum(result["n_tree"])
+            stats["n_rpn_solutions"] += sum(result["n_rpn"])
+            for target_idx, (n_tree, n_rpn) in enumerate(
+                    zip(result["n_tree"], result["n_rpn"])
+            ):
+                target = sweep["min_target"] + target_idx
+                update_max("max_n_tree_solutions", n_tree, cards, target)
+                update_max("max_n_rpn_solutions", n_rpn, cards, target)
+            for discrepancy in result["discrepancies"]:
+                stats["n_discrepancies"] += 1
+                stats["discrepancies"].append({"cards": cards, **discrepancy})
+
+    return stats
+
+
+def parse_shard(ctx, param, value):
+    try:
+        shard_idx, n_shards = (int(x) for x in value.split("/"))
+    except ValueError:
+        raise click.BadParameter("must be I/N")
+    if not (0 <= shard_idx < n_shards):
+        raise click.BadParameter("need 0 <= I < N")
+    return shard_idx, n_shards
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command(name="sweep")
+@click.option(
+    "--shard",
+    default="0/1",
+    callback=parse_shard,
+    metavar="I/N",
+    help="sweep the I'th (counting from 0) of N shards (default 0/1)",
+)
+@click.option(
+    "--output-dir",
+    type=click.Path(file_okay=False),
+    default=".",
+    help="directory for the shard's results file",
+)
+@click.option("--n-cards", type=int, default=6)
+@click.option("--min-target", type=int, default=100)
+@click.option("--max-target", type=int, default=999)
+def sweep(shard, output_dir, n_cards, min_target, max_target):
+    """Compare the solvers on every game in one shard, resuming if the
+    shard's results file exists"""
+    shard_idx, n_shards = shard
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    def report(n_done, n_total, result):
+        n_discrepancies = len(result["discrepancies"])
+        print(
+            f"{n_done}/{n_total}: {result['cards']}:"
+            f" {n_discrepancies} discrepancies",
+            flush=True,
+        )
+
+    sweep_shard(
+        output_dir, shard_idx, n_shards, n_cards, min_target, max_target, report
+    )
+
+
+@cli.command(name="merge")
+@click.argument(
+    "shard_files", nargs=-1, required=True, type=click.Path(exists=True)
+)
+@click.option(
+    "--output", type=click.File("w"), default="-", help="file for the statistics"
+)
+def merge(shard_files, output):
+    "Check the shards cover every game, and print statistics as JSON"
+    stats = merge_shards(shard_files)
+    json.dump(stats, output, indent=1)
+    output.write("\n")
+
+
+if __name__ == "__main__":
+    cli()
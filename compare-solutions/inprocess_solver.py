@@ -0,0 +1,149 @@
+# Copyright 2022 Ben North
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+"""In-process access to the C++ evaluator, through ctypes
+
+`libcountdown-solver.so` (built by `evaluator/make.sh`) exposes the
+evaluator through a small C interface; see `solver_c_api.h`.  Solving
+a game this way avoids starting a `tree-solve` process and parsing its
+text output.  Calls into the library are made without holding the GIL
+(`ctypes.CDLL` releases it), so several Python threads can solve games
+at once.
+"""
+
+import ctypes
+
+import compare_solutions as cs
+
+
+class _Library:
+    def __init__(self, lib_path):
+        lib = ctypes.CDLL(lib_path)
+
+        def declare(name, restype, argtypes):
+            fun = getattr(lib, name)
+            fun.restype = restype
+            fun.argtypes = argtypes
+            return fun
+
+        p_solver = ctypes.c_void_p
+        p_solutions = ctypes.c_void_p
+        self.solver_new = declare(
+            "countdown_solver_new", p_solver, [ctypes.c_char_p]
+        )
+        self.solver_free = declare(
+            "countdown_solver_free", None, [p_solver]
+        )
+        self.solver_n_cards = declare(
+            "countdown_solver_n_cards", ctypes.c_int, [p_solver]
+        )
+        self.solve = declare(
+            "countdown_solve",
+            p_solutions,
+            [p_solver, ctypes.c_int, ctypes.POINTER(ctypes.c_int)],
+        )
+        self.solutions_n_solutions = declare(
+            "countdown_solutions_n_solutions", ctypes.c_size_t, [p_solutions]
+        )
+        self.solutions_data = declare(
+            "countdown_solutions_data", ctypes.c_void_p, [p_solutions]
+        )
+        self.solutions_nbytes = declare(
+            "countdown_solutions_nbytes", ctypes.c_size_t, [p_solutions]
+        )
+        self.solutions_free = declare(
+            "countdown_solutions_free", None, [p_solutions]
+        )
+        self.last_error = declare("countdown_last_error", ctypes.c_char_p, [])
+
+    def error(self):
+        return RuntimeError(self.last_error().decode("utf-8"))
+
+
+class _Solutions:
+    """Owner of the solutions of one game, as returned by the library,
+    freeing them when no longer referenced"""
+
+    def __init__(self, lib, handle):
+        self.lib = lib
+        self.handle = handle
+
+    def __del__(self):
+        self.lib.solutions_free(self.handle)
+
+    def opcodes(self):
+        nbytes = self.lib.solutions_nbytes(self.handle)
+        if nbytes == 0:
+            return memoryview(b"")
+        data = (ctypes.c_uint8 * nbytes).from_address(
+            self.lib.solutions_data(self.handle)
+        )
+        # The memoryview keeps `data` alive, which in turn keeps us
+        # alive, so the solutions are freed only once nothing can see
+        # them.
+        data.owner = self
+        return memoryview(data).cast("B")
+
+
+def split_solutions(opcodes):
+    """Each solution's opcodes, as a view into `opcodes`, which holds
+    three-byte opcodes with each solution ending with a Return"""
+    solutions = []
+    start = 0
+    for i in range(0, len(opcodes), 3):
+        if opcodes[i] == cs.Kind_Return:
+            solutions.append(opcodes[start : i + 3])
+            start = i + 3
+    return solutions
+
+
+class InProcessSolver:
+    """Solver running the C++ evaluator in this process
+
+    With no `programs_path`, the six-card programs compiled into the
+    library are used; otherwise, the given program file's.
+    """
+
+    def __init__(self, lib_path="./libcountdown-solver.so", programs_path=None):
+        self.lib = _Library(lib_path)
+        self.handle = self.lib.solver_new(
+            None if programs_path is None else str(programs_path).encode()
+        )
+        if self.handle is None:
+            raise self.lib.error()
+        self.n_cards = self.lib.solver_n_cards(self.handle)
+
+    def __del__(self):
+        if getattr(self, "handle", None) is not None:
+            self.lib.solver_free(self.handle)
+
+    def solve(self, target, cards):
+        """Concrete opcodes of all solutions of the game, as a read-only
+        memoryview onto the library's own buffer; see `split_solutions()`"""
+        if len(cards) != self.n_cards:
+            raise ValueError(f"need {self.n_cards} cards")
+        c_cards = (ctypes.c_int * self.n_cards)(*cards)
+        handle = self.lib.solve(self.handle, target, c_cards)
+        if handle is None:
+            raise self.lib.error()
+        return _Solutions(self.lib, handle).opcodes().toreadonly()
+
+    def all_solutions(self, target, cards):
+        """All solutions of the game as trees, as from
+        `compare_solutions.all_solutions_from_cmd()`"""
+        return [
+            cs.tree_from_opcodes(opcodes, cards)
+            for opcodes in split_solutions(self.solve(target, cards))
+        ]
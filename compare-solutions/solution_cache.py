@@ -0,0 +1,227 @@
+# Copyright 2022 Ben North
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+"""Persistent cache of solvers' solutions
+
+Solutions are cached on disk, in an SQLite database, keyed by the
+SHA-256 of the solver executable, the sorted cards, and the target, so
+a rebuilt solver does not see stale results.  Each entry is the
+solver's `--binary` output, for the sorted cards, compressed.  When the
+total size of the entries exceeds a limit, the least recently used
+entries are evicted.  SQLite's locking makes it safe for several
+processes (such as campaign workers) to share one cache.  Lookups only
+read, so do not wait for each other; an entry's time of last use is
+only updated, which needs the write lock, once it is more than
+`last_used_resolution` seconds old, so recency is only known to within
+that.
+
+Since the cards are sorted before solving, the solutions, and their
+order, are those for the sorted cards; their canonical forms are the
+same as for any other order.
+"""
+
+from pathlib import Path
+import hashlib
+import os
+import sqlite3
+import subprocess
+import time
+import zlib
+
+import compare_solutions as cs
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS solutions (
+    solver_hash TEXT NOT NULL,
+    cards TEXT NOT NULL,
+    target INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (solver_hash, cards, target)
+);
+CREATE INDEX IF NOT EXISTS solutions_by_last_used ON solutions (last_used);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    n_bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals VALUES (0, 0);
+"""
+
+
+class SolutionCache:
+    def __init__(self, path, max_bytes=256 << 20, last_used_resolution=60.0):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.last_used_resolution = last_used_resolution
+        self.solver_hashes = {}
+        self.n_hits = 0
+        self.n_misses = 0
+        self.connection = sqlite3.connect(
+            self.path, timeout=60.0, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.executescript(_schema)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _transaction(self):
+        return _Transaction(self.connection)
+
+    def solver_hash(self, cmd):
+        """SHA-256 of the solver's executable, computed again only if
+        its size or modification time change"""
+        stat = os.stat(cmd)
+        stat_key = (os.path.realpath(cmd), stat.st_size, stat.st_mtime_ns)
+        solver_hash = self.solver_hashes.get(stat_key)
+        if solver_hash is None:
+            solver_hash = hashlib.sha256(Path(cmd).read_bytes()).hexdigest()
+            self.solver_hashes[stat_key] = solver_hash
+        return solver_hash
+
+    @staticmethod
+    def _cards_key(sorted_cards):
+        return " ".join(str(c) for c in sorted_cards)
+
+    def get(self, cmd, target, sorted_cards):
+        "The cached output for the game, or None"
+        key = (self.solver_hash(cmd), self._cards_key(sorted_cards), target)
+        row = self.connection.execute(
+            "SELECT data, last_used FROM solutions"
+            " WHERE solver_hash = ? AND cards = ? AND target = ?",
+            key,
+        ).fetchone()
+        if row is None:
+            return None
+
+        data, last_used = row
+        now = time.time()
+        if now - last_used >= self.last_used_resolution:
+            with self._transaction():
+                self.connection.execute(
+                    "UPDATE solutions SET last_used = ?"
+                    " WHERE solver_hash = ? AND cards = ? AND target = ?",
+                    (now,) + key,
+                )
+        return zlib.decompress(data)
+
+    def put(self, cmd, target, sorted_cards, output):
+        "Cache the output for the game, evicting old entries if needed"
+        key = (self.solver_hash(cmd), self._cards_key(sorted_cards), target)
+        data = zlib.compress(output)
+        with self._transaction():
+            old_row = self.connection.execute(
+                "SELECT LENGTH(data) FROM solutions"
+                " WHERE solver_hash = ? AND cards = ? AND target = ?",
+                key,
+            ).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?, ?)",
+                key + (data, time.time()),
+            )
+            n_bytes_added = len(data) - (0 if old_row is None else old_row[0])
+            self.connection.execute(
+                "UPDATE totals SET n_bytes = n_bytes + ?", (n_bytes_added,)
+            )
+            self._evict()
+
+    def _evict(self):
+        (n_bytes,) = self.connection.execute(
+            "SELECT n_bytes FROM totals"
+        ).fetchone()
+        if n_bytes <= self.max_bytes:
+            return
+
+        # Evict down to well under the limit, so as not to evict on
+        # every put() once the cache is full.
+        n_bytes_to_free = n_bytes - (self.max_bytes * 9) // 10
+        rows = self.connection.execute(
+            "SELECT rowid, LENGTH(data) FROM solutions ORDER BY last_used"
+        )
+        evicted_rowids = []
+        n_bytes_freed = 0
+        for rowid, n_row_bytes in rows:
+            if n_bytes_freed >= n_bytes_to_free:
+                break
+            evicted_rowids.append((rowid,))
+            n_bytes_freed += n_row_bytes
+        rows.close()
+
+        self.connection.executemany(
+            "DELETE FROM solutions WHERE rowid = ?", evicted_rowids
+        )
+        self.connection.execute(
+            "UPDATE totals SET n_bytes = n_bytes - ?", (n_bytes_freed,)
+        )
+
+    def n_bytes(self):
+        return self.connection.execute(
+            "SELECT n_bytes FROM totals"
+        ).fetchone()[0]
+
+    def __len__(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM solutions"
+        ).fetchone()[0]
+
+    def binary_output(self, cmd, target, cards):
+        """The solver's `--binary` output for the game with its cards
+        sorted, from the cache if possible"""
+        sorted_cards = sorted(cards)
+        output = self.get(cmd, target, sorted_cards)
+        if output is not None:
+            self.n_hits += 1
+            return output
+
+        self.n_misses += 1
+        args = [cmd, "--binary"] + [str(n) for n in [target] + sorted_cards]
+        output = subprocess.run(args, capture_output=True, check=True).stdout
+        self.put(cmd, target, sorted_cards, output)
+        return output
+
+
+class _Transaction:
+    """Context manager for an immediate transaction, so that concurrent
+    writers wait for each other rather than failing to upgrade a read
+    lock"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+
+class CachedSolver:
+    """Solver executable whose solutions are kept in a SolutionCache;
+    can be used wherever `compare_solutions` takes a solver"""
+
+    def __init__(self, cache, cmd):
+        self.cache = cache
+        self.cmd = cmd
+
+    def all_solutions(self, target, cards):
+        output = self.cache.binary_output(self.cmd, target, cards)
+        return cs.trees_from_binary(output, sorted(cards))
@@ -0,0 +1,495 @@
+# Copyright 2022 Ben North
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+"""Precomputed database of the reachable targets of every set of cards
+
+The database is one file, meant to be memory-mapped.  It consists of a
+header, then these sections, at the offsets given in the header (all
+values little-endian):
+
+    cards:    for each set of cards, in sorted order, its n_cards
+              card values as u8, themselves sorted
+
+    entries:  for each set of cards, for each target from min_target
+              to max_target, u32 n_solutions and u32 offset of its
+              first solution, relative to that set of cards' base
+
+    bases:    for each set of cards, u64 offset of its solutions
+              within the solutions section
+
+    solutions: each first solution as a u8 number of opcodes followed
+              by that many three-byte (kind, arg0, arg1) opcodes, as
+              the C++ Opcode, where a Value's arg0 indexes the sorted
+              cards
+
+Building runs `evaluator-cli --all-targets --batch` over shards of the
+sets of cards, several at once from a pool of threads, each waiting on
+its own solver process, keeping each finished shard in a directory
+alongside the database so that an interrupted build can be resumed.
+"""
+
+from dataclasses import dataclass
+from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from pathlib import Path
+import array
+import json
+import mmap
+import re
+import struct
+import subprocess
+import sys
+import click
+
+import compare_solutions as cs
+
+
+Large_Cards = [25, 50, 75, 100]
+Small_Cards = list(range(1, 11))
+
+DatabaseMagic = b"CDSD"
+DatabaseVersion = 1
+
+# magic, version, n_cards, reserved, n_card_sets, min_target,
+# max_target, then offsets of cards, entries, bases, solutions
+DatabaseHeader = struct.Struct("<4sHBBIHHQQQQ")
+
+# n_solutions, offset of first solution
+Entry = struct.Struct("<II")
+
+
+def all_card_sets(n_cards=6, large_cards=Large_Cards, small_cards=Small_Cards):
+    """Every multiset of `n_cards` cards, each as a sorted tuple, in
+    sorted order, with at most one of each large card and two of each
+    small card, as in the game"""
+    deck = sorted(large_cards + small_cards + small_cards)
+    return sorted(set(combinations(deck, n_cards)))
+
+
+_opcode_re = re.compile(r"([VAMR])(?:\(([^)]*)\))?")
+
+
+def opcodes_from_string(s, cards):
+    """Concrete opcodes, as bytes, of a solution in evaluator-cli's text
+    form, with each Value's card index being that of its value in
+    `cards`"""
+    opcodes = bytearray()
+    for token in s.split():
+        kind, arg = _opcode_re.fullmatch(token).groups()
+        if kind == "V":
+            opcodes.extend([cs.Kind_Value, cards.index(int(arg)), 0])
+        elif kind in "AM":
+            n_args = len(arg)
+            mask = sum(
+                1 << (n_args - 1 - i) for i, sign in enumerate(arg)
+                if sign == "+"
+            )
+            opcodes.extend([
+                cs.Kind_AddN if kind == "A" else cs.Kind_MultiplyN,
+                n_args,
+                mask,
+            ])
+        else:
+            opcodes.extend([cs.Kind_Return, 0, 0])
+    return bytes(opcodes)
+
+
+def card_set_record(cards, lines, min_target, max_target):
+    """Entries and solutions of one set of cards, as one record of a
+    shard file, from the `--all-targets` output lines for those cards"""
+    n_targets = max_target - min_target + 1
+    entries = array.array("I", bytes(Entry.size * n_targets))
+    solutions = bytearray()
+    for line in lines:
+        value, n_solutions, solution = line.split(maxsplit=2)
+        value = int(value)
+        if not (min_target <= value <= max_target):
+            continue
+        opcodes = opcodes_from_string(solution, cards)
+        entry_idx = 2 * (value - min_target)
+        entries[entry_idx] = int(n_solutions)
+        entries[entry_idx + 1] = len(solutions)
+        solutions.append(len(opcodes) // 3)
+        solutions.extend(opcodes)
+    if entries.itemsize != 4:
+        raise RuntimeError("need 4-byte unsigned ints")
+    if sys.byteorder != "little":
+        entries.byteswap()
+    return (
+        struct.pack("<I", len(solutions))
+        + entries.tobytes()
+        + bytes(solutions)
+    )
+
+
+def blank_line_terminated_groups(lines):
+    """The lists of lines, each ended by a blank line, into which
+    `lines` are split, raising RuntimeError if the last is not ended"""
+    groups = []
+    group = []
+    for line in lines:
+        if line:
+            group.append(line)
+        else:
+            groups.append(group)
+            group = []
+    if group:
+        raise RuntimeError("output does not end with a blank line")
+    return groups
+
+
+def solve_shard(solver, card_sets, min_target, max_target):
+    """Records of all the given sets of cards
+
+    The solver's output for each set of cards is its lines followed by a
+    blank line; raise RuntimeError if it is not one such group of lines
+    for each set of cards.
+    """
+    cmd_input = "".join(
+        " ".join(str(c) for c in cards) + "\n" for cards in card_sets
+    )
+    cmd_result = subprocess.run(
+        [solver, "--all-targets", "--max-value", str(max_target), "--batch"],
+        input=cmd_input,
+        capture_output=True,
+        encoding="utf-8",
+        check=True,
+    )
+    games_lines = blank_line_terminated_groups(cmd_result.stdout.splitlines())
+    if len(games_lines) != len(card_sets):
+        raise RuntimeError(
+            f"{solver} gave output for {len(games_lines)} games"
+            f" but {len(card_sets)} were given"
+        )
+    return b"".join(
+        card_set_record(cards, game_lines, min_target, max_target)
+        for cards, game_lines in zip(card_sets, games_lines)
+    )
+
+
+def shards_dir_path(db_path):
+    return Path(f"{db_path}.shards")
+
+
+def shard_path(db_path, shard_idx):
+    return shards_dir_path(db_path) / f"shard-{shard_idx:05d}.bin"
+
+
+def build_params_path(db_path):
+    return shards_dir_path(db_path) / "params.json"
+
+
+def build_params(card_sets, min_target, max_target, n_shards):
+    "Parameters which must be the same for shards to be re-used"
+    return {
+        "n_cards": len(card_sets[0]),
+        "min_target": min_target,
+        "max_target": max_target,
+        "n_shards": n_shards,
+        "n_card_sets": len(card_sets),
+    }
+
+
+def check_build_params(db_path, params):
+    """Record the build's parameters alongside its shards, or, if an
+    earlier build left shards, check that it had the same parameters"""
+    path = build_params_path(db_path)
+    if path.exists():
+        earlier_params = json.loads(path.read_text())
+        if earlier_params != params:
+            raise click.ClickException(
+                f"shards in {shards_dir_path(db_path)} were built with"
+                f" {earlier_params}, not {params}; remove them to start again"
+            )
+    elif any(shards_dir_path(db_path).glob("shard-*.bin")):
+        raise click.ClickException(
+            f"shards in {shards_dir_path(db_path)} have no record of"
+            f" their build's parameters; remove them to start again"
+        )
+    else:
+        path.write_text(json.dumps(params))
+
+
+def build_shard(solver, db_path, shard_idx, card_sets, min_target, max_target):
+    """Solve and write one shard, unless a previous build already did"""
+    path = shard_path(db_path, shard_idx)
+    if path.exists():
+        return False
+    records = solve_shard(solver, card_sets, min_target, max_target)
+
+    # Write then rename, so that a shard file only exists if complete.
+    partial_path = path.with_suffix(".partial")
+    partial_path.write_bytes(records)
+    partial_path.rename(path)
+    return True
+
+
+def shard_card_sets(card_sets, n_shards):
+    n_per_shard = -(-len(card_sets) // n_shards)
+    return [
+        card_sets[i : i + n_per_shard]
+        for i in range(0, len(card_sets), n_per_shard)
+    ]
+
+
+def assemble_database(db_path, sharded_card_sets, n_cards, min_target, max_target):
+    n_targets = max_target - min_target + 1
+    entries_size = Entry.size * n_targets
+    card_sets = [cards for shard in sharded_card_sets for cards in shard]
+
+    cards_offset = DatabaseHeader.size
+    entries_offset = cards_offset + n_cards * len(card_sets)
+    entries_offset += -entries_offset % 8
+    bases_offset = entries_offset + entries_size * len(card_sets)
+    solutions_offset = bases_offset + 8 * len(card_sets)
+
+    def shard_records():
+        for shard_idx in range(len(sharded_card_sets)):
+            records = shard_path(db_path, shard_idx).read_bytes()
+            pos = 0
+            while pos < len(records):
+                (n_solutions_bytes,) = struct.unpack_from("<I", records, pos)
+                entries_pos = pos + 4
+                solutions_pos = entries_pos + entries_size
+                pos = solutions_pos + n_solutions_bytes
+                yield records, entries_pos, solutions_pos, pos
+
+    partial_path = Path(f"{db_path}.partial")
+    with partial_path.open("wb") as f_out:
+        f_out.write(DatabaseHeader.pack(
+            DatabaseMagic,
+            DatabaseVersion,
+            n_cards,
+            0,
+            len(card_sets),
+            min_target,
+            max_target,
+            cards_offset,
+            entries_offset,
+            bases_offset,
+            solutions_offset,
+        ))
+        for cards in card_sets:
+            f_out.write(bytes(cards))
+        f_out.write(bytes(entries_offset - f_out.tell()))
+
+        bases = []
+        base = 0
+        for records, entries_pos, solutions_pos, end in shard_records():
+            f_out.write(records[entries_pos:solutions_pos])
+            bases.append(base)
+            base += end - solutions_pos
+        if len(bases) != len(card_sets):
+            raise RuntimeError("shards do not match sets of cards")
+
+        f_out.write(struct.pack(f"<{len(bases)}Q", *bases))
+
+        for records, entries_pos, solutions_pos, end in shard_records():
+            f_out.write(records[solutions_pos:end])
+
+    partial_path.rename(db_path)
+
+
+def build_database(
+        solver,
+        db_path,
+        card_sets,
+        min_target=100,
+        max_target=999,
+        n_shards=64,
+        n_jobs=1,
+        report_fun=None,
+):
+    """Build the database at `db_path`, re-using any shards left by an
+    earlier, interrupted, build with the same arguments
+
+    Raise click.ClickException if the shards are from a build with
+    different arguments.
+    """
+    n_cards = len(card_sets[0])
+    sharded_card_sets = shard_card_sets(card_sets, n_shards)
+    shards_dir_path(db_path).mkdir(exist_ok=True)
+    check_build_params(
+        db_path, build_params(card_sets, min_target, max_target, n_shards)
+    )
+
+    def build_one(shard_idx):
+        was_built = build_shard(
+            solver,
+            db_path,
+            shard_idx,
+            sharded_card_sets[shard_idx],
+            min_target,
+            max_target,
+        )
+        if report_fun is not None:
+            report_fun(shard_idx, len(sharded_card_sets), was_built)
+
+    # The work is done by the solver processes, so threads suffice.
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        list(executor.map(build_one, range(len(sharded_card_sets))))
+
+    assemble_database(db_path, sharded_card_sets, n_cards, min_target, max_target)
+
+    for shard_idx in range(len(sharded_card_sets)):
+        shard_path(db_path, shard_idx).unlink()
+    build_params_path(db_path).unlink()
+    shards_dir_path(db_path).rmdir()
+
+
+@dataclass
+class DatabaseEntry:
+    n_solutions: int
+    first_solution: cs.Node
+
+
+class SolutionDatabase:
+    """Read-only, memory-mapped, access to a solution database"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic,
+            version,
+            self.n_cards,
+            _reserved,
+            self.n_card_sets,
+            self.min_target,
+            self.max_target,
+            cards_offset,
+            self.entries_offset,
+            self.bases_offset,
+            self.solutions_offset,
+        ) = DatabaseHeader.unpack_from(self.mmap, 0)
+
+        if magic != DatabaseMagic:
+            raise ValueError(f"{path} is not a solution database")
+        if version != DatabaseVersion:
+            raise ValueError(f"{path} has unsupported version {version}")
+
+        self.n_targets = self.max_target - self.min_target + 1
+        self.card_set_indexes = {
+            self.mmap[offset : offset + self.n_cards]: idx
+            for idx, offset in enumerate(range(
+                cards_offset,
+                cards_offset + self.n_cards * self.n_card_sets,
+                self.n_cards,
+            ))
+        }
+
+    def close(self):
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def lookup(self, target, cards) -> Optional[DatabaseEntry]:
+        """Number of solutions, and first solution, for `target` with
+        `cards` (in any order), or None if `target` cannot be reached
+
+        Raise KeyError if the cards or target are not in the database.
+        """
+        cards = sorted(cards)
+        card_set_idx = self.card_set_indexes[bytes(cards)]
+        if not (self.min_target <= target <= self.max_target):
+            raise KeyError(f"target {target} not in database")
+
+        entry_offset = (
+            self.entries_offset
+            + Entry.size * (card_set_idx * self.n_targets + target - self.min_target)
+        )
+        n_solutions, solution_offset = Entry.unpack_from(self.mmap, entry_offset)
+        if n_solutions == 0:
+            return None
+
+        (base,) = struct.unpack_from(
+            "<Q", self.mmap, self.bases_offset + 8 * card_set_idx
+        )
+        offset = self.solutions_offset + base + solution_offset
+        n_opcodes = self.mmap[offset]
+        opcodes = self.mmap[offset + 1 : offset + 1 + 3 * n_opcodes]
+        return DatabaseEntry(n_solutions, cs.tree_from_opcodes(opcodes, cards))
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command(name="build")
+@click.option("--solver", default="./tree-solve", show_default=True)
+@click.option("--output", "db_path", required=True, metavar="FILE")
+@click.option("--n-cards", type=click.IntRange(min=1), default=6)
+@click.option("--min-target", type=click.IntRange(min=1), default=100)
+@click.option("--max-target", type=click.IntRange(min=1), default=999)
+@click.option("--shards", "n_shards", type=click.IntRange(min=1), default=64)
+@click.option(
+    "--jobs",
+    "n_jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="number of shards to solve at once, each by its own solver process",
+)
+def build(solver, db_path, n_cards, min_target, max_target, n_shards, n_jobs):
+    """Build a solution database for all sets of cards
+
+    Re-running after an interruption re-uses the shards already built.
+    """
+    card_sets = all_card_sets(n_cards)
+
+    def report(shard_idx, n_shards, was_built):
+        status = "built" if was_built else "already built"
+        click.echo(f"shard {shard_idx + 1}/{n_shards} {status}", err=True)
+
+    build_database(
+        solver,
+        db_path,
+        card_sets,
+        min_target,
+        max_target,
+        n_shards,
+        n_jobs,
+        report,
+    )
+
+
+@cli.command(name="lookup")
+@click.option("--db", "db_path", required=True, metavar="FILE")
+@click.argument("target", type=int)
+@click.argument("cards", nargs=-1, type=int, required=True)
+def lookup(db_path, target, cards):
+    """Show the number of solutions, and the first solution"""
+    with SolutionDatabase(db_path) as db:
+        try:
+            entry = db.lookup(target, cards)
+        except KeyError as e:
+            raise click.ClickException(
+                f"not in database: target {target} with cards {list(cards)}"
+            ) from e
+        if entry is None:
+            print(f"{target} cannot be reached")
+        else:
+            print(f"{entry.n_solutions} solutions,"
+                  f" including {entry.first_solution.pprint_toplevel()}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -13,7 +13,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see https://www.gnu.org/licenses/
 
+import os
+import asyncio
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import pytest
+from click.testing import CliRunner
 
 import compare_solutions
 
@@ -114,6 +120,49 @@ class TestOpNode:
         assert getattr(n, method)() == exp_result
 
 
+class TestCanonicalizer:
+    trees = [
+        ON([ON([VN(100), VN(1)], "++"), VN(42), VN(400)], "*/*"),
+        ON([ON([VN(100), ON([VN(1), VN(3)], "-+")], "+-"), VN(42), VN(400)], "+-+"),
+        ON([ON([VN(100), ON([VN(1), VN(3)], "-+")], "+-"), VN(42), VN(400)], "***"),
+        VN(7),
+    ]
+
+    @pytest.mark.parametrize("tree", trees)
+    def test_key(self, tree):
+        canonicalizer = compare_solutions.Canonicalizer()
+        canon_id = canonicalizer.canonical_id(tree)
+        exp_key = tree.absorbing_like_children().in_canonical_order().key()
+        assert canonicalizer.key(canon_id) == exp_key
+
+    def test_equivalent_trees(self):
+        canonicalizer = compare_solutions.Canonicalizer()
+        # (3 + 4) − (1 − 2), 3 + 4 + 2 − 1, and 2 + (4 − 1) + 3
+        ids = [
+            canonicalizer.canonical_id(tree)
+            for tree in [
+                ON([ON([VN(3), VN(4)], "++"), ON([VN(1), VN(2)], "+-")], "+-"),
+                ON([VN(3), VN(4), VN(2), VN(1)], "+++-"),
+                ON([VN(2), ON([VN(4), VN(1)], "+-"), VN(3)], "+++"),
+            ]
+        ]
+        assert ids[0] == ids[1] == ids[2]
+
+    def test_different_trees(self):
+        canonicalizer = compare_solutions.Canonicalizer()
+        id_add = canonicalizer.canonical_id(ON([VN(2), VN(2)], "++"))
+        id_mul = canonicalizer.canonical_id(ON([VN(2), VN(2)], "**"))
+        assert id_add != id_mul
+
+    def test_shared_subtrees(self):
+        canonicalizer = compare_solutions.Canonicalizer()
+        sub = ON([VN(25), VN(50)], "++")
+        canonicalizer.canonical_id(ON([sub, VN(3)], "*/"))
+        n_forms = len(canonicalizer.forms)
+        canonicalizer.canonical_id(ON([VN(3), sub], "/*"))
+        assert len(canonicalizer.forms) == n_forms
+
+
 class TestTopLevel:
     def test_tree_from_string(self):
         got_n = compare_solutions.tree_from_string(
@@ -127,3 +176,304 @@ class TestTopLevel:
             "/*"
         )
         assert got_n == exp_n
+
+    def test_tree_from_opcodes(self):
+        # As for test_tree_from_string().
+        opcodes = bytes([
+            0, 0, 0,
+            0, 1, 0,
+            2, 2, 2,
+            0, 2, 0,
+            1, 2, 1,
+            3, 0, 0,
+        ])
+        got_n = compare_solutions.tree_from_opcodes(opcodes, [24, 13, 99])
+        exp_n = compare_solutions.tree_from_string(
+            "V(24) V(13) A(+-) V(99) M(-+) R"
+        )
+        assert got_n == exp_n
+
+    def test_trees_from_binary(self):
+        data = bytes([
+            2, 0, 2, 0, 3, 0, 0,
+            4, 0, 0, 0, 0, 1, 0, 2, 2, 1, 3, 0, 0,
+            0,
+        ])
+        got_trees = compare_solutions.trees_from_binary(data, [9, 3, 6])
+        assert got_trees == [VN(6), ON([VN(9), VN(3)], "-+")]
+
+    def test_trees_from_binary_no_solutions(self):
+        assert compare_solutions.trees_from_binary(b"\0", [1, 2]) == []
+
+    @pytest.mark.parametrize("cmd", ["./tree-solve", "./rpn-solve"])
+    def test_all_solutions_from_cmd_binary(self, cmd):
+        if not os.path.exists(cmd):
+            pytest.skip(f"needs {cmd}")
+        for target, cards in [(952, [25, 50, 75, 100, 3, 6]),
+                              (100, [1, 2, 3, 4, 5, 6])]:
+            got_trees = compare_solutions.all_solutions_from_cmd(
+                cmd, target, cards, binary=True
+            )
+            exp_trees = compare_solutions.all_solutions_from_cmd(
+                cmd, target, cards
+            )
+            assert got_trees == exp_trees
+
+    def test_reachable_values_from_lines(self):
+        got_values = compare_solutions.reachable_values_from_lines([
+            "3 2 V(3) R",
+            "24 1 V(3) V(8) M(++) R",
+        ])
+        assert list(got_values) == [3, 24]
+        assert got_values[3] == compare_solutions.ReachableValue(2, VN(3))
+        assert got_values[24].n_solutions == 1
+        assert got_values[24].first_solution == ON([VN(3), VN(8)], "**")
+
+    @pytest.mark.parametrize(
+        "target, exp_value",
+        [(24, 24), (20, 24), (13, 11), (18, 24), (7, 3), (1, 3)],
+    )
+    def test_nearest_reachable_value(self, target, exp_value):
+        reachable_values = {3: None, 11: None, 24: None}
+        got_value = compare_solutions.nearest_reachable_value(
+            reachable_values, target
+        )
+        assert got_value == exp_value
+
+    def test_nearest_reachable_value_none(self):
+        assert compare_solutions.nearest_reachable_value({}, 100) is None
+
+
+solvers_missing = not (
+    os.path.exists("./tree-solve") and os.path.exists("./rpn-solve")
+)
+
+
+@pytest.mark.skipif(not os.path.exists("./rpn-solve"), reason="needs ./rpn-solve")
+@pytest.mark.parametrize(
+    "target, cards, memo_mb",
+    [
+        (952, [25, 50, 75, 100, 3, 6], 4),
+        (999, [1, 1, 2, 2, 3, 3], 1),
+        (100, [7, 7, 7, 7, 7, 7], 1),
+        (831, [1, 2, 3, 4, 5, 6, 7], 1),
+    ],
+)
+def test_compare_rpn_memo(target, cards, memo_mb):
+    result = compare_solutions.compare_rpn_memo(target, cards, memo_mb=memo_mb)
+    assert result["memo"] == result["plain"]
+
+
+@pytest.mark.skipif(solvers_missing, reason="needs ./tree-solve and ./rpn-solve")
+class TestAsync:
+    games = [
+        (952, [25, 50, 75, 100, 3, 6]),
+        (100, [1, 2, 3, 4, 5, 6]),
+        (999, [1, 1, 2, 2, 3, 3]),
+        (500, [7, 8, 9, 10, 25, 50]),
+    ]
+
+    @pytest.mark.parametrize("binary", [False, True])
+    def test_all_solutions_from_cmd_async(self, binary):
+        for cmd in ["./tree-solve", "./rpn-solve"]:
+            target, cards = self.games[0]
+            got_trees = asyncio.run(compare_solutions.all_solutions_from_cmd_async(
+                cmd, target, cards, binary
+            ))
+            exp_trees = compare_solutions.all_solutions_from_cmd(
+                cmd, target, cards
+            )
+            assert got_trees == exp_trees
+
+    def test_compare_games_async(self):
+        canonicalizer = compare_solutions.Canonicalizer()
+        got_cmps = asyncio.run(compare_solutions.compare_games_async(
+            self.games, max_n_games_in_flight=3, canonicalizer=canonicalizer
+        ))
+        exp_cmps = [
+            compare_solutions.compare_solvers(
+                target, cards, canonicalizer=canonicalizer
+            )
+            for target, cards in self.games
+        ]
+        assert got_cmps == exp_cmps
+
+    def test_compare_games_async_solvers(self):
+        # Both solvers the same, so they agree whatever they find.
+        got_cmps = asyncio.run(compare_solutions.compare_games_async(
+            self.games[:2], "./rpn-solve", "./rpn-solve"
+        ))
+        for cmp in got_cmps:
+            assert cmp["tree"] == cmp["rpn"]
+            assert not cmp["tree_not_rpn"] and not cmp["rpn_not_tree"]
+
+
+class DroppingSolver:
+    "Solver giving all but the first of another solver's solutions"
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+
+    def all_solutions(self, target, cards):
+        return compare_solutions.all_solutions_from_cmd(
+            self.cmd, target, cards
+        )[1:]
+
+
+class TestStreaming:
+    @pytest.mark.parametrize("solver", ["/bin/true", "/bin/false"])
+    def test_iter_solutions_no_output(self, solver):
+        with pytest.raises(RuntimeError):
+            list(compare_solutions.iter_solutions(solver, 100, [1, 2, 3]))
+
+    def test_iter_solutions_failure(self, tmp_path):
+        # A complete, but empty, game's output, then failure.
+        solver = tmp_path / "failing-solver"
+        solver.write_text("#!/bin/sh\nprintf '\\0'\nexit 3\n")
+        solver.chmod(0o755)
+        with pytest.raises(subprocess.CalledProcessError):
+            list(compare_solutions.iter_solutions(str(solver), 100, [1, 2, 3]))
+
+    def test_streaming_needs_executables(self):
+        result = CliRunner().invoke(
+            compare_solutions.cli,
+            ["compare", "--streaming", "--cache", "cache.sqlite", "--n-games", "1"],
+        )
+        assert result.exit_code == 2
+        assert "cannot be used with --streaming" in result.output
+
+    @pytest.mark.parametrize("tree", TestCanonicalizer.trees)
+    def test_canonical_digest(self, tree):
+        canonical_tree = tree.absorbing_like_children().in_canonical_order()
+        digest = compare_solutions.canonical_digest(tree)
+        assert len(digest) == compare_solutions.Digest_Size
+        assert compare_solutions.canonical_digest(canonical_tree) == digest
+
+    def test_canonical_digest_distinct(self):
+        digests = set(
+            compare_solutions.canonical_digest(tree)
+            for tree in TestCanonicalizer.trees
+        )
+        assert len(digests) == len(TestCanonicalizer.trees)
+
+    @pytest.mark.skipif(
+        solvers_missing, reason="needs ./tree-solve and ./rpn-solve"
+    )
+    def test_same_as_compare_solvers(self):
+        for target, cards in TestAsync.games:
+            got_cmp = compare_solutions.compare_solvers_streaming(target, cards)
+            exp_cmp = compare_solutions.compare_solvers(target, cards)
+            assert sum(got_cmp["tree"].values()) == len(exp_cmp["tree"])
+            assert len(got_cmp["tree"]) == len(set(exp_cmp["tree"]))
+            assert sum(got_cmp["rpn"].values()) == len(exp_cmp["rpn"])
+            assert len(got_cmp["rpn"]) == len(set(exp_cmp["rpn"]))
+            assert got_cmp["tree_not_rpn"] == []
+            assert got_cmp["rpn_not_tree"] == []
+
+    @pytest.mark.skipif(
+        solvers_missing, reason="needs ./tree-solve and ./rpn-solve"
+    )
+    def test_discrepancy(self):
+        # The solutions are all distinct, so dropping one gives a
+        # discrepancy:
+        target, cards = 952, [25, 50, 75, 100, 3, 6]
+        exp_key = (
+            compare_solutions.all_solutions_from_cmd("./tree-solve", target, cards)[0]
+            .absorbing_like_children()
+            .in_canonical_order()
+            .key()
+        )
+        cmp = compare_solutions.compare_solvers_streaming(
+            target, cards, rpn_solver=DroppingSolver("./tree-solve")
+        )
+        assert cmp["tree_not_rpn"] == [exp_key]
+        assert cmp["rpn_not_tree"] == []
+
+
+def fake_batch(state, batch_idx):
+    rnd = state.batch_rng(batch_idx)
+    values = [rnd.randint(0, 99) for _ in range(state.batch_size)]
+    return {
+        "n_games": state.batch_size,
+        "solver_seconds": {"fake": 0.5},
+        "findings": [{"value": v} for v in values if v < 10],
+    }
+
+
+def inherited_solvers_reused(cache_path):
+    "Whether this process re-uses solvers inherited from its parent"
+    inherited = [
+        process_solvers
+        for key, process_solvers in compare_solutions._solvers.items()
+        if key[2] == cache_path
+    ]
+    return compare_solutions.solvers(cache_path=cache_path) in inherited
+
+
+class TestCampaign:
+    def test_solvers_per_process(self, tmp_path):
+        cache_path = str(tmp_path / "cache.sqlite")
+        parent_solvers = compare_solutions.solvers(cache_path=cache_path)
+        assert compare_solutions.solvers(cache_path=cache_path) is parent_solvers
+
+        fork_context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(1, mp_context=fork_context) as pool:
+            assert not pool.submit(inherited_solvers_reused, cache_path).result()
+
+    @pytest.mark.parametrize(
+        "option", ["--jobs", "--batch-size", "--in-flight"]
+    )
+    def test_counts_must_be_positive(self, option):
+        result = CliRunner().invoke(
+            compare_solutions.cli,
+            ["compare", option, "0", "--n-games", "5", "--seed", "1"],
+        )
+        assert result.exit_code == 2
+        assert option in result.output
+
+    def test_save_load(self, tmp_path):
+        path = tmp_path / "checkpoint.json"
+        state = compare_solutions.CampaignState("compare", 42, 10)
+        compare_solutions.run_campaign(state, fake_batch, n_games=30)
+        state.save(path)
+        assert compare_solutions.CampaignState.load(path) == state
+        assert state.n_batches_done == 3
+        assert state.solver_seconds == {"fake": 1.5}
+
+    def test_n_games_rounds_up(self):
+        state = compare_solutions.CampaignState("compare", 42, 10)
+        compare_solutions.run_campaign(state, fake_batch, n_games=25)
+        assert state.n_games_done == 30
+
+    def test_resume(self, tmp_path):
+        path = tmp_path / "checkpoint.json"
+        state = compare_solutions.CampaignState("compare", 42, 10)
+        compare_solutions.run_campaign(
+            state, fake_batch, n_games=20, checkpoint_path=path
+        )
+        resumed_state = compare_solutions.CampaignState.load(path)
+        compare_solutions.run_campaign(
+            resumed_state, fake_batch, n_games=50, checkpoint_path=path
+        )
+
+        exp_state = compare_solutions.CampaignState("compare", 42, 10)
+        compare_solutions.run_campaign(exp_state, fake_batch, n_games=50)
+        assert compare_solutions.CampaignState.load(path) == exp_state
+        assert exp_state.findings
+
+    def test_parallel(self):
+        exp_state = compare_solutions.CampaignState("compare", 42, 10)
+        compare_solutions.run_campaign(exp_state, fake_batch, n_games=50)
+        state = compare_solutions.CampaignState("compare", 42, 10)
+        compare_solutions.run_campaign(state, fake_batch, n_jobs=2, n_games=50)
+        assert state == exp_state
+
+    @pytest.mark.skipif(
+        solvers_missing, reason="needs ./tree-solve and ./rpn-solve"
+    )
+    def test_rpn_dups_batch_reproducible(self):
+        state = compare_solutions.CampaignState("find-rpn-dups", 42, 20)
+        result = compare_solutions.rpn_dups_batch(state, 3)
+        assert result["n_games"] == 20
+        again = compare_solutions.rpn_dups_batch(state, 3)
+        assert again["findings"] == result["findings"]
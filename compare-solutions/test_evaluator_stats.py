@@ -0,0 +1,68 @@
+# Copyright 2022 Ben North
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+import os
+import json
+import pytest
+
+import evaluator_stats as es
+
+
+solver_missing = not os.path.exists("./tree-solve-stats")
+
+
+def game_stats(target, seconds, counts):
+    stats = {"target": target, "cards": [1, 2, 3, 4, 5, 6], "seconds": seconds}
+    stats.update(zip(es.Count_Names, counts))
+    return stats
+
+
+def test_stats_from_lines():
+    stats = game_stats(100, 0.5, [1, 2, 3, 4, 5, 6])
+    lines = ["evaluator-cli: a warning", json.dumps(stats), ""]
+    assert es.stats_from_lines(lines) == [stats]
+
+
+def test_aggregate_stats():
+    totals = es.aggregate_stats([
+        game_stats(100, 0.25, [10, 100, 40, 4, 10, 30]),
+        game_stats(200, 0.5, [10, 200, 60, 6, 20, 40]),
+    ])
+    assert totals["n_games"] == 2
+    assert totals["seconds"] == 0.75
+    assert totals["n_masks_tried"] == 100
+    assert totals["n_evaluations"] == 70
+    assert totals["fraction_operand_invalid"] == pytest.approx(0.1)
+    assert totals["fraction_operation_invalid"] == pytest.approx(0.3)
+
+
+def test_aggregate_no_stats():
+    totals = es.aggregate_stats([])
+    assert totals["n_games"] == 0
+    assert totals["fraction_operand_invalid"] == 0.0
+    assert len(es.summary_lines(totals)) == 3
+
+
+@pytest.mark.skipif(solver_missing, reason="tree-solve-stats not built")
+def test_stats_from_cmd():
+    games = [(952, [25, 50, 75, 100, 3, 6]), (100, [7, 7, 7, 7, 7, 7])]
+    all_stats = es.stats_from_cmd("./tree-solve-stats", games)
+    assert [(s["target"], s["cards"]) for s in all_stats] == games
+    for stats in all_stats:
+        n_masks_pruned = (
+            stats["n_masks_operand_invalid"] + stats["n_masks_operation_invalid"]
+        )
+        assert 0 < n_masks_pruned < stats["n_masks_tried"]
+        assert stats["n_evaluations"] > 0
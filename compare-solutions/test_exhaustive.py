@@ -0,0 +1,98 @@
+# Copyright 2022 Ben North
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+import os
+import click
+import pytest
+
+import exhaustive as ex
+
+
+solvers_missing = not (
+    os.path.exists("./tree-solve") and os.path.exists("./rpn-solve")
+)
+
+
+def test_shard_bounds():
+    bounds = [ex.shard_bounds(10, i, 3) for i in range(3)]
+    assert bounds == [(0, 3), (3, 6), (6, 10)]
+
+
+@pytest.mark.parametrize("value, exp_shard", [("0/1", (0, 1)), ("3/8", (3, 8))])
+def test_parse_shard(value, exp_shard):
+    assert ex.parse_shard(None, None, value) == exp_shard
+
+
+@pytest.mark.parametrize("value", ["3", "8/8", "a/b"])
+def test_parse_shard_bad(value):
+    with pytest.raises(click.BadParameter):
+        ex.parse_shard(None, None, value)
+
+
+@pytest.mark.skipif(solvers_missing, reason="needs ./tree-solve and ./rpn-solve")
+class TestSweep:
+    @pytest.fixture
+    def few_card_sets(self, monkeypatch):
+        card_sets = [(1, 2, 3, 4), (1, 2, 25, 100), (3, 3, 7, 50), (5, 6, 8, 75)]
+        monkeypatch.setattr(
+            ex.sdb, "all_card_sets", lambda n_cards: card_sets
+        )
+        return card_sets
+
+    def test_sweep_card_set(self):
+        result = ex.sweep_card_set((1, 2, 3, 4), 9, 10)
+        assert result["cards"] == [1, 2, 3, 4]
+        assert result["n_tree"][0] > 0
+        assert len(result["n_rpn"]) == 2
+        assert result["discrepancies"] == []
+
+    def test_sweep_and_merge(self, tmp_path, few_card_sets):
+        for shard_idx in range(2):
+            n_swept = ex.sweep_shard(tmp_path, shard_idx, 2, 4, 20, 24)
+            assert n_swept == 2
+
+        paths = sorted(tmp_path.iterdir())
+        stats = ex.merge_shards(paths)
+        assert stats["n_card_sets"] == 4
+        assert stats["n_games"] == 20
+        assert stats["n_discrepancies"] == 0
+        assert stats["n_tree_solutions"] > 0
+
+        with pytest.raises(click.ClickException, match="exactly once"):
+            ex.merge_shards(paths[:1])
+
+    def test_resume(self, tmp_path, few_card_sets):
+        ex.sweep_shard(tmp_path, 0, 1, 4, 20, 24)
+        path = ex.shard_file_path(tmp_path, 0, 1)
+        exp_content = path.read_bytes()
+
+        # As if interrupted while writing the third set of cards' results:
+        lines = exp_content.split(b"\n")
+        path.write_bytes(b"\n".join(lines[:3]) + b"\n" + lines[3][:10])
+
+        assert ex.sweep_shard(tmp_path, 0, 1, 4, 20, 24) == 2
+        assert path.read_bytes() == exp_content
+        assert ex.sweep_shard(tmp_path, 0, 1, 4, 20, 24) == 0
+
+        with pytest.raises(click.ClickException, match="different sweep"):
+            ex.sweep_shard(tmp_path, 0, 1, 4, 20, 25)
+
+    def test_merge_incomplete(self, tmp_path, few_card_sets):
+        ex.sweep_shard(tmp_path, 0, 1, 4, 20, 24)
+        path = ex.shard_file_path(tmp_path, 0, 1)
+        lines = path.read_bytes().split(b"\n")
+        path.write_bytes(b"\n".join(lines[:3]) + b"\n")
+        with pytest.raises(click.ClickException, match="incomplete"):
+            ex.merge_shards([path])
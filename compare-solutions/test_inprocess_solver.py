@@ -0,0 +1,92 @@
+# Copyright 2022 Ben North
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+import os
+import gc
+import random
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+import compare_solutions as cs
+
+lib_missing = not os.path.exists("./libcountdown-solver.so")
+tree_solve_missing = not os.path.exists("./tree-solve")
+
+if not lib_missing:
+    import inprocess_solver as ips
+
+
+def random_games(n_games, n_cards=6):
+    rnd = random.Random(42)
+    return [
+        (rnd.randint(100, 999), rnd.choices(cs.All_Cards, k=n_cards))
+        for _ in range(n_games)
+    ]
+
+
+@pytest.mark.skipif(lib_missing, reason="needs ./libcountdown-solver.so")
+class TestInProcessSolver:
+    def test_split_solutions(self):
+        opcodes = bytes([0, 0, 0, 3, 0, 0, 0, 1, 0, 0, 0, 0, 2, 2, 1, 3, 0, 0])
+        assert ips.split_solutions(opcodes) == [opcodes[:6], opcodes[6:]]
+
+    def test_solve(self):
+        solver = ips.InProcessSolver()
+        opcodes = solver.solve(100, [1, 2, 3, 4, 5, 100])
+        assert opcodes.readonly
+        gc.collect()
+        solutions = ips.split_solutions(opcodes)
+        assert bytes(solutions[0]) == bytes([0, 5, 0, 3, 0, 0])
+
+    def test_no_solutions(self):
+        solver = ips.InProcessSolver()
+        assert len(solver.solve(999, [1, 1, 2, 2, 3, 3])) == 0
+
+    def test_wrong_n_cards(self):
+        solver = ips.InProcessSolver()
+        with pytest.raises(ValueError):
+            solver.solve(100, [1, 2, 3])
+
+    def test_bad_programs_path(self, tmp_path):
+        with pytest.raises(RuntimeError, match="could not open"):
+            ips.InProcessSolver(programs_path=tmp_path / "missing.bin")
+
+    @pytest.mark.skipif(tree_solve_missing, reason="needs ./tree-solve")
+    def test_same_as_cmd(self):
+        solver = ips.InProcessSolver()
+        for target, cards in random_games(10):
+            assert solver.all_solutions(target, cards) == (
+                cs.all_solutions_from_cmd("./tree-solve", target, cards)
+            )
+
+    @pytest.mark.skipif(tree_solve_missing, reason="needs ./tree-solve")
+    def test_program_file(self):
+        solver = ips.InProcessSolver(programs_path="programs-4-cards.bin")
+        assert solver.n_cards == 4
+        for target, cards in random_games(10, n_cards=4):
+            target %= 100
+            assert solver.all_solutions(target, cards) == (
+                cs.all_solutions_from_cmd("./tree-solve", target, cards)
+            )
+
+    def test_threads(self):
+        solver = ips.InProcessSolver()
+        games = random_games(8)
+        exp_solutions = [bytes(solver.solve(*game)) for game in games]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            got_solutions = list(
+                pool.map(lambda game: bytes(solver.solve(*game)), games)
+            )
+        assert got_solutions == exp_solutions
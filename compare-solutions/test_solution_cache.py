@@ -0,0 +1,119 @@
+# Copyright 2022 Ben North
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+
+import compare_solutions as cs
+import solution_cache as sc
+
+
+@pytest.fixture
+def fake_solver(tmp_path):
+    # Only hashed, never run, by get() and put().
+    path = tmp_path / "fake-solve"
+    path.write_bytes(b"version 1")
+    return str(path)
+
+
+def put_many(cache_path, solver, targets):
+    with sc.SolutionCache(cache_path) as cache:
+        for target in targets:
+            cache.put(solver, target, [1, 2], bytes([target % 256]) * 100)
+
+
+class TestSolutionCache:
+    def test_put_get(self, tmp_path, fake_solver):
+        with sc.SolutionCache(tmp_path / "cache.sqlite") as cache:
+            assert cache.get(fake_solver, 100, [1, 2, 3]) is None
+            cache.put(fake_solver, 100, [1, 2, 3], b"\x01\x02\x03")
+            assert cache.get(fake_solver, 100, [1, 2, 3]) == b"\x01\x02\x03"
+            assert cache.get(fake_solver, 101, [1, 2, 3]) is None
+            assert len(cache) == 1
+
+        with sc.SolutionCache(tmp_path / "cache.sqlite") as cache:
+            assert cache.get(fake_solver, 100, [1, 2, 3]) == b"\x01\x02\x03"
+
+    def test_solver_changed(self, tmp_path, fake_solver):
+        with sc.SolutionCache(tmp_path / "cache.sqlite") as cache:
+            cache.put(fake_solver, 100, [1, 2, 3], b"\x01")
+            with open(fake_solver, "ab") as f_out:
+                f_out.write(b" and a bit")
+            assert cache.get(fake_solver, 100, [1, 2, 3]) is None
+
+    def test_lru_eviction(self, tmp_path, fake_solver):
+        with sc.SolutionCache(tmp_path / "cache.sqlite", 1000, 0.0) as cache:
+            for target in range(10):
+                cache.put(fake_solver, target, [1, 2], os.urandom(200))
+                # Keep the first entry in use.
+                assert cache.get(fake_solver, 0, [1, 2]) is not None
+            assert cache.n_bytes() <= 1000
+            assert cache.get(fake_solver, 0, [1, 2]) is not None
+            assert cache.get(fake_solver, 1, [1, 2]) is None
+            assert cache.get(fake_solver, 9, [1, 2]) is not None
+
+    def test_get_without_write_lock(self, tmp_path, fake_solver):
+        cache_path = tmp_path / "cache.sqlite"
+        with sc.SolutionCache(cache_path) as cache:
+            cache.put(fake_solver, 100, [1, 2], b"\x01")
+            cache.connection.execute("PRAGMA busy_timeout = 100")
+
+            def last_used():
+                return cache.connection.execute(
+                    "SELECT last_used FROM solutions"
+                ).fetchone()[0]
+
+            # A recently used entry is got while another connection
+            # holds the write lock.
+            with sc.SolutionCache(cache_path) as writer:
+                writer.connection.execute("BEGIN IMMEDIATE")
+                put_time = last_used()
+                assert cache.get(fake_solver, 100, [1, 2]) == b"\x01"
+                assert last_used() == put_time
+                writer.connection.execute("ROLLBACK")
+
+            # One not used for a while has its time of last use updated.
+            cache.connection.execute("UPDATE solutions SET last_used = 0")
+            assert cache.get(fake_solver, 100, [1, 2]) == b"\x01"
+            assert last_used() >= put_time
+
+    def test_concurrent_writers(self, tmp_path, fake_solver):
+        cache_path = tmp_path / "cache.sqlite"
+        with ProcessPoolExecutor(4) as pool:
+            list(pool.map(
+                put_many,
+                [cache_path] * 4,
+                [fake_solver] * 4,
+                [range(i, 200, 4) for i in range(4)],
+            ))
+        with sc.SolutionCache(cache_path) as cache:
+            assert len(cache) == 200
+            assert cache.get(fake_solver, 123, [1, 2]) == bytes([123]) * 100
+            n_bytes = cache.connection.execute(
+                "SELECT SUM(LENGTH(data)) FROM solutions"
+            ).fetchone()[0]
+            assert cache.n_bytes() == n_bytes
+
+
+@pytest.mark.skipif(not os.path.exists("./rpn-solve"), reason="needs ./rpn-solve")
+def test_cached_solver(tmp_path):
+    with sc.SolutionCache(tmp_path / "cache.sqlite") as cache:
+        solver = sc.CachedSolver(cache, "./rpn-solve")
+        cards = [75, 3, 50, 6, 25, 100]
+        exp_trees = cs.all_solutions_from_cmd("./rpn-solve", 952, sorted(cards))
+        assert solver.all_solutions(952, cards) == exp_trees
+        assert solver.all_solutions(952, sorted(cards)) == exp_trees
+        assert (cache.n_misses, cache.n_hits) == (1, 1)
@@ -0,0 +1,182 @@
+# Copyright 2022 Ben North
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+import os
+import click
+from click.testing import CliRunner
+import pytest
+
+import compare_solutions as cs
+import solution_db as sdb
+
+VN = cs.ValueNode
+ON = cs.OpNode
+
+
+tree_solve_missing = not os.path.exists("./tree-solve")
+
+
+class TestCardSets:
+    def test_all_card_sets(self):
+        card_sets = sdb.all_card_sets(2, [25, 50], [1, 2])
+        assert card_sets == [
+            (1, 1), (1, 2), (1, 25), (1, 50),
+            (2, 2), (2, 25), (2, 50),
+            (25, 50),
+        ]
+
+    def test_all_card_sets_game(self):
+        assert len(sdb.all_card_sets()) == 13243
+
+    def test_shard_card_sets(self):
+        shards = sdb.shard_card_sets(list(range(10)), 4)
+        assert shards == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
+
+
+class TestEncoding:
+    def test_opcodes_from_string(self):
+        cards = [3, 13, 24, 99]
+        opcodes = sdb.opcodes_from_string(
+            "V(24) V(13) A(+-) V(99) M(-+) R", cards
+        )
+        assert opcodes == bytes([
+            0, 2, 0,
+            0, 1, 0,
+            2, 2, 2,
+            0, 3, 0,
+            1, 2, 1,
+            3, 0, 0,
+        ])
+        got_n = cs.tree_from_opcodes(opcodes, cards)
+        assert got_n == ON([ON([VN(24), VN(13)], "+-"), VN(99)], "/*")
+
+    def test_card_set_record(self):
+        record = sdb.card_set_record(
+            (2, 3),
+            ["1 1 V(3) V(2) A(+-) R", "5 2 V(2) V(3) A(++) R", "6 2 V(2) V(3) M(++) R"],
+            5,
+            7,
+        )
+        solutions = bytes([4, 0, 0, 0, 0, 1, 0, 2, 2, 3, 3, 0, 0])
+        solutions += bytes([4, 0, 0, 0, 0, 1, 0, 1, 2, 3, 3, 0, 0])
+        assert record == (
+            bytes([len(solutions), 0, 0, 0])
+            + bytes([2, 0, 0, 0, 0, 0, 0, 0])
+            + bytes([2, 0, 0, 0, 13, 0, 0, 0])
+            + bytes([0, 0, 0, 0, 0, 0, 0, 0])
+            + solutions
+        )
+
+    def test_blank_line_terminated_groups(self):
+        groups = sdb.blank_line_terminated_groups(["a", "b", "", "", "c", ""])
+        assert groups == [["a", "b"], [], ["c"]]
+        assert sdb.blank_line_terminated_groups([]) == []
+        with pytest.raises(RuntimeError):
+            sdb.blank_line_terminated_groups(["a", "", "b"])
+
+    @pytest.mark.parametrize(
+        "output, exp_n_games",
+        [("", 0), ("\\n", 1), ("\\n\\n\\n", 3)],
+    )
+    def test_solve_shard_wrong_n_games(self, tmp_path, output, exp_n_games):
+        solver = tmp_path / "fake-solve"
+        solver.write_text(f"#!/bin/sh\ncat > /dev/null\nprintf '{output}'\n")
+        solver.chmod(0o755)
+        with pytest.raises(RuntimeError, match=f"output for {exp_n_games} games"):
+            sdb.solve_shard(str(solver), [(1, 2), (1, 3)], 1, 10)
+
+
+@pytest.mark.skipif(tree_solve_missing, reason="needs ./tree-solve")
+class TestDatabase:
+    def test_build_and_lookup(self, tmp_path):
+        db_path = tmp_path / "solutions.db"
+        card_sets = sdb.all_card_sets(4, [25, 100], [1, 2, 3])
+        sdb.build_database(
+            "./tree-solve", db_path, card_sets, 10, 120, n_shards=3, n_jobs=2
+        )
+        assert not sdb.shards_dir_path(db_path).exists()
+
+        with sdb.SolutionDatabase(db_path) as db:
+            assert db.n_card_sets == len(card_sets)
+            for target, cards in [(100, [1, 2, 3, 100]), (97, [3, 1, 100, 2]),
+                                  (11, [1, 1, 2, 2]), (119, [1, 1, 2, 2])]:
+                all_solutions = cs.all_solutions_from_cmd(
+                    "./tree-solve", target, cards
+                )
+                entry = db.lookup(target, cards)
+                if all_solutions:
+                    assert entry.n_solutions == len(all_solutions)
+                    assert entry.first_solution == all_solutions[0]
+                else:
+                    assert entry is None
+
+            with pytest.raises(KeyError):
+                db.lookup(100, [1, 1, 1, 1])
+            with pytest.raises(KeyError):
+                db.lookup(121, [1, 1, 2, 2])
+
+        result = CliRunner().invoke(
+            sdb.cli, ["lookup", "--db", str(db_path), "121", "1", "1", "2", "2"]
+        )
+        assert result.exit_code == 1
+        assert "not in database" in result.output
+
+    def test_resume(self, tmp_path):
+        db_path = tmp_path / "solutions.db"
+        card_sets = sdb.all_card_sets(4, [25, 100], [1, 2])
+        sharded_card_sets = sdb.shard_card_sets(card_sets, 2)
+
+        # As if interrupted after building the first shard; resuming
+        # must not re-build it.
+        sdb.shards_dir_path(db_path).mkdir()
+        sdb.check_build_params(
+            db_path, sdb.build_params(card_sets, 100, 150, 2)
+        )
+        sdb.build_shard(
+            "./tree-solve", db_path, 0, sharded_card_sets[0], 100, 150
+        )
+        reports = []
+        sdb.build_database(
+            "./tree-solve", db_path, card_sets, 100, 150, n_shards=2,
+            report_fun=lambda *args: reports.append(args),
+        )
+        assert reports == [(0, 2, False), (1, 2, True)]
+
+        with sdb.SolutionDatabase(db_path) as db:
+            entry = db.lookup(125, [25, 100, 1, 2])
+            assert entry.n_solutions == len(
+                cs.all_solutions_from_cmd("./tree-solve", 125, [25, 100, 1, 2])
+            )
+
+    @pytest.mark.parametrize(
+        "max_target, n_shards", [(150, 3), (160, 2)]
+    )
+    def test_resume_different_params(self, tmp_path, max_target, n_shards):
+        db_path = tmp_path / "solutions.db"
+        card_sets = sdb.all_card_sets(4, [25, 100], [1, 2])
+        sdb.shards_dir_path(db_path).mkdir()
+        sdb.check_build_params(
+            db_path, sdb.build_params(card_sets, 100, 150, 2)
+        )
+        sdb.build_shard(
+            "./tree-solve", db_path, 0,
+            sdb.shard_card_sets(card_sets, 2)[0], 100, 150,
+        )
+        with pytest.raises(click.ClickException):
+            sdb.build_database(
+                "./tree-solve", db_path, card_sets, 100, max_target,
+                n_shards=n_shards,
+            )
+        assert not db_path.exists()
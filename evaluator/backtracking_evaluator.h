@@ -0,0 +1,188 @@
+/*
+  Copyright 2022 Ben North
+
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful, but
+  WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+  General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see https://www.gnu.org/licenses/
+*/
+
+#pragma once
+
+#include <algorithm>
+#include <stdexcept>
+#include "evaluator.h"
+
+// Evaluator for flat-layout programs which, instead of copying itself
+// for each choice of non-inverted inputs to an operation, modifies one
+// operand stack and one list of concrete instructions in place, and
+// undoes its changes on the way back.  The output is a template
+// parameter, so it can be called directly rather than through a
+// `std::function`.  It is called with an Evaluator holding the state,
+// so the same output functions work as for `Evaluator::all_valid()`,
+// and the programs run, and their order, are exactly the same.
+template<class Output>
+struct BacktrackingEvaluator {
+  Evaluator state;
+  Output & output;
+
+  BacktrackingEvaluator(
+    const int * cards,
+    Output & output,
+    bool invert_binops = false
+  )
+    : state(nullptr, cards, no_output_, invert_binops)
+    , output(output)
+  {}
+
+  // Run the program starting at `program`, returning a pointer to the
+  // start of the next one.
+  const uint8_t * all_valid(const uint8_t * program)
+  {
+    EVALUATOR_COUNT(n_programs);
+    all_valid_from_(program);
+
+    while (!is_return(*program++))
+      ;
+    return program;
+  }
+
+  // Run all programs, up to the extra Return after the last one.
+  void all_valid_programs(const uint8_t * programs)
+  {
+    while (!is_return(*programs))
+      programs = all_valid(programs);
+  }
+
+private:
+  static inline const Evaluator::output_function_t no_output_{};
+
+  // Run the rest of a program, leaving `state` as it was found.
+  void all_valid_from_(const uint8_t * instruction_ptr)
+  {
+    auto & operands{state.operands};
+    auto & concrete_instructions{state.concrete_instructions};
+    const size_t n_operands{operands.size()};
+    const size_t n_concrete_instructions{concrete_instructions.size()};
+
+    bool program_finished{false};
+    while (!program_finished)
+    {
+      const Opcode instruction{
+        unpack_opcode(*instruction_ptr++, state.invert_binops)
+      };
+      EVALUATOR_COUNT(n_opcodes_executed);
+
+      switch (instruction.kind)
+      {
+      case OpcodeKind::Value:
+        operands.push_back(state.cards[instruction.arg0]);
+        concrete_instructions.push_back(instruction);
+        break;
+
+      case OpcodeKind::MultiplyN:
+        all_valid_binop_<OpcodeKind::MultiplyN>(instruction.arg0, instruction_ptr);
+        program_finished = true;
+        break;
+
+      case OpcodeKind::AddN:
+        all_valid_binop_<OpcodeKind::AddN>(instruction.arg0, instruction_ptr);
+        program_finished = true;
+        break;
+
+      case OpcodeKind::Return:
+        concrete_instructions.push_back(instruction);
+        EVALUATOR_COUNT(n_evaluations);
+        output(static_cast<const Evaluator &>(state));
+        program_finished = true;
+        break;
+
+      default:
+        // Error.
+        program_finished = true;
+        break;
+      }
+    }
+
+    operands.erase(operands.begin() + n_operands, operands.end());
+    concrete_instructions.erase(
+      concrete_instructions.begin() + n_concrete_instructions,
+      concrete_instructions.end());
+  }
+
+  template<OpcodeKind Kind>
+  void all_valid_binop_(uint8_t n_args, const uint8_t * next_instruction_ptr)
+  {
+    using op_traits = operator_traits<Kind>;
+    auto & operands{state.operands};
+
+    // As in Evaluator, bit 0 of the mask is for the top of the stack,
+    // which is the last of `args`.
+    const size_t n_others{operands.size() - n_args};
+    int args[16];
+    std::copy(operands.begin() + n_others, operands.end(), args);
+
+    EVALUATOR_COUNT_N(n_masks_tried, (1U << n_args) - 1);
+
+    for (int i = 0; i != n_args; ++i)
+      if (!op_traits::operand_is_valid(args[i])) {
+        EVALUATOR_COUNT_N(n_masks_operand_invalid, (1U << n_args) - 1);
+        return;
+      }
+
+    operands.erase(operands.begin() + n_others, operands.end());
+
+    for (
+      unsigned non_inv_mask = 1;
+      non_inv_mask != (1U << n_args);
+      ++non_inv_mask
+    ) {
+      int non_inverting_input;
+      int inverting_input;
+      accumulate_inputs<Kind>(
+        args, n_args, non_inv_mask, non_inverting_input, inverting_input);
+
+      if (!op_traits::operation_is_valid(non_inverting_input, inverting_input)) {
+        EVALUATOR_COUNT(n_masks_operation_invalid);
+        continue;
+      }
+
+      operands.push_back(op_traits::result(non_inverting_input, inverting_input));
+      state.concrete_instructions.push_back(
+        { Kind, n_args, static_cast<uint8_t>(non_inv_mask) }
+      );
+
+      all_valid_from_(next_instruction_ptr);
+
+      state.concrete_instructions.pop_back();
+      operands.pop_back();
+    }
+
+    operands.insert(operands.end(), args, args + n_args);
+  }
+};
+
+// Run every program in `programs`, which must be in the flat layout,
+// both as packed and with binops inverted, with a BacktrackingEvaluator.
+template<class Output>
+void all_valid_backtracking(
+  const ProgramSet & programs,
+  const int * cards,
+  Output & output
+) {
+  if (programs.layout != ProgramLayout::Flat)
+    throw std::invalid_argument("backtracking evaluator needs flat layout");
+
+  for (bool invert_binops : {false, true}) {
+    BacktrackingEvaluator<Output> evaluator{cards, output, invert_binops};
+    evaluator.all_valid_programs(programs.packed_opcodes);
+  }
+}
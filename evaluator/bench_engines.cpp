@@ -0,0 +1,169 @@
+/*
+  Copyright 2022 Ben North
+
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful, but
+  WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+  General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see https://www.gnu.org/licenses/
+*/
+
+// Compare the copying Evaluator with the BacktrackingEvaluator and the
+// LockstepEvaluator, on a fixed, seeded set of random games and a
+// flat-layout program file.
+
+#include <vector>
+#include <string>
+#include <iostream>
+#include <iomanip>
+#include <chrono>
+#include <cstdlib>
+
+#include "evaluator.h"
+#include "backtracking_evaluator.h"
+#include "lockstep_evaluator.h"
+#include "bench_games.h"
+
+// Count solutions, and combine each game's solutions' values and
+// concrete instructions into a checksum, so the engines can be checked
+// to agree.
+struct SolutionTally {
+  const std::vector<Game> & games;
+  size_t n_solutions{0};
+  std::vector<uint64_t> game_checksums;
+
+  SolutionTally(const std::vector<Game> & games)
+    : games(games)
+    , game_checksums(games.size(), 0)
+  {}
+
+  void operator()(size_t game_idx, const Evaluator & e)
+  {
+    if (e.value() != games[game_idx].target)
+      return;
+    ++n_solutions;
+    uint64_t & checksum{game_checksums[game_idx]};
+    for (const Opcode & opcode : e.concrete_instructions)
+      checksum = checksum * 1000003
+        + ((static_cast<unsigned>(opcode.kind) << 16)
+           | (opcode.arg0 << 8)
+           | opcode.arg1);
+  }
+
+  uint64_t checksum() const
+  {
+    uint64_t checksum{0};
+    for (uint64_t game_checksum : game_checksums)
+      checksum = checksum * 1000003 + game_checksum;
+    return checksum;
+  }
+};
+
+template<class RunGames>
+static SolutionTally bench_engine_(
+  const std::string & name,
+  const std::vector<Game> & games,
+  RunGames run_games
+) {
+  SolutionTally tally{games};
+
+  const auto t0{std::chrono::steady_clock::now()};
+  run_games(tally);
+  const std::chrono::duration<double> elapsed{
+    std::chrono::steady_clock::now() - t0
+  };
+
+  std::cout << std::setw(14) << name
+            << std::fixed << std::setprecision(3)
+            << std::setw(10) << elapsed.count() << "s"
+            << std::setw(10) << tally.n_solutions << " solutions"
+            << "  checksum " << std::hex << tally.checksum() << std::dec << "\n";
+
+  return tally;
+}
+
+int main(int argc, char ** argv)
+{
+  size_t n_games{100};
+  unsigned seed{42};
+  std::string path;
+
+  for (int i = 1; i != argc; ++i) {
+    const std::string arg{argv[i]};
+    if (arg == "--games" && i + 1 != argc)
+      n_games = std::stoul(argv[++i]);
+    else if (arg == "--seed" && i + 1 != argc)
+      seed = std::stoul(argv[++i]);
+    else if (path.empty())
+      path = arg;
+    else
+      path.clear(), i = argc;
+  }
+
+  if (path.empty()) {
+    std::cerr << "Usage: bench-engines [--games N] [--seed S] PROGRAM_FILE\n";
+    return EXIT_FAILURE;
+  }
+
+  try {
+    MappedProgramFile program_file{path};
+    const ProgramSet & programs{program_file.programs()};
+    const auto games{random_games(n_games, programs.n_cards, seed)};
+
+    const auto copying{bench_engine_(
+      "copying", games,
+      [&](SolutionTally & tally)
+      {
+        for (size_t game_idx = 0; game_idx != games.size(); ++game_idx) {
+          const Evaluator::output_function_t output{
+            [&tally, game_idx](const Evaluator & e) { tally(game_idx, e); }
+          };
+          all_valid(programs, games[game_idx].cards.data(), output);
+        }
+      })};
+
+    const auto backtracking{bench_engine_(
+      "backtracking", games,
+      [&](SolutionTally & tally)
+      {
+        for (size_t game_idx = 0; game_idx != games.size(); ++game_idx) {
+          auto output{
+            [&tally, game_idx](const Evaluator & e) { tally(game_idx, e); }
+          };
+          all_valid_backtracking(programs, games[game_idx].cards.data(), output);
+        }
+      })};
+
+    const auto lockstep{bench_engine_(
+      "lockstep", games,
+      [&](SolutionTally & tally)
+      {
+        std::vector<const int *> all_cards;
+        std::vector<int> targets;
+        for (const auto & game : games) {
+          all_cards.push_back(game.cards.data());
+          targets.push_back(game.target);
+        }
+        all_valid_lockstep(programs, all_cards, tally, targets.data());
+      })};
+
+    for (const auto * tally : {&backtracking, &lockstep})
+      if (tally->n_solutions != copying.n_solutions
+          || tally->checksum() != copying.checksum()) {
+        std::cerr << "bench-engines: engines disagree\n";
+        return EXIT_FAILURE;
+      }
+  } catch (const std::exception & e) {
+    std::cerr << "bench-engines: " << e.what() << "\n";
+    return EXIT_FAILURE;
+  }
+
+  return 0;
+}
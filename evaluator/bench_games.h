@@ -0,0 +1,47 @@
+/*
+  Copyright 2022 Ben North
+
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful, but
+  WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+  General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see https://www.gnu.org/licenses/
+*/
+
+// Fixed, seeded sets of random games, for benchmarks.
+
+#pragma once
+
+#include <vector>
+#include <random>
+
+struct Game {
+  int target;
+  std::vector<int> cards;
+};
+
+inline std::vector<Game> random_games(size_t n_games, int n_cards, unsigned seed)
+{
+  static const std::vector<int> all_cards{
+    25, 50, 75, 100, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10
+  };
+
+  std::mt19937 rng{seed};
+  std::uniform_int_distribution<size_t> card_idx{0, all_cards.size() - 1};
+  std::uniform_int_distribution<int> target{100, 999};
+
+  std::vector<Game> games(n_games);
+  for (auto & game : games) {
+    game.target = target(rng);
+    for (int i = 0; i != n_cards; ++i)
+      game.cards.push_back(all_cards[card_idx(rng)]);
+  }
+  return games;
+}
@@ -0,0 +1,106 @@
+/*
+  Copyright 2022 Ben North
+
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful, but
+  WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+  General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see https://www.gnu.org/licenses/
+*/
+
+// Compare program layouts on a fixed, seeded set of random games, by
+// time taken and by number of opcodes executed.
+
+#include <vector>
+#include <string>
+#include <iostream>
+#include <iomanip>
+#include <chrono>
+#include <cstdlib>
+
+#include "evaluator.h"
+#include "bench_games.h"
+
+static void bench_layout_(
+  const std::string & path,
+  const std::vector<Game> & games,
+  bool skip_duplicate_choices
+) {
+  MappedProgramFile program_file{path};
+  const ProgramSet & programs{program_file.programs()};
+
+  size_t n_solutions{0};
+  int target{};
+  Evaluator::output_function_t count_if_match{
+    [&n_solutions, &target](const Evaluator & e)
+    {
+      if (e.value() == target)
+        ++n_solutions;
+    }
+  };
+
+  evaluator_stats = {};
+  const auto t0{std::chrono::steady_clock::now()};
+
+  for (const auto & game : games) {
+    target = game.target;
+    all_valid(programs, game.cards.data(), count_if_match, skip_duplicate_choices);
+  }
+
+  const std::chrono::duration<double> elapsed{
+    std::chrono::steady_clock::now() - t0
+  };
+
+  std::cout << std::setw(30) << path
+            << std::fixed << std::setprecision(3)
+            << std::setw(10) << elapsed.count() << "s"
+            << std::setw(12) << (evaluator_stats.n_opcodes_executed / games.size())
+            << " opcodes/game"
+            << std::setw(8) << n_solutions << " solutions\n";
+}
+
+int main(int argc, char ** argv)
+{
+  if (argc < 2) {
+    std::cerr << "Usage: bench-layouts [--games N] [--seed S]"
+                 " [--skip-duplicate-choices] PROGRAM_FILE...\n";
+    return EXIT_FAILURE;
+  }
+
+  size_t n_games{100};
+  unsigned seed{42};
+  bool skip_duplicate_choices{false};
+  std::vector<std::string> paths;
+
+  for (int i = 1; i != argc; ++i) {
+    const std::string arg{argv[i]};
+    if (arg == "--games" && i + 1 != argc)
+      n_games = std::stoul(argv[++i]);
+    else if (arg == "--seed" && i + 1 != argc)
+      seed = std::stoul(argv[++i]);
+    else if (arg == "--skip-duplicate-choices")
+      skip_duplicate_choices = true;
+    else
+      paths.push_back(arg);
+  }
+
+  try {
+    const int n_cards{MappedProgramFile{paths.front()}.programs().n_cards};
+    const auto games{random_games(n_games, n_cards, seed)};
+
+    for (const auto & path : paths)
+      bench_layout_(path, games, skip_duplicate_choices);
+  } catch (const std::exception & e) {
+    std::cerr << "bench-layouts: " << e.what() << "\n";
+    return EXIT_FAILURE;
+  }
+
+  return 0;
+}
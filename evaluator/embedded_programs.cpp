@@ -0,0 +1,27 @@
+/*
+  Copyright 2022 Ben North
+
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful, but
+  WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+  General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see https://www.gnu.org/licenses/
+*/
+
+#include "programs-6-cards.h"
+#include "program_file.h"
+
+const ProgramSet & embedded_programs()
+{
+  static const ProgramSet programs{
+    program_set_from_bytes(programs_6_cards_bin, programs_6_cards_bin_len)
+  };
+  return programs;
+}
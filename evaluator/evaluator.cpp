@@ -15,74 +15,32 @@
   along with this program.  If not, see https://www.gnu.org/licenses/
 */
 
-#include <array>
-#include <cstddef>
-#include "programs-6-cards.h"
+#include <algorithm>
+#include <vector>
 #include "evaluator.h"
 
-static const uint8_t * programs_6_cards_bin_end
-  = programs_6_cards_bin + programs_6_cards_bin_len;
-
-static std::array<Opcode, programs_6_cards_bin_len * 2> all_programs_;
-
-const uint8_t * all_packed_programs()
+EvaluatorStats & EvaluatorStats::operator+=(const EvaluatorStats & other)
 {
-  return programs_6_cards_bin;
+  n_programs += other.n_programs;
+  n_opcodes_executed += other.n_opcodes_executed;
+  n_masks_tried += other.n_masks_tried;
+  n_masks_operand_invalid += other.n_masks_operand_invalid;
+  n_masks_operation_invalid += other.n_masks_operation_invalid;
+  n_evaluations += other.n_evaluations;
+  return *this;
 }
 
-size_t n_packed_opcodes()
-{
-  return programs_6_cards_bin_len;
-}
-
-const Opcode * all_programs()
-{
-  static Opcode * programs{([]()
-    {
-      Opcode * opcode = &(all_programs_[0]);
-
-      for (
-        const uint8_t * packed_opcode = programs_6_cards_bin;
-        packed_opcode != programs_6_cards_bin_end;
-        ++packed_opcode
-      ) {
-        *opcode++ = {
-          static_cast<OpcodeKind>(*packed_opcode >> 4),
-          static_cast<uint8_t>(*packed_opcode & 0x0f),
-          0
-        };
-      }
-
-      // Prepare to overwrite second Return:
-      --opcode;
-
-      for (
-        const uint8_t * packed_opcode = programs_6_cards_bin;
-        packed_opcode != programs_6_cards_bin_end;
-        ++packed_opcode
-      ) {
-        *opcode++ = {
-          other_binop(static_cast<OpcodeKind>(*packed_opcode >> 4)),
-          static_cast<uint8_t>(*packed_opcode & 0x0f),
-          0
-        };
-      }
-
-      return &(all_programs_[0]);
-    })()};
-
-  return programs;
-}
-
-
-////////////////////////////////////////////////////////////////////////
+#ifdef EVALUATOR_STATS
+thread_local EvaluatorStats evaluator_stats{};
+#endif
 
 bool Evaluator::all_valid()
 {
   auto program_finished{false};
   while (!program_finished)
   {
-    Opcode instruction{*instructions++};
+    Opcode instruction{unpack_opcode(*instructions++, invert_binops)};
+    EVALUATOR_COUNT(n_opcodes_executed);
 
     switch (instruction.kind)
     {
@@ -104,7 +62,7 @@ bool Evaluator::all_valid()
 
       // Skip rest of program; individual "child" Evaluators will have
       // processed it.
-      while (instructions++->kind != OpcodeKind::Return)
+      while (!is_return(*instructions++))
         ;
 
       program_finished = true;
@@ -112,6 +70,7 @@ bool Evaluator::all_valid()
 
     case OpcodeKind::Return:
       concrete_instructions.push_back(instruction);
+      EVALUATOR_COUNT(n_evaluations);
       output(*this);
       program_finished = true;
       break;
@@ -125,7 +84,7 @@ bool Evaluator::all_valid()
   clear();
 
   // Return value indicates whether there's a double-Return.
-  return (instructions->kind != OpcodeKind::Return);
+  return !is_return(*instructions);
 }
 
 void Evaluator::all_valid(Opcode instruction, unsigned non_inv_mask) {
@@ -152,3 +111,264 @@ bool Evaluator::is_clear() const
     && (concrete_instructions.size() == 0)
   );
 }
+
+////////////////////////////////////////////////////////////////////////
+
+const uint8_t * TrieEvaluator::all_valid(const uint8_t * node)
+{
+  const Opcode instruction{unpack_opcode(*node, state.invert_binops)};
+  const uint8_t * n_children_ptr{node + 1};
+  const uint8_t * end;
+  EVALUATOR_COUNT(n_opcodes_executed);
+
+  switch (instruction.kind)
+  {
+  case OpcodeKind::Value:
+    state.operands.push_back(state.cards[instruction.arg0]);
+    state.concrete_instructions.push_back(instruction);
+    end = all_valid_children(n_children_ptr);
+    state.concrete_instructions.pop_back();
+    state.operands.pop_back();
+    return end;
+
+  case OpcodeKind::MultiplyN:
+    return all_valid_binop<OpcodeKind::MultiplyN>(instruction.arg0, n_children_ptr);
+
+  case OpcodeKind::AddN:
+    return all_valid_binop<OpcodeKind::AddN>(instruction.arg0, n_children_ptr);
+
+  case OpcodeKind::Return:
+    state.concrete_instructions.push_back(instruction);
+    EVALUATOR_COUNT(n_evaluations);
+    state.output(state);
+    state.concrete_instructions.pop_back();
+    return node + 1;
+
+  default:
+    // Error.
+    return node + 1;
+  }
+}
+
+const uint8_t * TrieEvaluator::all_valid_children(const uint8_t * n_children_ptr)
+{
+  const uint8_t n_children{*n_children_ptr};
+  const uint8_t * child{n_children_ptr + 1};
+  for (uint8_t i = 0; i != n_children; ++i)
+    child = all_valid(child);
+  return child;
+}
+
+template<OpcodeKind Kind>
+const uint8_t * TrieEvaluator::all_valid_binop(
+  uint8_t n_args,
+  const uint8_t * n_children_ptr
+) {
+  using op_traits = operator_traits<Kind>;
+  auto & operands{state.operands};
+
+  // As in Evaluator, bit 0 of the mask is for the top of the stack,
+  // which is the last of `args`.
+  const size_t n_others{operands.size() - n_args};
+  int args[16];
+  std::copy(operands.begin() + n_others, operands.end(), args);
+
+  EVALUATOR_COUNT_N(n_masks_tried, (1U << n_args) - 1);
+
+  for (int i = 0; i != n_args; ++i)
+    if (!op_traits::operand_is_valid(args[i])) {
+      EVALUATOR_COUNT_N(n_masks_operand_invalid, (1U << n_args) - 1);
+      return skip_children(n_children_ptr);
+    }
+
+  const uint8_t * end{nullptr};
+  for (
+    unsigned non_inv_mask = 1;
+    non_inv_mask != (1U << n_args);
+    ++non_inv_mask
+  ) {
+    int non_inverting_input;
+    int inverting_input;
+    accumulate_inputs<Kind>(
+      args, n_args, non_inv_mask, non_inverting_input, inverting_input);
+
+    if (!op_traits::operation_is_valid(non_inverting_input, inverting_input)) {
+      EVALUATOR_COUNT(n_masks_operation_invalid);
+      continue;
+    }
+
+    operands.resize(n_others);
+    operands.push_back(op_traits::result(non_inverting_input, inverting_input));
+    state.concrete_instructions.push_back(
+      { Kind, n_args, static_cast<uint8_t>(non_inv_mask) }
+    );
+
+    end = all_valid_children(n_children_ptr);
+
+    state.concrete_instructions.pop_back();
+  }
+
+  operands.resize(n_others);
+  operands.insert(operands.end(), args, args + n_args);
+
+  return (end != nullptr) ? end : skip_children(n_children_ptr);
+}
+
+const uint8_t * TrieEvaluator::skip(const uint8_t * node)
+{
+  return is_return(*node) ? (node + 1) : skip_children(node + 1);
+}
+
+const uint8_t * TrieEvaluator::skip_children(const uint8_t * n_children_ptr)
+{
+  const uint8_t n_children{*n_children_ptr};
+  const uint8_t * child{n_children_ptr + 1};
+  for (uint8_t i = 0; i != n_children; ++i)
+    child = skip(child);
+  return child;
+}
+
+
+////////////////////////////////////////////////////////////////////////
+
+static bool duplicates_earlier_choice_(
+  const std::vector<const uint8_t *> & earlier_choices,
+  const uint8_t * choice,
+  uint8_t n_used,
+  const int * cards
+) {
+  for (const uint8_t * earlier_choice : earlier_choices)
+    if (std::equal(
+          choice, choice + n_used,
+          earlier_choice,
+          [cards](uint8_t i, uint8_t j) { return cards[i] == cards[j]; }))
+      return true;
+  return false;
+}
+
+const uint8_t * first_template(const uint8_t * group)
+{
+  const uint8_t n_used{group[0]};
+  const unsigned n_choices = group[1] | (group[2] << 8);
+  return group + 3 + n_choices * n_used;
+}
+
+void all_valid_template_range(
+  const uint8_t * group,
+  const uint8_t * templates_begin,
+  const uint8_t * templates_end,
+  const int * cards,
+  const Evaluator::output_function_t & output,
+  bool invert_binops,
+  bool skip_duplicate_choices
+) {
+  // Longest program is 15 Values, 14 operations, and a Return; then
+  // the bound program needs an extra Return after it.
+  uint8_t bound_program[32];
+  Evaluator evaluator{bound_program, cards, output, invert_binops};
+
+  const uint8_t n_used{group[0]};
+  const uint8_t * const choices_end{first_template(group)};
+
+  std::vector<const uint8_t *> choices;
+  for (const uint8_t * p{group + 3}; p != choices_end; p += n_used)
+    if (!skip_duplicate_choices
+        || !duplicates_earlier_choice_(choices, p, n_used, cards))
+      choices.push_back(p);
+
+  const uint8_t * p{templates_begin};
+  while (p != templates_end)
+  {
+    const uint8_t * template_begin{p};
+    while (!is_return(*p++))
+      ;
+    const size_t template_size = p - template_begin;
+
+    for (const uint8_t * choice : choices)
+    {
+      for (size_t i = 0; i != template_size; ++i) {
+        const uint8_t u8{template_begin[i]};
+        bound_program[i] = ((u8 >> 4) == 0) ? choice[u8] : u8;
+      }
+      bound_program[template_size] = template_begin[template_size - 1];
+
+      evaluator.instructions = bound_program;
+      EVALUATOR_COUNT(n_programs);
+      evaluator.all_valid();
+    }
+  }
+}
+
+void all_valid_templates(
+  const uint8_t * templates_and_bindings,
+  const int * cards,
+  const Evaluator::output_function_t & output,
+  bool invert_binops,
+  bool skip_duplicate_choices
+) {
+  const uint8_t * group{templates_and_bindings};
+  while (*group != 0)
+  {
+    const uint8_t * templates_begin{first_template(group)};
+    const uint8_t * templates_end{templates_begin};
+    while (!is_return(*templates_end))
+      while (!is_return(*templates_end++))
+        ;
+
+    all_valid_template_range(
+      group,
+      templates_begin,
+      templates_end,
+      cards,
+      output,
+      invert_binops,
+      skip_duplicate_choices);
+
+    // Skip the extra Return ending this number of cards used.
+    group = templates_end + 1;
+  }
+}
+
+
+void all_valid(
+  const ProgramSet & programs,
+  const int * cards,
+  const Evaluator::output_function_t & output,
+  bool skip_duplicate_choices
+) {
+  for (bool invert_binops : {false, true})
+  {
+    switch (programs.layout)
+    {
+    case ProgramLayout::Flat:
+      {
+        Evaluator evaluator{programs.packed_opcodes, cards, output, invert_binops};
+
+        while (true)
+        {
+          EVALUATOR_COUNT(n_programs);
+          const auto more_follow = evaluator.all_valid();
+          if (!more_follow)
+            break;
+        }
+      }
+      break;
+
+    case ProgramLayout::Trie:
+      {
+        TrieEvaluator evaluator{cards, output, invert_binops};
+        evaluator.all_valid_children(programs.packed_opcodes);
+      }
+      break;
+
+    case ProgramLayout::Templates:
+      all_valid_templates(
+        programs.packed_opcodes,
+        cards,
+        output,
+        invert_binops,
+        skip_duplicate_choices);
+      break;
+    }
+  }
+}
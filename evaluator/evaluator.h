@@ -15,10 +15,14 @@
   along with this program.  If not, see https://www.gnu.org/licenses/
 */
 
+#pragma once
+
+#include <array>
 #include <cstdint>
 #include <cstddef>
 #include <functional>
 #include <boost/container/small_vector.hpp>
+#include "program_file.h"
 #ifdef EVALUATOR_PPRINT
 #include <vector>
 #include <string>
@@ -53,9 +57,55 @@ struct __attribute__ ((packed)) Opcode {
   uint8_t arg1;  // Non-inverted input mask for MultiplyN/AddN
 };
 
-const uint8_t * all_packed_programs();
-size_t n_packed_opcodes();
-const Opcode * all_programs();
+// Packed opcodes are one byte each, with the kind in the top four bits
+// and arg0 in the bottom four.  The packed programs all have AddN at
+// the root; the programs with MultiplyN at the root are got by running
+// them with binops inverted.
+inline Opcode unpack_opcode(uint8_t packed_opcode, bool invert_binops)
+{
+  const auto kind{static_cast<OpcodeKind>(packed_opcode >> 4)};
+  return {
+    invert_binops ? other_binop(kind) : kind,
+    static_cast<uint8_t>(packed_opcode & 0x0f),
+    0
+  };
+}
+
+inline bool is_return(uint8_t packed_opcode)
+{
+  return (packed_opcode >> 4) == static_cast<uint8_t>(OpcodeKind::Return);
+}
+
+
+// Counts of what the evaluators do, to see where their work goes.
+// A choice of non-inverted inputs to an operation ("mask") is tried,
+// then either pruned, because an operand or the operation is invalid,
+// or explored further.  Evaluators which check the operands once for
+// all masks count every mask as pruned by an invalid operand.
+// `n_programs` counts programs started with the flat and templates
+// layouts only, since trie-layout programs are not run one at a time.
+struct EvaluatorStats {
+  uint64_t n_programs;
+  uint64_t n_opcodes_executed;
+  uint64_t n_masks_tried;
+  uint64_t n_masks_operand_invalid;
+  uint64_t n_masks_operation_invalid;
+  uint64_t n_evaluations;
+
+  EvaluatorStats & operator+=(const EvaluatorStats & other);
+};
+
+// The counting is only compiled in if EVALUATOR_STATS is defined;
+// otherwise the macros expand to nothing.  Each thread counts in its
+// own `evaluator_stats`.
+#ifdef EVALUATOR_STATS
+extern thread_local EvaluatorStats evaluator_stats;
+#define EVALUATOR_COUNT(counter) (++evaluator_stats.counter)
+#define EVALUATOR_COUNT_N(counter, n) (evaluator_stats.counter += (n))
+#else
+#define EVALUATOR_COUNT(counter) ((void)0)
+#define EVALUATOR_COUNT_N(counter, n) ((void)0)
+#endif
 
 
 template<OpcodeKind Kind> struct operator_traits {};
@@ -76,20 +126,71 @@ template<> struct operator_traits<OpcodeKind::AddN> {
   static int result(int noninv, int inv) { return noninv - inv; }
 };
 
+// A value is an int, or, when evaluating several games in lockstep, a
+// std::array of one int per game, in which case each game's values are
+// combined separately.
+template<class OpTraits>
+inline void accumulate_value_(int & x, int a) { OpTraits::accumulate(x, a); }
+
+template<class OpTraits, size_t N>
+inline void accumulate_value_(std::array<int, N> & x, const std::array<int, N> & a)
+{
+  for (size_t i = 0; i != N; ++i)
+    OpTraits::accumulate(x[i], a[i]);
+}
+
+inline void fill_value_(int & x, int v) { x = v; }
+
+template<size_t N>
+inline void fill_value_(std::array<int, N> & x, int v) { x.fill(v); }
+
+// Split the `n_args` operands `args` of a `Kind` operation, the last of
+// which is the top of the stack, into its non-inverting and inverting
+// inputs, as chosen by `non_inv_mask`, whose bit 0 is for the top of
+// the stack, and accumulate each.  Every evaluator uses this, so they
+// all do the same arithmetic.
+template<OpcodeKind Kind, class Value>
+inline void accumulate_inputs(
+  const Value * args,
+  uint8_t n_args,
+  unsigned non_inv_mask,
+  Value & non_inverting_input,
+  Value & inverting_input
+) {
+  using op_traits = operator_traits<Kind>;
+  fill_value_(non_inverting_input, op_traits::identity);
+  fill_value_(inverting_input, op_traits::identity);
+
+  unsigned mask{1};
+  for (int i = n_args - 1; i >= 0; --i, mask <<= 1) {
+    Value & accumulator{
+      (non_inv_mask & mask) ? non_inverting_input : inverting_input
+    };
+    accumulate_value_<op_traits>(accumulator, args[i]);
+  }
+}
+
 
 struct Evaluator {
   using output_function_t = std::function<void(const Evaluator &)>;
 
   small_vector<int> operands;
-  const Opcode * instructions;
+  const uint8_t * instructions;
   const int * cards;
   const output_function_t & output;
+  bool invert_binops;
   small_vector<Opcode> concrete_instructions;
 
-  Evaluator(const Opcode * instructions, const int * cards, const output_function_t & output)
+  Evaluator(
+    const uint8_t * instructions,
+    const int * cards,
+    const output_function_t & output,
+    bool invert_binops = false
+  )
     : instructions(instructions)
     , cards(cards)
     , output(output)
+    , invert_binops(invert_binops)
   {}
 
   Evaluator(const Evaluator & rhs)
@@ -97,6 +198,7 @@ struct Evaluator {
     , instructions(rhs.instructions)
     , cards(rhs.cards)
     , output(rhs.output)
+    , invert_binops(rhs.invert_binops)
     , concrete_instructions(rhs.concrete_instructions)
   {}
 
@@ -126,27 +228,102 @@ struct Evaluator {
 };
 
 
+// Evaluator for programs in the prefix-trie layout.  A trie node is a
+// packed opcode, followed (unless it is a Return) by the number of
+// children it has, and then each child node.  The whole trie is the
+// number of root nodes followed by each root node.
+//
+// Walking the trie depth-first, the operand stack for each prefix is
+// computed once and then shared by all programs with that prefix.
+// The stack is modified in place and restored on the way back up.
+// The state, which is what `output` sees, is held in an Evaluator so
+// that the same output functions work for both layouts.
+struct TrieEvaluator {
+  Evaluator state;
+
+  TrieEvaluator(
+    const int * cards,
+    const Evaluator::output_function_t & output,
+    bool invert_binops = false
+  )
+    : state(nullptr, cards, output, invert_binops)
+  {}
+
+  // Each of these returns a pointer just past what it walked or
+  // skipped.
+  const uint8_t * all_valid(const uint8_t * node);
+  const uint8_t * all_valid_children(const uint8_t * n_children_ptr);
+
+  template<OpcodeKind Kind>
+  const uint8_t * all_valid_binop(uint8_t n_args, const uint8_t * n_children_ptr);
+
+  static const uint8_t * skip(const uint8_t * node);
+  static const uint8_t * skip_children(const uint8_t * n_children_ptr);
+};
+
+
+// Run every program in the templates layout, binding each template to
+// each choice of cards in turn.  If `skip_duplicate_choices`, choices
+// which would give the same card values as an earlier choice are
+// skipped; otherwise the programs run, and their order, are exactly as
+// for the flat layout.
+void all_valid_templates(
+  const uint8_t * templates_and_bindings,
+  const int * cards,
+  const Evaluator::output_function_t & output,
+  bool invert_binops,
+  bool skip_duplicate_choices
+);
+
+// The templates layout is a sequence of groups, each of the number of
+// cards used, the choices of that many cards, and the templates, and
+// this is the first template of the group starting at `group`.
+const uint8_t * first_template(const uint8_t * group);
+
+// Run the templates from `templates_begin` to `templates_end`, all in
+// the group starting at `group`, as `all_valid_templates()` would.
+void all_valid_template_range(
+  const uint8_t * group,
+  const uint8_t * templates_begin,
+  const uint8_t * templates_end,
+  const int * cards,
+  const Evaluator::output_function_t & output,
+  bool invert_binops,
+  bool skip_duplicate_choices
+);
+
+
+// Run every program in `programs`, both as packed and with binops
+// inverted, calling `output` for each valid evaluation.  Skipping
+// duplicate choices of cards only applies to the templates layout.
+void all_valid(
+  const ProgramSet & programs,
+  const int * cards,
+  const Evaluator::output_function_t & output,
+  bool skip_duplicate_choices = false
+);
+
+
 template<OpcodeKind Kind>
 void Evaluator::all_valid(uint8_t n_args, unsigned non_inv_mask)
 {
   using op_traits = operator_traits<Kind>;
-  int inverting_input{op_traits::identity};
-  int non_inverting_input{op_traits::identity};
 
-  unsigned mask{1};
-  for (int i = 0; i != n_args; ++i, mask <<= 1) {
-    const int value = operands.back();
-    operands.pop_back();
+  EVALUATOR_COUNT(n_masks_tried);
 
-    if (!op_traits::operand_is_valid(value))
+  const size_t n_others{operands.size() - n_args};
+  const int * args{operands.data() + n_others};
+  for (int i = 0; i != n_args; ++i)
+    if (!op_traits::operand_is_valid(args[i])) {
+      EVALUATOR_COUNT(n_masks_operand_invalid);
       return;
+    }
 
-    int & accumulator{
-      (non_inv_mask & mask) ? non_inverting_input : inverting_input
-    };
-
-    op_traits::accumulate(accumulator, value);
-  }
+  int non_inverting_input;
+  int inverting_input;
+  accumulate_inputs<Kind>(
+    args, n_args, non_inv_mask, non_inverting_input, inverting_input);
+  operands.resize(n_others);
 
   if (op_traits::operation_is_valid(non_inverting_input, inverting_input))
   {
@@ -160,6 +337,8 @@ void Evaluator::all_valid(uint8_t n_args, unsigned non_inv_mask)
 
     all_valid();
   }
+  else
+    EVALUATOR_COUNT(n_masks_operation_invalid);
 }
 
 #ifdef EVALUATOR_PPRINT
@@ -18,45 +18,403 @@
 #include <vector>
 #include <string>
 #include <iostream>
+#include <sstream>
+#include <memory>
 #include <cstdlib>
+#include <stdexcept>
+#include <chrono>
+#include <getopt.h>
 
 #include "evaluator.h"
-#include "programs-6-cards.h"
+#include "parallel_evaluator.h"
+#include "reachable_values.h"
 
+static const char * usage_
+  = "Usage: evaluator-cli [OPTIONS] TARGET CARD_1 CARD_2 ... CARD_N\n"
+    "       evaluator-cli [OPTIONS] --all-targets CARD_1 CARD_2 ... CARD_N\n"
+    "       evaluator-cli [OPTIONS] --batch\n"
+    "\n"
+    "Options:\n"
+    "      --all-targets    instead of solving for one target, print\n"
+    "                       'VALUE N_SOLUTIONS FIRST_SOLUTION' for each\n"
+    "                       value up to --max-value which can be reached;\n"
+    "                       with --batch, lines have only cards\n"
+    "      --max-value N    largest value for --all-targets (default 999)\n"
+    "      --batch          read games, one 'TARGET CARD_1 ... CARD_N'\n"
+    "                       per line, from stdin, and end each game's\n"
+    "                       solutions with a blank line\n"
+    "      --binary         write each solution as a one-byte count of\n"
+    "                       opcodes followed by the opcodes, three bytes\n"
+    "                       each; end each game with a zero byte\n"
+    "  -j, --threads N      evaluate programs on N threads (default 1)\n"
+    "  -p, --programs FILE  program file to use (default\n"
+    "                       programs-N-cards.bin alongside evaluator-cli)\n"
+    "      --no-verify      do not verify the program file's checksum\n"
+    "      --skip-duplicate-choices\n"
+    "                       with a templates-layout program file, only\n"
+    "                       use one of several choices of cards which\n"
+    "                       have the same values\n"
+    "      --stats          after each game, write to stderr a line of JSON\n"
+    "                       with the time taken and the evaluators' counts\n"
+    "                       (needs evaluator-cli-stats, which is built with\n"
+    "                       EVALUATOR_STATS)\n";
 
-int main(int argc, char ** argv)
-{
-  if (argc < 2) {
-    std::cerr << "Usage: evaluator-cli TARGET CARD_1 CARD_2 ... CARD_N\n";
-    return EXIT_FAILURE;
-  }
+struct CliOptions {
+  std::string programs_path;
+  bool verify_checksum{true};
+  bool skip_duplicate_choices{false};
+  bool batch{false};
+  bool binary{false};
+  bool all_targets{false};
+  bool stats{false};
+  int max_value{999};
+  unsigned n_threads{1};
+  int target;
+  std::vector<int> cards;
+};
 
+struct Game {
+  int target;
   std::vector<int> cards;
+};
+
+static std::string default_programs_path_(const char * argv0, size_t n_cards)
+{
+  const std::string exe_path{argv0};
+  const auto last_slash{exe_path.rfind('/')};
+  const std::string exe_dir{
+    (last_slash == std::string::npos) ? "." : exe_path.substr(0, last_slash)
+  };
+  return exe_dir + "/programs-" + std::to_string(n_cards) + "-cards.bin";
+}
+
+static bool parse_options_(int argc, char ** argv, CliOptions & options)
+{
+  enum {
+    opt_no_verify = 256,
+    opt_skip_duplicate_choices,
+    opt_batch,
+    opt_binary,
+    opt_all_targets,
+    opt_max_value,
+    opt_stats
+  };
+  static const struct option long_options[]{
+    {"threads", required_argument, nullptr, 'j'},
+    {"programs", required_argument, nullptr, 'p'},
+    {"no-verify", no_argument, nullptr, opt_no_verify},
+    {"skip-duplicate-choices", no_argument, nullptr, opt_skip_duplicate_choices},
+    {"batch", no_argument, nullptr, opt_batch},
+    {"binary", no_argument, nullptr, opt_binary},
+    {"all-targets", no_argument, nullptr, opt_all_targets},
+    {"max-value", required_argument, nullptr, opt_max_value},
+    {"stats", no_argument, nullptr, opt_stats},
+    {nullptr, 0, nullptr, 0}
+  };
 
-  for (int i = 1; i != argc; ++i) {
-    std::string arg{argv[i]};
-    cards.push_back(std::stoi(arg));
+  int opt;
+  while ((opt = getopt_long(argc, argv, "j:p:", long_options, nullptr)) != -1) {
+    switch (opt) {
+    case 'j':
+      {
+        const int n_threads{std::stoi(optarg)};
+        if (n_threads < 1)
+          return false;
+        options.n_threads = n_threads;
+      }
+      break;
+    case 'p':
+      options.programs_path = optarg;
+      break;
+    case opt_no_verify:
+      options.verify_checksum = false;
+      break;
+    case opt_skip_duplicate_choices:
+      options.skip_duplicate_choices = true;
+      break;
+    case opt_batch:
+      options.batch = true;
+      break;
+    case opt_binary:
+      options.binary = true;
+      break;
+    case opt_all_targets:
+      options.all_targets = true;
+      break;
+    case opt_max_value:
+      options.max_value = std::stoi(optarg);
+      if (options.max_value < 1)
+        return false;
+      break;
+    case opt_stats:
+      options.stats = true;
+      break;
+    default:
+      return false;
+    }
   }
 
-  // The first 'card' is actually the target.
-  int target{cards.front()};
-  cards.erase(cards.begin());
+  // Reachable values are only written as text, by one thread.
+  if (options.all_targets && (options.binary || options.n_threads != 1))
+    return false;
+
+  // In batch mode, the games come from stdin instead.
+  if (options.batch)
+    return (optind == argc);
 
-  Evaluator::output_function_t emit_if_match{
-    [target](const Evaluator & e)
+  if (argc - optind < (options.all_targets ? 1 : 2))
+    return false;
+
+  // Unless finding all targets, the first 'card' is actually the
+  // target.
+  if (!options.all_targets)
+    options.target = std::stoi(argv[optind++]);
+  for (int i = optind; i != argc; ++i)
+    options.cards.push_back(std::stoi(argv[i]));
+
+  return true;
+}
+
+// Read the next non-blank line of 'TARGET CARD_1 ... CARD_N' (or, if
+// not `has_target`, just the cards), returning false at end of input.
+static bool read_game_(
+  std::istream & in,
+  bool has_target,
+  size_t & line_number,
+  Game & game
+) {
+  std::string line;
+  while (std::getline(in, line)) {
+    ++line_number;
+    std::istringstream fields{line};
+    std::vector<int> numbers;
+    int number;
+    while (fields >> number)
+      numbers.push_back(number);
+    if (!fields.eof())
+      throw std::runtime_error(
+        "line " + std::to_string(line_number) + ": bad number");
+    if (numbers.empty())
+      continue;
+    if (has_target && numbers.size() < 2)
+      throw std::runtime_error(
+        "line " + std::to_string(line_number) + ": no cards");
+    const auto cards_begin{numbers.begin() + (has_target ? 1 : 0)};
+    if (has_target)
+      game.target = numbers[0];
+    game.cards.assign(cards_begin, numbers.end());
+    return true;
+  }
+  return false;
+}
+
+static buffered_output_function_t append_if_match_(const int & target, bool binary)
+{
+  if (binary)
+    return [&target](const Evaluator & e, std::string & buffer)
     {
-      if (e.value() == target)
-        std::cout << e.pprint_concrete_flat() << "\n";
+      if (e.value() == target) {
+        const auto & instructions{e.concrete_instructions};
+        buffer.push_back(static_cast<char>(instructions.size()));
+        buffer.append(
+          reinterpret_cast<const char *>(instructions.data()),
+          instructions.size() * sizeof(Opcode));
+      }
+    };
+
+  return [&target](const Evaluator & e, std::string & buffer)
+  {
+    if (e.value() == target) {
+      buffer += e.pprint_concrete_flat();
+      buffer += "\n";
     }
   };
+}
 
-  Evaluator evaluator{all_programs(), cards.data(), emit_if_match};
+static void write_reachable_values_(
+  const ReachableValues & reachable_values,
+  const int * cards)
+{
+  for (int value = 1; value <= reachable_values.max_value(); ++value) {
+    const ReachableValue * reachable{reachable_values.find(value)};
+    if (reachable == nullptr)
+      continue;
+    std::cout << value << " " << reachable->n_solutions;
+    for (const auto & pprinted : pprint_opcodes(reachable->solutions, cards))
+      std::cout << " " << pprinted;
+    std::cout << "\n";
+  }
+}
 
-  while (true)
-  {
-    const auto more_follow = evaluator.all_valid();
-    if (!more_follow)
-      break;
+#ifdef EVALUATOR_STATS
+// One line of JSON giving the game, the seconds taken to solve it, and
+// the evaluators' counts.  With --all-targets, the target is null.
+static void write_stats_(
+  std::ostream & out,
+  const CliOptions & options,
+  const Game & game,
+  double seconds)
+{
+  std::ostringstream line;
+  line << "{\"target\": ";
+  if (options.all_targets)
+    line << "null";
+  else
+    line << game.target;
+  line << ", \"cards\": [";
+  for (size_t i = 0; i != game.cards.size(); ++i)
+    line << (i == 0 ? "" : ", ") << game.cards[i];
+  line << "], \"seconds\": " << seconds
+       << ", \"n_programs\": " << evaluator_stats.n_programs
+       << ", \"n_opcodes_executed\": " << evaluator_stats.n_opcodes_executed
+       << ", \"n_masks_tried\": " << evaluator_stats.n_masks_tried
+       << ", \"n_masks_operand_invalid\": "
+       << evaluator_stats.n_masks_operand_invalid
+       << ", \"n_masks_operation_invalid\": "
+       << evaluator_stats.n_masks_operation_invalid
+       << ", \"n_evaluations\": " << evaluator_stats.n_evaluations
+       << "}\n";
+  out << line.str();
+}
+#endif
+
+// Check the game is for the program file's number of cards, opening
+// the default program file for that number of cards if none is open
+// yet.
+static const ProgramSet & programs_for_game_(
+  CliOptions & options,
+  const char * argv0,
+  const Game & game,
+  std::unique_ptr<MappedProgramFile> & program_file)
+{
+  if (!program_file) {
+    if (options.programs_path.empty())
+      options.programs_path = default_programs_path_(argv0, game.cards.size());
+    program_file = std::make_unique<MappedProgramFile>(
+      options.programs_path,
+      options.verify_checksum);
+  }
+
+  const ProgramSet & programs{program_file->programs()};
+  if (static_cast<size_t>(programs.n_cards) != game.cards.size())
+    throw std::runtime_error(
+      options.programs_path + " is for " + std::to_string(programs.n_cards)
+      + " cards but " + std::to_string(game.cards.size()) + " were given");
+
+  return programs;
+}
+
+int main(int argc, char ** argv)
+{
+  CliOptions options;
+
+  try {
+    if (!parse_options_(argc, argv, options)) {
+      std::cerr << usage_;
+      return EXIT_FAILURE;
+    }
+
+#ifndef EVALUATOR_STATS
+    if (options.stats)
+      throw std::runtime_error(
+        "--stats needs a build with EVALUATOR_STATS (evaluator-cli-stats)");
+#endif
+
+    std::ios::sync_with_stdio(false);
+
+    // Open the program file once, however many games there are.
+    std::unique_ptr<MappedProgramFile> program_file;
+
+    Game game{options.target, options.cards};
+    const buffered_output_function_t append_if_match{
+      append_if_match_(game.target, options.binary)
+    };
+
+    // The threads are started once, and reused for every game.
+    ThreadPool thread_pool{options.n_threads};
+
+    // With one thread, write each solution as soon as it is found.
+    std::string solution_buffer;
+    const Evaluator::output_function_t emit_if_match{
+      [&append_if_match, &solution_buffer](const Evaluator & e)
+      {
+        append_if_match(e, solution_buffer);
+        std::cout << solution_buffer;
+        solution_buffer.clear();
+      }
+    };
+
+    auto solve_game{
+      [&](const ProgramSet & programs)
+      {
+        if (options.all_targets)
+          write_reachable_values_(
+            all_reachable_values(
+              programs,
+              game.cards.data(),
+              options.max_value,
+              false,
+              options.skip_duplicate_choices),
+            game.cards.data());
+        else if (options.n_threads == 1)
+          all_valid(
+            programs,
+            game.cards.data(),
+            emit_if_match,
+            options.skip_duplicate_choices);
+        else
+          std::cout << all_valid_parallel(
+            programs,
+            game.cards.data(),
+            append_if_match,
+            thread_pool,
+            options.skip_duplicate_choices);
+      }
+    };
+
+    // The program file is opened first, so the time to map and verify
+    // it is not counted in the first game's stats.
+    auto run_game{
+      [&]()
+      {
+        const ProgramSet & programs{
+          programs_for_game_(options, argv[0], game, program_file)
+        };
+#ifdef EVALUATOR_STATS
+        if (options.stats) {
+          evaluator_stats = {};
+          const auto t0{std::chrono::steady_clock::now()};
+          solve_game(programs);
+          const std::chrono::duration<double> elapsed{
+            std::chrono::steady_clock::now() - t0
+          };
+          write_stats_(std::cerr, options, game, elapsed.count());
+          return;
+        }
+#endif
+        solve_game(programs);
+      }
+    };
+
+    if (options.batch) {
+      size_t line_number{0};
+      while (read_game_(std::cin, !options.all_targets, line_number, game)) {
+        run_game();
+        if (options.binary)
+          std::cout.put(0);
+        else
+          std::cout << "\n";
+        std::cout.flush();
+      }
+    } else {
+      run_game();
+      if (options.binary)
+        std::cout.put(0);
+    }
+  } catch (const std::exception & e) {
+    std::cout.flush();
+    std::cerr << "evaluator-cli: " << e.what() << "\n";
+    return EXIT_FAILURE;
   }
 
   return 0;
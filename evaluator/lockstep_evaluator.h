@@ -0,0 +1,294 @@
+/*
+  Copyright 2022 Ben North
+
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful, but
+  WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+  General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see https://www.gnu.org/licenses/
+*/
+
+#pragma once
+
+#include <array>
+#include <vector>
+#include <stdexcept>
+#include "evaluator.h"
+
+// Evaluator for flat-layout programs which runs each program for up to
+// `NLanes` games at once.  The control flow of a program, that is, which
+// cards it uses, and the arity and non-inverted-input mask of each
+// operation, does not depend on the values of the cards, so only the
+// operand values and their validity are kept per game ("lane").  These
+// are held as arrays indexed by lane, which the compiler can
+// vectorise.  As in BacktrackingEvaluator, the one operand stack and
+// list of concrete instructions are changed in place and restored on
+// the way back, and a choice is only explored further if it is valid
+// for at least one lane.
+//
+// For each valid evaluation in each lane, `output(lane, state)` is
+// called, with `state` an Evaluator holding that lane's cards and
+// value and the (shared) concrete instructions.  Within each lane, the
+// evaluations are in the same order as from `Evaluator::all_valid()`.
+// If each lane is given a target, only evaluations giving the target
+// are output; all lanes' values are compared at once, which saves most
+// of the calls to `output`.
+template<class Output, size_t NLanes = 8>
+struct LockstepEvaluator {
+  using lane_values_t = std::array<int, NLanes>;
+
+  std::array<const int *, NLanes> lane_cards;
+  size_t n_lanes;
+  Output & output;
+  Evaluator state;
+
+  LockstepEvaluator(
+    const std::vector<const int *> & all_cards,
+    int n_cards,
+    Output & output,
+    bool invert_binops = false,
+    const int * targets = nullptr
+  )
+    : lane_cards{}
+    , n_lanes(all_cards.size())
+    , output(output)
+    , state(nullptr, nullptr, no_output_, invert_binops)
+    , filter_targets_(targets != nullptr)
+  {
+    if (n_lanes == 0 || n_lanes > NLanes)
+      throw std::invalid_argument("bad number of games for lockstep evaluator");
+
+    std::copy(all_cards.begin(), all_cards.end(), lane_cards.begin());
+
+    // Spare lanes repeat the first game, but are never valid.
+    for (size_t lane = 0; lane != NLanes; ++lane) {
+      const size_t game_lane{(lane < n_lanes) ? lane : 0};
+      const int * cards{lane_cards[game_lane]};
+      for (int i = 0; i != n_cards; ++i)
+        card_values_[i][lane] = cards[i];
+      all_lanes_valid_[lane] = (lane < n_lanes);
+      targets_[lane] = filter_targets_ ? targets[game_lane] : 0;
+    }
+  }
+
+  // Run the program starting at `program`, returning a pointer to the
+  // start of the next one.
+  const uint8_t * all_valid(const uint8_t * program)
+  {
+    all_valid_from_(program, all_lanes_valid_);
+
+    while (!is_return(*program++))
+      ;
+    return program;
+  }
+
+  // Run all programs, up to the extra Return after the last one.
+  void all_valid_programs(const uint8_t * programs)
+  {
+    while (!is_return(*programs))
+      programs = all_valid(programs);
+  }
+
+private:
+  static inline const Evaluator::output_function_t no_output_{};
+
+  lane_values_t card_values_[16];
+  lane_values_t all_lanes_valid_;
+  bool filter_targets_;
+  lane_values_t targets_;
+  lane_values_t operands_[16];
+  size_t n_operands_{0};
+
+  static bool any_(const lane_values_t & lane_flags)
+  {
+    int any{0};
+    for (size_t lane = 0; lane != NLanes; ++lane)
+      any |= lane_flags[lane];
+    return any != 0;
+  }
+
+  // Run the rest of a program, leaving the operands and concrete
+  // instructions as they were found.
+  void all_valid_from_(const uint8_t * instruction_ptr, const lane_values_t & valid)
+  {
+    auto & concrete_instructions{state.concrete_instructions};
+    const size_t n_operands{n_operands_};
+    const size_t n_concrete_instructions{concrete_instructions.size()};
+
+    bool program_finished{false};
+    while (!program_finished)
+    {
+      const Opcode instruction{
+        unpack_opcode(*instruction_ptr++, state.invert_binops)
+      };
+      EVALUATOR_COUNT(n_opcodes_executed);
+
+      switch (instruction.kind)
+      {
+      case OpcodeKind::Value:
+        operands_[n_operands_++] = card_values_[instruction.arg0];
+        concrete_instructions.push_back(instruction);
+        break;
+
+      case OpcodeKind::MultiplyN:
+        all_valid_binop_<OpcodeKind::MultiplyN>(
+          instruction.arg0, instruction_ptr, valid);
+        program_finished = true;
+        break;
+
+      case OpcodeKind::AddN:
+        all_valid_binop_<OpcodeKind::AddN>(
+          instruction.arg0, instruction_ptr, valid);
+        program_finished = true;
+        break;
+
+      case OpcodeKind::Return:
+        concrete_instructions.push_back(instruction);
+        output_valid_lanes_(valid);
+        program_finished = true;
+        break;
+
+      default:
+        // Error.
+        program_finished = true;
+        break;
+      }
+    }
+
+    n_operands_ = n_operands;
+    concrete_instructions.erase(
+      concrete_instructions.begin() + n_concrete_instructions,
+      concrete_instructions.end());
+  }
+
+  void output_valid_lanes_(const lane_values_t & valid)
+  {
+    const lane_values_t & values{operands_[n_operands_ - 1]};
+
+    lane_values_t wanted{valid};
+    if (filter_targets_) {
+      for (size_t lane = 0; lane != NLanes; ++lane)
+        wanted[lane] &= (values[lane] == targets_[lane]);
+      if (!any_(wanted))
+        return;
+    }
+
+    for (size_t lane = 0; lane != n_lanes; ++lane) {
+      if (!wanted[lane])
+        continue;
+      state.cards = lane_cards[lane];
+      state.operands.assign(1, values[lane]);
+      output(lane, static_cast<const Evaluator &>(state));
+    }
+    state.operands.clear();
+  }
+
+  template<OpcodeKind Kind>
+  void all_valid_binop_(
+    uint8_t n_args,
+    const uint8_t * next_instruction_ptr,
+    const lane_values_t & valid
+  ) {
+    using op_traits = operator_traits<Kind>;
+
+    // As in Evaluator, bit 0 of the mask is for the top of the stack,
+    // which is the last of `args`.
+    const size_t n_others{n_operands_ - n_args};
+    lane_values_t args[16];
+    std::copy(operands_ + n_others, operands_ + n_operands_, args);
+
+    lane_values_t args_valid{valid};
+    for (int i = 0; i != n_args; ++i)
+      for (size_t lane = 0; lane != NLanes; ++lane)
+        args_valid[lane] &= op_traits::operand_is_valid(args[i][lane]);
+    if (!any_(args_valid))
+      return;
+
+    n_operands_ = n_others + 1;
+    lane_values_t & result{operands_[n_others]};
+
+    for (
+      unsigned non_inv_mask = 1;
+      non_inv_mask != (1U << n_args);
+      ++non_inv_mask
+    ) {
+      lane_values_t non_inverting_input;
+      lane_values_t inverting_input;
+      accumulate_inputs<Kind>(
+        args, n_args, non_inv_mask, non_inverting_input, inverting_input);
+
+      // Invalid lanes get a result of 1, so they do no harm (such as
+      // dividing by zero) later on.
+      lane_values_t result_valid;
+      for (size_t lane = 0; lane != NLanes; ++lane) {
+        const int noninv{non_inverting_input[lane]};
+        const int inv{inverting_input[lane]};
+        result_valid[lane]
+          = args_valid[lane] & op_traits::operation_is_valid(noninv, inv);
+        result[lane] = result_valid[lane] ? op_traits::result(noninv, inv) : 1;
+      }
+      if (!any_(result_valid))
+        continue;
+
+      state.concrete_instructions.push_back(
+        { Kind, n_args, static_cast<uint8_t>(non_inv_mask) }
+      );
+
+      all_valid_from_(next_instruction_ptr, result_valid);
+
+      state.concrete_instructions.pop_back();
+    }
+
+    std::copy(args, args + n_args, operands_ + n_others);
+    n_operands_ = n_others + n_args;
+  }
+};
+
+// Run every program in `programs`, which must be in the flat layout,
+// both as packed and with binops inverted, for all the given games,
+// `NLanes` games at a time.  For each valid evaluation (or, if
+// `targets` is given, each one giving the game's target),
+// `output(game_idx, state)` is called.  The games must all have
+// `programs.n_cards` cards.
+template<size_t NLanes = 8, class Output>
+void all_valid_lockstep(
+  const ProgramSet & programs,
+  const std::vector<const int *> & all_cards,
+  Output & output,
+  const int * targets = nullptr
+) {
+  if (programs.layout != ProgramLayout::Flat)
+    throw std::invalid_argument("lockstep evaluator needs flat layout");
+
+  for (size_t game0 = 0; game0 < all_cards.size(); game0 += NLanes) {
+    const size_t game1{std::min(game0 + NLanes, all_cards.size())};
+    const std::vector<const int *> lane_cards(
+      all_cards.begin() + game0,
+      all_cards.begin() + game1);
+
+    auto lane_output{
+      [&output, game0](size_t lane, const Evaluator & e)
+      {
+        output(game0 + lane, e);
+      }
+    };
+
+    for (bool invert_binops : {false, true}) {
+      LockstepEvaluator<decltype(lane_output), NLanes> evaluator{
+        lane_cards,
+        programs.n_cards,
+        lane_output,
+        invert_binops,
+        (targets != nullptr) ? targets + game0 : nullptr
+      };
+      evaluator.all_valid_programs(programs.packed_opcodes);
+    }
+  }
+}
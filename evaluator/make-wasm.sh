@@ -30,4 +30,6 @@ em++ \
     -o CountdownSolver.js \
     solver-for-wasm.cpp \
     evaluator.cpp \
+    program_file.cpp \
+    embedded_programs.cpp \
     programs-6-cards.cpp
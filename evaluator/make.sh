@@ -1,5 +1,9 @@
 #!/bin/bash
 
+# Program files for the evaluator-cli to load at run-time, and the
+# six-card programs again to compile into the tests and the wasm
+# solver.
+PROGRAMS_N_CARDS="4 5 6 7 8"
 PROGRAMS_BIN=programs-6-cards.bin
 PROGRAMS_H=programs-6-cards.h
 PROGRAMS_CPP=programs-6-cards.cpp
@@ -9,10 +13,30 @@ command -v python > /dev/null || {
     exit 1
 }
 
+PROGRAMS_DIR="$(pwd)"
 (
     cd ../tree-programs
-    python compile_trees.py --n-cards 6 dump-programs
-) > $PROGRAMS_BIN
+    for n_cards in $PROGRAMS_N_CARDS; do
+        python compile_trees.py --n-cards "$n_cards" \
+            dump-programs \
+            --header \
+            --output "$PROGRAMS_DIR/programs-$n_cards-cards.bin"
+    done
+
+    # The prefix-trie layout, for comparison:
+    python compile_trees.py --n-cards 6 \
+        dump-programs \
+        --header \
+        --layout trie \
+        --output "$PROGRAMS_DIR/programs-6-cards-trie.bin"
+
+    # And the templates-and-bindings layout:
+    python compile_trees.py --n-cards 6 \
+        dump-programs \
+        --header \
+        --layout templates \
+        --output "$PROGRAMS_DIR/programs-6-cards-templates.bin"
+)
 
 # Seems a bit odd to run xxd twice, but it's quick, and saves using
 # and cleaning up a temporary file.
@@ -21,10 +45,10 @@ xxd -i $PROGRAMS_BIN \
     | head -n -1 \
     > $PROGRAMS_CPP
 
-cat > $PROGRAMS_H <<EOF
+cat > $PROGRAMS_H <<EOH
 #include <cstddef>
 extern unsigned char programs_6_cards_bin[];
-EOF
+EOH
 
 xxd -i $PROGRAMS_BIN \
     | tail -n 1 \
@@ -37,16 +61,61 @@ xxd -i $PROGRAMS_BIN \
 }
 
 g++ -o test_evaluator \
+    -pthread \
     -DEVALUATOR_PPRINT \
+    -DEVALUATOR_STATS \
     programs-6-cards.cpp \
+    embedded_programs.cpp \
+    program_file.cpp \
     evaluator.cpp \
+    parallel_evaluator.cpp \
+    reachable_values.cpp \
     evaluator_pprint.cpp \
     test_evaluator.cpp
 
 g++ -O3 \
     -o evaluator-cli \
+    -pthread \
     -DEVALUATOR_PPRINT \
-    programs-6-cards.cpp \
+    program_file.cpp \
+    evaluator.cpp \
+    parallel_evaluator.cpp \
+    reachable_values.cpp \
+    evaluator_pprint.cpp \
+    evaluator_cli.cpp
+
+# The same, but counting what the evaluators do, for --stats.
+g++ -O3 \
+    -o evaluator-cli-stats \
+    -pthread \
+    -DEVALUATOR_PPRINT \
+    -DEVALUATOR_STATS \
+    program_file.cpp \
     evaluator.cpp \
+    parallel_evaluator.cpp \
+    reachable_values.cpp \
     evaluator_pprint.cpp \
     evaluator_cli.cpp
+
+g++ -O3 \
+    -o bench-layouts \
+    -DEVALUATOR_STATS \
+    program_file.cpp \
+    evaluator.cpp \
+    bench_layouts.cpp
+
+g++ -O3 \
+    -o bench-engines \
+    program_file.cpp \
+    evaluator.cpp \
+    bench_engines.cpp
+
+g++ -O3 \
+    -o libcountdown-solver.so \
+    -shared \
+    -fPIC \
+    programs-6-cards.cpp \
+    embedded_programs.cpp \
+    program_file.cpp \
+    evaluator.cpp \
+    solver_c_api.cpp
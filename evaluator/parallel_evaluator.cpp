@@ -0,0 +1,408 @@
+/*
+  Copyright 2022 Ben North
+
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful, but
+  WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+  General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see https://www.gnu.org/licenses/
+*/
+
+#include <algorithm>
+#include <atomic>
+#include <numeric>
+#include "parallel_evaluator.h"
+
+// Chunks per thread; having more chunks than threads evens out the
+// uneven cost of different chunks.
+static const size_t chunks_per_thread_ = 8;
+
+static std::vector<const uint8_t *> flat_chunk_boundaries_(
+  const ProgramSet & programs,
+  size_t n_chunks
+) {
+  // The final extra Return is not part of any chunk.
+  const uint8_t * const begin{programs.packed_opcodes};
+  const uint8_t * const end{begin + programs.n_packed_opcodes - 1};
+  const size_t n_opcodes = end - begin;
+
+  std::vector<const uint8_t *> boundaries{begin};
+  for (size_t i = 1; i < n_chunks; ++i) {
+    // Move on to just after the next Return, which is the start of a
+    // program since Return only ever appears at the end of one.
+    const uint8_t * p{begin + (n_opcodes * i) / n_chunks};
+    if (p <= boundaries.back())
+      continue;
+    while (p != end && !is_return(p[-1]))
+      ++p;
+    if (p != boundaries.back() && p != end)
+      boundaries.push_back(p);
+  }
+  boundaries.push_back(end);
+  return boundaries;
+}
+
+static std::vector<ProgramChunk> flat_chunks_(
+  const ProgramSet & programs,
+  size_t n_chunks
+) {
+  const auto boundaries{flat_chunk_boundaries_(programs, n_chunks)};
+  std::vector<ProgramChunk> chunks;
+  for (size_t i = 0; i + 1 < boundaries.size(); ++i)
+    chunks.push_back({false, boundaries[i], boundaries[i + 1]});
+  return chunks;
+}
+
+// Split the chunk at `chunk_idx`, if it can be, returning whether it
+// was.  Several siblings are split at the sibling boundary nearest
+// their middle; a lone Value node is replaced by its children, which
+// keeps the number of chunks the same but lets them be split next.
+static bool split_trie_chunk_(
+  std::vector<ProgramChunk> & chunks,
+  size_t chunk_idx
+) {
+  ProgramChunk & chunk{chunks[chunk_idx]};
+  const uint8_t * first_end{TrieEvaluator::skip(chunk.begin)};
+
+  if (first_end != chunk.end) {
+    const uint8_t * middle{chunk.begin + (chunk.end - chunk.begin) / 2};
+    const uint8_t * cut{first_end};
+    while (cut < middle) {
+      const uint8_t * next{TrieEvaluator::skip(cut)};
+      if (next == chunk.end || (next - middle) > (middle - cut))
+        break;
+      cut = next;
+    }
+
+    ProgramChunk rest{chunk};
+    rest.begin = cut;
+    chunk.end = cut;
+    chunks.insert(chunks.begin() + chunk_idx + 1, rest);
+    return true;
+  }
+
+  const bool is_value{
+    (chunk.begin[0] >> 4) == static_cast<uint8_t>(OpcodeKind::Value)
+  };
+  if (is_value && chunk.begin[1] != 0) {
+    chunk.trie_ancestors.push_back(chunk.begin);
+    chunk.begin += 2;
+    return true;
+  }
+
+  return false;
+}
+
+static std::vector<ProgramChunk> trie_chunks_(
+  const ProgramSet & programs,
+  size_t n_chunks
+) {
+  const uint8_t * n_roots_ptr{programs.packed_opcodes};
+  std::vector<ProgramChunk> chunks{
+    {false, n_roots_ptr + 1, TrieEvaluator::skip_children(n_roots_ptr)}
+  };
+
+  std::vector<size_t> biggest_first;
+  while (chunks.size() < n_chunks) {
+    biggest_first.resize(chunks.size());
+    std::iota(biggest_first.begin(), biggest_first.end(), 0);
+    std::stable_sort(
+      biggest_first.begin(),
+      biggest_first.end(),
+      [&chunks](size_t i, size_t j) {
+        return (chunks[i].end - chunks[i].begin) > (chunks[j].end - chunks[j].begin);
+      });
+
+    const bool any_split{
+      std::any_of(
+        biggest_first.begin(),
+        biggest_first.end(),
+        [&chunks](size_t i) { return split_trie_chunk_(chunks, i); })
+    };
+    if (!any_split)
+      break;
+  }
+  return chunks;
+}
+
+// Each template costs about its length times the number of choices of
+// cards it is bound to.  A new chunk is started at each group, and
+// whenever the cost so far passes the next of `n_chunks` equal shares
+// of the total.
+static std::vector<ProgramChunk> templates_chunks_(
+  const ProgramSet & programs,
+  size_t n_chunks
+) {
+  struct Template {
+    const uint8_t * group;
+    const uint8_t * begin;
+    const uint8_t * end;
+    size_t cost;
+  };
+
+  std::vector<Template> templates;
+  size_t total_cost{0};
+  const uint8_t * group{programs.packed_opcodes};
+  while (*group != 0) {
+    const unsigned n_choices = group[1] | (group[2] << 8);
+    const uint8_t * p{first_template(group)};
+    while (!is_return(*p)) {
+      const uint8_t * begin{p};
+      while (!is_return(*p++))
+        ;
+      const size_t cost = (p - begin) * n_choices;
+      templates.push_back({group, begin, p, cost});
+      total_cost += cost;
+    }
+    group = p + 1;
+  }
+
+  std::vector<ProgramChunk> chunks;
+  size_t cost_so_far{0};
+  size_t n_shares_passed{0};
+  for (const auto & t : templates) {
+    bool passed_share{false};
+    while (cost_so_far * n_chunks >= total_cost * (n_shares_passed + 1)) {
+      ++n_shares_passed;
+      passed_share = true;
+    }
+
+    if (chunks.empty() || passed_share || t.group != chunks.back().template_group)
+      chunks.push_back({false, t.begin, t.end, {}, t.group});
+    else
+      chunks.back().end = t.end;
+
+    cost_so_far += t.cost;
+  }
+  return chunks;
+}
+
+std::vector<ProgramChunk> program_chunks(
+  const ProgramSet & programs,
+  size_t n_chunks_per_polarity
+) {
+  if (n_chunks_per_polarity == 0)
+    n_chunks_per_polarity = 1;
+
+  std::vector<ProgramChunk> chunks;
+  switch (programs.layout)
+  {
+  case ProgramLayout::Flat:
+    chunks = flat_chunks_(programs, n_chunks_per_polarity);
+    break;
+
+  case ProgramLayout::Trie:
+    chunks = trie_chunks_(programs, n_chunks_per_polarity);
+    break;
+
+  case ProgramLayout::Templates:
+    chunks = templates_chunks_(programs, n_chunks_per_polarity);
+    break;
+  }
+
+  const size_t n_chunks{chunks.size()};
+  for (size_t i = 0; i != n_chunks; ++i) {
+    chunks.push_back(chunks[i]);
+    chunks.back().invert_binops = true;
+  }
+  return chunks;
+}
+
+// Push the values of the chunk's trie ancestors, as walking down to it
+// would.  Each ancestor is counted as executed only in the chunk which
+// starts with its first descendant, so that the counts are the same as
+// for `all_valid()`.
+static void push_trie_ancestors_(Evaluator & state, const ProgramChunk & chunk)
+{
+  const auto & ancestors{chunk.trie_ancestors};
+
+#ifdef EVALUATOR_STATS
+  const uint8_t * below{chunk.begin};
+  for (size_t i = ancestors.size(); i != 0 && below == ancestors[i - 1] + 2; --i) {
+    EVALUATOR_COUNT(n_opcodes_executed);
+    below = ancestors[i - 1];
+  }
+#endif
+
+  for (const uint8_t * node : ancestors) {
+    const Opcode instruction{unpack_opcode(*node, state.invert_binops)};
+    state.operands.push_back(state.cards[instruction.arg0]);
+    state.concrete_instructions.push_back(instruction);
+  }
+}
+
+static void all_valid_chunk_(
+  const ProgramSet & programs,
+  const ProgramChunk & chunk,
+  const int * cards,
+  const Evaluator::output_function_t & output,
+  bool skip_duplicate_choices
+) {
+  switch (programs.layout)
+  {
+  case ProgramLayout::Flat:
+    {
+      Evaluator evaluator{chunk.begin, cards, output, chunk.invert_binops};
+      while (evaluator.instructions != chunk.end) {
+        EVALUATOR_COUNT(n_programs);
+        evaluator.all_valid();
+      }
+    }
+    break;
+
+  case ProgramLayout::Trie:
+    {
+      TrieEvaluator evaluator{cards, output, chunk.invert_binops};
+      push_trie_ancestors_(evaluator.state, chunk);
+      const uint8_t * node{chunk.begin};
+      while (node != chunk.end)
+        node = evaluator.all_valid(node);
+    }
+    break;
+
+  case ProgramLayout::Templates:
+    all_valid_template_range(
+      chunk.template_group,
+      chunk.begin,
+      chunk.end,
+      cards,
+      output,
+      chunk.invert_binops,
+      skip_duplicate_choices);
+    break;
+  }
+}
+
+ThreadPool::ThreadPool(unsigned n_threads)
+{
+  for (unsigned i = 1; i < n_threads; ++i)
+    threads_.emplace_back(&ThreadPool::run_worker_, this, i);
+}
+
+ThreadPool::~ThreadPool()
+{
+  {
+    std::lock_guard<std::mutex> lock{mutex_};
+    stopping_ = true;
+  }
+  work_ready_.notify_all();
+  for (auto & thread : threads_)
+    thread.join();
+}
+
+void ThreadPool::run(const std::function<void(unsigned)> & work)
+{
+  {
+    std::lock_guard<std::mutex> lock{mutex_};
+    work_ = &work;
+    ++n_runs_;
+    n_workers_running_ = threads_.size();
+  }
+  work_ready_.notify_all();
+
+  work(0);
+
+  std::unique_lock<std::mutex> lock{mutex_};
+  work_done_.wait(lock, [this] { return n_workers_running_ == 0; });
+  work_ = nullptr;
+}
+
+void ThreadPool::run_worker_(unsigned thread_idx)
+{
+  uint64_t n_runs_seen{0};
+  std::unique_lock<std::mutex> lock{mutex_};
+  while (true) {
+    work_ready_.wait(
+      lock, [&] { return stopping_ || n_runs_ != n_runs_seen; });
+    if (stopping_)
+      return;
+    n_runs_seen = n_runs_;
+
+    const auto & work{*work_};
+    lock.unlock();
+    work(thread_idx);
+    lock.lock();
+
+    if (--n_workers_running_ == 0)
+      work_done_.notify_one();
+  }
+}
+
+std::string all_valid_parallel(
+  const ProgramSet & programs,
+  const int * cards,
+  const buffered_output_function_t & output,
+  ThreadPool & pool,
+  bool skip_duplicate_choices
+) {
+  const unsigned n_threads{pool.n_threads()};
+  const auto chunks{program_chunks(programs, n_threads * chunks_per_thread_)};
+  std::vector<std::string> buffers(chunks.size());
+  std::atomic<size_t> next_chunk_idx{0};
+
+  auto run_chunks{
+    [&]()
+    {
+      size_t chunk_idx;
+      while ((chunk_idx = next_chunk_idx++) < chunks.size())
+      {
+        std::string & buffer{buffers[chunk_idx]};
+        const Evaluator::output_function_t output_to_buffer{
+          [&output, &buffer](const Evaluator & e) { output(e, buffer); }
+        };
+        all_valid_chunk_(
+          programs,
+          chunks[chunk_idx],
+          cards,
+          output_to_buffer,
+          skip_duplicate_choices);
+      }
+    }
+  };
+
+#ifdef EVALUATOR_STATS
+  // The pool's other threads count from zero for this call, and their
+  // counts are added to this thread's once they have finished.
+  std::vector<EvaluatorStats> thread_stats(n_threads);
+  const std::function<void(unsigned)> run_chunks_counted{
+    [&](unsigned thread_idx)
+    {
+      if (thread_idx == 0) {
+        run_chunks();
+        return;
+      }
+      evaluator_stats = {};
+      run_chunks();
+      thread_stats[thread_idx] = evaluator_stats;
+    }
+  };
+#else
+  const std::function<void(unsigned)> run_chunks_counted{
+    [&](unsigned) { run_chunks(); }
+  };
+#endif
+
+  pool.run(run_chunks_counted);
+
+#ifdef EVALUATOR_STATS
+  for (unsigned i = 1; i < n_threads; ++i)
+    evaluator_stats += thread_stats[i];
+#endif
+
+  size_t n_bytes{0};
+  for (const auto & buffer : buffers)
+    n_bytes += buffer.size();
+
+  std::string merged;
+  merged.reserve(n_bytes);
+  for (const auto & buffer : buffers)
+    merged += buffer;
+  return merged;
+}
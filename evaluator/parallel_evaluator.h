@@ -0,0 +1,110 @@
+/*
+  Copyright 2022 Ben North
+
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful, but
+  WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+  General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see https://www.gnu.org/licenses/
+*/
+
+#pragma once
+
+#include <condition_variable>
+#include <functional>
+#include <mutex>
+#include <string>
+#include <thread>
+#include <vector>
+#include "evaluator.h"
+
+// Output function for parallel evaluation, which appends whatever it
+// wants to output to the given buffer rather than writing it straight
+// away.  It can be called from several threads at once, each time
+// with a different buffer.
+using buffered_output_function_t
+  = std::function<void(const Evaluator &, std::string &)>;
+
+// A contiguous run of whole programs (flat layout), of sibling nodes
+// (trie layout), or of templates from one group (templates layout),
+// run with the given polarity.
+struct ProgramChunk {
+  bool invert_binops;
+  const uint8_t * begin;
+  const uint8_t * end;
+
+  // Trie layout: the Value nodes, root first, which the nodes from
+  // `begin` to `end` are below; their values are pushed before those
+  // nodes are run.
+  std::vector<const uint8_t *> trie_ancestors{};
+
+  // Templates layout: the start of the group of templates which the
+  // templates from `begin` to `end` are in.
+  const uint8_t * template_group{nullptr};
+};
+
+// Split `programs` into about `n_chunks_per_polarity` chunks per
+// polarity, in the order `all_valid()` would run them.  Flat-layout
+// programs are split at Return boundaries into chunks of roughly equal
+// size.  The trie is split repeatedly, biggest chunk first, either
+// between sibling nodes or by replacing a lone Value node by its
+// children, until there are enough chunks.  A lone binop node is not
+// split, since its children are run again for each mask, so a large
+// one can still leave a chunk bigger than the rest.  Templates are
+// split between templates, by their length times their group's number
+// of choices of cards, and always between groups.
+std::vector<ProgramChunk> program_chunks(
+  const ProgramSet & programs,
+  size_t n_chunks_per_polarity
+);
+
+// A fixed set of threads, started once and then reused for each call
+// of `run()`, so that solving many games does not start and stop
+// threads for each one.  The thread calling `run()` does its share of
+// the work too, so a pool of `n_threads` starts `n_threads - 1`.
+class ThreadPool {
+public:
+  explicit ThreadPool(unsigned n_threads);
+  ~ThreadPool();
+
+  ThreadPool(const ThreadPool &) = delete;
+  ThreadPool & operator=(const ThreadPool &) = delete;
+
+  unsigned n_threads() const { return static_cast<unsigned>(threads_.size()) + 1; }
+
+  // Call `work(thread_idx)` on each of the threads at once, the
+  // calling thread's index being 0, and return when all have finished.
+  void run(const std::function<void(unsigned)> & work);
+
+private:
+  void run_worker_(unsigned thread_idx);
+
+  std::vector<std::thread> threads_;
+  std::mutex mutex_;
+  std::condition_variable work_ready_;
+  std::condition_variable work_done_;
+  const std::function<void(unsigned)> * work_{nullptr};
+  uint64_t n_runs_{0};
+  unsigned n_workers_running_{0};
+  bool stopping_{false};
+};
+
+// As `all_valid()`, but using the threads of `pool`, each taking the
+// next chunk of programs to run until none remain.  Each chunk's
+// output is collected in its own buffer, and the result is all of them
+// concatenated in chunk order, so is the same whatever the number of
+// threads is.
+std::string all_valid_parallel(
+  const ProgramSet & programs,
+  const int * cards,
+  const buffered_output_function_t & output,
+  ThreadPool & pool,
+  bool skip_duplicate_choices = false
+);
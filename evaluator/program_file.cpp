@@ -0,0 +1,167 @@
+/*
+  Copyright 2022 Ben North
+
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful, but
+  WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+  General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see https://www.gnu.org/licenses/
+*/
+
+#include <cstring>
+#include <stdexcept>
+#include <array>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include "program_file.h"
+
+static const char program_file_magic_[4]{'C', 'D', 'P', 'R'};
+
+static bool is_return_opcode_(uint8_t packed_opcode)
+{
+  // OpcodeKind::Return is 3; see evaluator.h.
+  return (packed_opcode >> 4) == 3;
+}
+
+template<typename T>
+static T read_le_(const uint8_t * bytes)
+{
+  // Both native and wasm targets are little-endian, so we can copy
+  // directly.
+  T value;
+  std::memcpy(&value, bytes, sizeof(T));
+  return value;
+}
+
+uint32_t crc32(const uint8_t * data, size_t n_bytes)
+{
+  static const std::array<uint32_t, 256> table{([]()
+    {
+      std::array<uint32_t, 256> table;
+      for (uint32_t i = 0; i != 256; ++i) {
+        uint32_t c = i;
+        for (int k = 0; k != 8; ++k)
+          c = (c & 1) ? (0xedb88320U ^ (c >> 1)) : (c >> 1);
+        table[i] = c;
+      }
+      return table;
+    })()};
+
+  uint32_t crc = 0xffffffffU;
+  for (const uint8_t * p = data; p != data + n_bytes; ++p)
+    crc = table[(crc ^ *p) & 0xff] ^ (crc >> 8);
+  return crc ^ 0xffffffffU;
+}
+
+ProgramSet program_set_from_bytes(
+  const uint8_t * file_bytes,
+  size_t n_file_bytes,
+  bool verify_checksum
+) {
+  if (n_file_bytes < program_file_header_size)
+    throw std::runtime_error("program file too short for header");
+
+  if (std::memcmp(file_bytes, program_file_magic_, 4) != 0)
+    throw std::runtime_error("not a program file");
+
+  const auto version{read_le_<uint16_t>(file_bytes + 4)};
+  if (version != program_file_version)
+    throw std::runtime_error(
+      "unsupported program file version " + std::to_string(version));
+
+  const auto n_cards{read_le_<uint8_t>(file_bytes + 6)};
+  const auto layout{read_le_<uint8_t>(file_bytes + 7)};
+  if (layout > static_cast<uint8_t>(ProgramLayout::Templates))
+    throw std::runtime_error(
+      "unsupported program layout " + std::to_string(layout));
+
+  const auto n_opcodes{read_le_<uint64_t>(file_bytes + 8)};
+  if (n_opcodes != n_file_bytes - program_file_header_size)
+    throw std::runtime_error(
+      "expected " + std::to_string(n_opcodes) + " opcodes but found "
+      + std::to_string(n_file_bytes - program_file_header_size));
+
+  const uint8_t * packed_opcodes{file_bytes + program_file_header_size};
+
+  // Flat programs end with a double Return; checking for it protects
+  // the Evaluator from running off the end of the data.
+  if (layout == static_cast<uint8_t>(ProgramLayout::Flat)
+      && (n_opcodes < 2
+          || !is_return_opcode_(packed_opcodes[n_opcodes - 1])
+          || !is_return_opcode_(packed_opcodes[n_opcodes - 2])))
+    throw std::runtime_error("programs not terminated by double Return");
+
+  if (layout == static_cast<uint8_t>(ProgramLayout::Trie) && n_opcodes == 0)
+    throw std::runtime_error("empty program trie");
+
+  if (layout == static_cast<uint8_t>(ProgramLayout::Templates)
+      && (n_opcodes == 0 || packed_opcodes[n_opcodes - 1] != 0))
+    throw std::runtime_error("program templates not terminated");
+
+  if (verify_checksum) {
+    const auto expected_crc32{read_le_<uint32_t>(file_bytes + 16)};
+    if (crc32(packed_opcodes, n_opcodes) != expected_crc32)
+      throw std::runtime_error("program file checksum mismatch");
+  }
+
+  return {
+    n_cards,
+    static_cast<ProgramLayout>(layout),
+    packed_opcodes,
+    static_cast<size_t>(n_opcodes)
+  };
+}
+
+MappedProgramFile::MappedProgramFile(const std::string & path, bool verify_checksum)
+  : mapped_bytes_(nullptr)
+  , n_mapped_bytes_(0)
+{
+  const int fd{open(path.c_str(), O_RDONLY)};
+  if (fd < 0)
+    throw std::runtime_error("could not open program file " + path);
+
+  struct stat file_stat;
+  if (fstat(fd, &file_stat) != 0) {
+    close(fd);
+    throw std::runtime_error("could not stat program file " + path);
+  }
+
+  n_mapped_bytes_ = static_cast<size_t>(file_stat.st_size);
+  if (n_mapped_bytes_ != 0)
+    mapped_bytes_ = mmap(nullptr, n_mapped_bytes_, PROT_READ, MAP_SHARED, fd, 0);
+
+  // The mapping remains valid after closing the file.
+  close(fd);
+
+  if (mapped_bytes_ == MAP_FAILED || mapped_bytes_ == nullptr) {
+    mapped_bytes_ = nullptr;
+    throw std::runtime_error("could not map program file " + path);
+  }
+
+  // Programs are read front to back, one pass for each polarity.
+  madvise(mapped_bytes_, n_mapped_bytes_, MADV_SEQUENTIAL);
+
+  try {
+    programs_ = program_set_from_bytes(
+      static_cast<const uint8_t *>(mapped_bytes_),
+      n_mapped_bytes_,
+      verify_checksum);
+  } catch (...) {
+    munmap(mapped_bytes_, n_mapped_bytes_);
+    throw;
+  }
+}
+
+MappedProgramFile::~MappedProgramFile()
+{
+  munmap(mapped_bytes_, n_mapped_bytes_);
+}
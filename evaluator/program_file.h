@@ -0,0 +1,80 @@
+/*
+  Copyright 2022 Ben North
+
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful, but
+  WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+  General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see https://www.gnu.org/licenses/
+*/
+
+#pragma once
+
+#include <cstdint>
+#include <cstddef>
+#include <string>
+
+// A program file is a header followed by the packed opcodes of all
+// programs, as written by
+//
+//     compile_trees.py --n-cards N dump-programs --header --output FILE
+//
+// The header is, with all fields little-endian,
+//
+//     magic "CDPR", u16 version, u8 n_cards, u8 layout,
+//     u64 n_opcodes, u32 CRC-32 of opcodes, u32 reserved
+
+enum class ProgramLayout : uint8_t {
+  Flat = 0,      // Programs one after another, then an extra Return
+  Trie = 1,      // Prefix-trie of programs; see TrieEvaluator
+  Templates = 2  // Tree templates and choices of cards to bind to them
+};
+
+struct ProgramSet {
+  int n_cards;
+  ProgramLayout layout;
+  const uint8_t * packed_opcodes;
+  size_t n_packed_opcodes;
+};
+
+const size_t program_file_header_size = 24;
+const uint16_t program_file_version = 1;
+
+uint32_t crc32(const uint8_t * data, size_t n_bytes);
+
+// Interpret (without copying) the contents of a program file, throwing
+// std::runtime_error if they are not valid.
+ProgramSet program_set_from_bytes(
+  const uint8_t * file_bytes,
+  size_t n_file_bytes,
+  bool verify_checksum = true
+);
+
+// Read-only, shared, memory-mapping of a program file; the programs
+// are only valid for the lifetime of the MappedProgramFile.
+class MappedProgramFile {
+public:
+  explicit MappedProgramFile(const std::string & path, bool verify_checksum = true);
+  ~MappedProgramFile();
+
+  MappedProgramFile(const MappedProgramFile &) = delete;
+  MappedProgramFile & operator=(const MappedProgramFile &) = delete;
+
+  const ProgramSet & programs() const { return programs_; }
+
+private:
+  void * mapped_bytes_;
+  size_t n_mapped_bytes_;
+  ProgramSet programs_;
+};
+
+// The six-card programs compiled into the executable; only available
+// if linked with embedded_programs.cpp and programs-6-cards.cpp.
+const ProgramSet & embedded_programs();
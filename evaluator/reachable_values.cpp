@@ -0,0 +1,79 @@
+/*
+  Copyright 2022 Ben North
+
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful, but
+  WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+  General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see https://www.gnu.org/licenses/
+*/
+
+#include <stdexcept>
+#include "reachable_values.h"
+
+ReachableValues::ReachableValues(int max_value, bool keep_all_solutions)
+  : keep_all_solutions_(keep_all_solutions)
+{
+  if (max_value < 1)
+    throw std::invalid_argument("max_value must be positive");
+
+  // Index 0 is never used, since all values are positive.
+  by_value_.resize(max_value + 1);
+}
+
+void ReachableValues::record(const Evaluator & e)
+{
+  const int value{e.value()};
+  if (value > max_value())
+    return;
+
+  ReachableValue & reachable{by_value_[value]};
+  if (reachable.n_solutions == 0 || keep_all_solutions_)
+    reachable.solutions.insert(
+      reachable.solutions.end(),
+      e.concrete_instructions.begin(),
+      e.concrete_instructions.end());
+  ++reachable.n_solutions;
+}
+
+const ReachableValue * ReachableValues::find(int value) const
+{
+  if (value < 1 || value > max_value())
+    return nullptr;
+
+  const ReachableValue & reachable{by_value_[value]};
+  return (reachable.n_solutions != 0) ? &reachable : nullptr;
+}
+
+int ReachableValues::nearest(int target) const
+{
+  for (int distance = 0; distance <= target + max_value(); ++distance) {
+    if (find(target - distance) != nullptr)
+      return target - distance;
+    if (find(target + distance) != nullptr)
+      return target + distance;
+  }
+  return 0;
+}
+
+ReachableValues all_reachable_values(
+  const ProgramSet & programs,
+  const int * cards,
+  int max_value,
+  bool keep_all_solutions,
+  bool skip_duplicate_choices
+) {
+  ReachableValues reachable_values{max_value, keep_all_solutions};
+  const Evaluator::output_function_t record{
+    [&reachable_values](const Evaluator & e) { reachable_values.record(e); }
+  };
+  all_valid(programs, cards, record, skip_duplicate_choices);
+  return reachable_values;
+}
@@ -0,0 +1,61 @@
+/*
+  Copyright 2022 Ben North
+
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful, but
+  WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+  General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see https://www.gnu.org/licenses/
+*/
+
+#pragma once
+
+#include <vector>
+#include "evaluator.h"
+
+// How a value can be reached: the number of solutions giving it, and
+// the concrete instructions of the first solution found, or of all of
+// them one after another (each ends with its Return).
+struct ReachableValue {
+  size_t n_solutions{0};
+  std::vector<Opcode> solutions;
+};
+
+// Every value from 1 up to `max_value` which can be reached from one
+// set of cards, found with one run of all programs rather than one run
+// per target.  Values above `max_value` are ignored.
+class ReachableValues {
+public:
+  ReachableValues(int max_value, bool keep_all_solutions = false);
+
+  // For use as (or from) an output function.
+  void record(const Evaluator & e);
+
+  int max_value() const { return static_cast<int>(by_value_.size()) - 1; }
+
+  // Null if `value` is not reachable (or is out of range).
+  const ReachableValue * find(int value) const;
+
+  // The reachable value closest to `target`, the lower one if two are
+  // equally close, or zero if no value is reachable.
+  int nearest(int target) const;
+
+private:
+  bool keep_all_solutions_;
+  std::vector<ReachableValue> by_value_;
+};
+
+ReachableValues all_reachable_values(
+  const ProgramSet & programs,
+  const int * cards,
+  int max_value,
+  bool keep_all_solutions = false,
+  bool skip_duplicate_choices = false
+);
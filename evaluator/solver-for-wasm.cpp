@@ -41,12 +41,7 @@ struct CountdownSolver {
                            e.concrete_instructions.end());
       }};
 
-    const Opcode * program{all_programs()};
-    Evaluator e(program, cards.data(), process_candidate);
-
-    bool more_follow = true;
-    while (more_follow)
-      more_follow = e.all_valid();
+    all_valid(embedded_programs(), cards.data(), process_candidate);
   }
 
   const intptr_t solution_programs() const {
@@ -0,0 +1,128 @@
+/*
+  Copyright 2022 Ben North
+
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful, but
+  WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+  General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see https://www.gnu.org/licenses/
+*/
+
+#include <memory>
+#include <string>
+#include <vector>
+#include <exception>
+#include "evaluator.h"
+#include "solver_c_api.h"
+
+struct CountdownSolver {
+  std::unique_ptr<MappedProgramFile> program_file;
+  const ProgramSet & programs;
+
+  CountdownSolver()
+    : programs(embedded_programs())
+  {}
+
+  explicit CountdownSolver(const char * programs_path)
+    : program_file(std::make_unique<MappedProgramFile>(programs_path))
+    , programs(program_file->programs())
+  {}
+};
+
+struct CountdownSolutions {
+  size_t n_solutions{0};
+  std::vector<Opcode> opcodes;
+};
+
+static thread_local std::string last_error;
+
+template<class Fun>
+static auto catching_errors(Fun fun) -> decltype(fun())
+{
+  try {
+    return fun();
+  } catch (const std::exception & e) {
+    last_error = e.what();
+  } catch (...) {
+    last_error = "unknown error";
+  }
+  return nullptr;
+}
+
+extern "C" {
+
+CountdownSolver * countdown_solver_new(const char * programs_path)
+{
+  return catching_errors([programs_path]() {
+    return (programs_path == nullptr)
+      ? new CountdownSolver()
+      : new CountdownSolver(programs_path);
+  });
+}
+
+void countdown_solver_free(CountdownSolver * solver)
+{
+  delete solver;
+}
+
+int countdown_solver_n_cards(const CountdownSolver * solver)
+{
+  return solver->programs.n_cards;
+}
+
+CountdownSolutions * countdown_solve(
+  const CountdownSolver * solver,
+  int target,
+  const int * cards
+) {
+  return catching_errors([solver, target, cards]() {
+    auto solutions{std::make_unique<CountdownSolutions>()};
+
+    const Evaluator::output_function_t append_if_solution{
+      [target, &solutions](const Evaluator & e) {
+        if (e.value() == target) {
+          ++solutions->n_solutions;
+          solutions->opcodes.insert(solutions->opcodes.end(),
+                                    e.concrete_instructions.begin(),
+                                    e.concrete_instructions.end());
+        }
+      }};
+
+    all_valid(solver->programs, cards, append_if_solution);
+    return solutions.release();
+  });
+}
+
+size_t countdown_solutions_n_solutions(const CountdownSolutions * solutions)
+{
+  return solutions->n_solutions;
+}
+
+const uint8_t * countdown_solutions_data(const CountdownSolutions * solutions)
+{
+  return reinterpret_cast<const uint8_t *>(solutions->opcodes.data());
+}
+
+size_t countdown_solutions_nbytes(const CountdownSolutions * solutions)
+{
+  return solutions->opcodes.size() * sizeof(Opcode);
+}
+
+void countdown_solutions_free(CountdownSolutions * solutions)
+{
+  delete solutions;
+}
+
+const char * countdown_last_error()
+{
+  return last_error.c_str();
+}
+
+}
@@ -0,0 +1,60 @@
+/*
+  Copyright 2022 Ben North
+
+  This program is free software: you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation, either version 3 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful, but
+  WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+  General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program.  If not, see https://www.gnu.org/licenses/
+*/
+
+#pragma once
+
+#include <cstdint>
+#include <cstddef>
+
+// C interface to the evaluator, for use from other languages (for
+// example through Python's `ctypes`), built as the shared library
+// `libcountdown-solver.so`.
+//
+// Functions which can fail return NULL, after which
+// `countdown_last_error()` gives a message describing the failure.
+// None of the functions touch any global state, so different threads
+// may solve different games at once, even with the same solver.
+
+extern "C" {
+
+struct CountdownSolver;
+struct CountdownSolutions;
+
+// Solver for the programs in the given program file, or, if
+// `programs_path` is NULL, for the six-card programs compiled into the
+// library.
+CountdownSolver * countdown_solver_new(const char * programs_path);
+void countdown_solver_free(CountdownSolver * solver);
+int countdown_solver_n_cards(const CountdownSolver * solver);
+
+// All solutions of the game, whose number of cards must be that of the
+// solver.  The solutions are the concrete instructions, as three-byte
+// Opcodes, of each solution in turn, each ending with a Return.
+CountdownSolutions * countdown_solve(
+  const CountdownSolver * solver,
+  int target,
+  const int * cards
+);
+size_t countdown_solutions_n_solutions(const CountdownSolutions * solutions);
+const uint8_t * countdown_solutions_data(const CountdownSolutions * solutions);
+size_t countdown_solutions_nbytes(const CountdownSolutions * solutions);
+void countdown_solutions_free(CountdownSolutions * solutions);
+
+// Message describing the most recent failure in this thread.
+const char * countdown_last_error();
+
+}
@@ -19,7 +19,12 @@
 #include "catch.hpp"
 
 #include <array>
+#include <algorithm>
 #include "evaluator.h"
+#include "parallel_evaluator.h"
+#include "backtracking_evaluator.h"
+#include "lockstep_evaluator.h"
+#include "reachable_values.h"
 
 TEST_CASE("OpcodeKind manipulation", "")
 {
@@ -29,45 +34,119 @@ TEST_CASE("OpcodeKind manipulation", "")
   REQUIRE(other_binop(OpcodeKind::Return) == OpcodeKind::Return);
 }
 
-TEST_CASE("Program expansion", "")
+TEST_CASE("Opcode unpacking", "")
 {
-  SECTION("Expand 0x23")
-  {
-    const uint8_t * packed = all_packed_programs();
+  const Opcode add_3{unpack_opcode(0x23, false)};
+  REQUIRE(add_3.kind == OpcodeKind::AddN);
+  REQUIRE(add_3.arg0 == 3);
+  REQUIRE(add_3.arg1 == 0);
+
+  REQUIRE(unpack_opcode(0x23, true).kind == OpcodeKind::MultiplyN);
+  REQUIRE(unpack_opcode(0x12, true).kind == OpcodeKind::AddN);
+  REQUIRE(unpack_opcode(0x04, true).kind == OpcodeKind::Value);
+  REQUIRE(unpack_opcode(0x04, true).arg0 == 4);
+  REQUIRE(unpack_opcode(0x30, true).kind == OpcodeKind::Return);
+
+  REQUIRE(is_return(0x30));
+  REQUIRE( ! is_return(0x23));
+}
+
+static std::vector<uint8_t> program_file_bytes(
+  uint8_t n_cards,
+  const std::vector<uint8_t> & packed_opcodes
+) {
+  std::vector<uint8_t> file_bytes{'C', 'D', 'P', 'R', 1, 0, n_cards, 0};
+
+  const uint64_t n_opcodes{packed_opcodes.size()};
+  for (int i = 0; i != 8; ++i)
+    file_bytes.push_back((n_opcodes >> (8 * i)) & 0xff);
 
-    // Look for an interesting one.
-    const uint8_t * packed_0x23 = packed;
-    size_t idx = 0;
-    for (; *packed_0x23 != 0x23; ++packed_0x23, ++idx)
-      ;
+  const uint32_t checksum{crc32(packed_opcodes.data(), packed_opcodes.size())};
+  for (int i = 0; i != 4; ++i)
+    file_bytes.push_back((checksum >> (8 * i)) & 0xff);
 
-    const Opcode * opcode = all_programs() + idx;
-    REQUIRE(opcode->kind == OpcodeKind::AddN);
-    REQUIRE(opcode->arg0 == 3);
+  file_bytes.insert(file_bytes.end(), 4, 0);
+  file_bytes.insert(file_bytes.end(), packed_opcodes.begin(), packed_opcodes.end());
+  return file_bytes;
+}
+
+TEST_CASE("Program files", "")
+{
+  SECTION("CRC-32")
+  {
+    // Standard check value for CRC-32.
+    const std::string check_input{"123456789"};
+    const auto check_bytes{reinterpret_cast<const uint8_t *>(check_input.data())};
+    REQUIRE(crc32(check_bytes, check_input.size()) == 0xcbf43926);
   }
 
-  SECTION("All arg1 zero")
+  SECTION("Valid file")
   {
-    int n_returns = 0;
-    int n_non_zero_arg1 = 0;
-    const Opcode * opcode = all_programs();
+    const std::vector<uint8_t> packed_opcodes{0x00, 0x30, 0x01, 0x30, 0x30};
+    const auto file_bytes{program_file_bytes(2, packed_opcodes)};
+    const auto programs{program_set_from_bytes(file_bytes.data(), file_bytes.size())};
+    REQUIRE(programs.n_cards == 2);
+    REQUIRE(programs.layout == ProgramLayout::Flat);
+    REQUIRE(programs.n_packed_opcodes == 5);
+    REQUIRE(programs.packed_opcodes == file_bytes.data() + program_file_header_size);
+  }
 
-    while (n_returns != 2) {
-      if (opcode->arg1 != 0)
-        ++n_non_zero_arg1;
+  SECTION("Invalid files")
+  {
+    const std::vector<uint8_t> packed_opcodes{0x00, 0x30, 0x01, 0x30, 0x30};
+    auto file_bytes{program_file_bytes(2, packed_opcodes)};
 
-      if (opcode->kind == OpcodeKind::Return)
-        ++n_returns;
-      else
-        n_returns = 0;
+    SECTION("Too short")
+    {
+      file_bytes.resize(10);
+    }
 
-      ++opcode;
+    SECTION("Bad magic")
+    {
+      file_bytes[0] = 'X';
+    }
+
+    SECTION("Bad version")
+    {
+      file_bytes[4] = 7;
+    }
+
+    SECTION("Bad layout")
+    {
+      file_bytes[7] = 99;
+    }
+
+    SECTION("Truncated")
+    {
+      file_bytes.pop_back();
+    }
+
+    SECTION("Corrupted")
+    {
+      file_bytes[program_file_header_size + 2] = 0x02;
     }
 
-    REQUIRE(n_non_zero_arg1 == 0);
+    REQUIRE_THROWS_AS(
+      program_set_from_bytes(file_bytes.data(), file_bytes.size()),
+      std::runtime_error
+    );
+  }
 
-    size_t n_expanded_opcodes = opcode - all_programs();
-    REQUIRE(n_expanded_opcodes == n_packed_opcodes() * 2 - 1);
+  SECTION("Embedded programs")
+  {
+    const ProgramSet & programs{embedded_programs()};
+    REQUIRE(programs.n_cards == 6);
+
+    const uint8_t * end = programs.packed_opcodes + programs.n_packed_opcodes;
+    REQUIRE(is_return(end[-1]));
+    REQUIRE(is_return(end[-2]));
+
+    // All programs have AddN (or just a Value) at the root.
+    int n_multiply_roots = 0;
+    for (const uint8_t * p = programs.packed_opcodes; p + 2 < end; ++p)
+      if (is_return(p[1]) && (p[0] >> 4) == 1)
+        ++n_multiply_roots;
+    REQUIRE(n_multiply_roots == 0);
   }
 }
 
@@ -104,12 +183,12 @@ TEST_CASE("Operator traits", "")
 
 TEST_CASE("Operator-free programs", "")
 {
-  std::vector<Opcode> programs{
-    { OpcodeKind::Value, 0, 0 },
-    { OpcodeKind::Return, 0, 0 },
-    { OpcodeKind::Value, 2, 0 },
-    { OpcodeKind::Return, 0, 0 },
-    { OpcodeKind::Return, 0, 0 },
+  std::vector<uint8_t> programs{
+    0x00,  // Value 0
+    0x30,  // Return
+    0x02,  // Value 2
+    0x30,  // Return
+    0x30,  // Return
   };
 
   std::vector<int> cards{42, 33, 99, 100, 101, 12};
@@ -133,16 +212,16 @@ TEST_CASE("Operator-free programs", "")
 
 TEST_CASE("Generate add/multiply inversions", "")
 {
-  std::vector<Opcode> programs{
-    { OpcodeKind::Value, 0, 0 },
-    { OpcodeKind::Value, 1, 0 },
-    { OpcodeKind::Value, 2, 0 },
-    { OpcodeKind::Value, 3, 0 },
-    { OpcodeKind::AddN, 4, 0 },
-    { OpcodeKind::Value, 4, 0 },
-    { OpcodeKind::MultiplyN, 2, 0 },
-    { OpcodeKind::Return, 0, 0 },
-    { OpcodeKind::Return, 0, 0 },
+  std::vector<uint8_t> programs{
+    0x00,  // Value 0
+    0x01,  // Value 1
+    0x02,  // Value 2
+    0x03,  // Value 3
+    0x24,  // AddN 4
+    0x04,  // Value 4
+    0x12,  // MultiplyN 2
+    0x30,  // Return
+    0x30,  // Return
   };
 
   std::vector<int> cards{1, 2, 4, 8, 3, 200};
@@ -200,6 +279,646 @@ TEST_CASE("Generate add/multiply inversions", "")
   REQUIRE(values == expected_values);
 }
 
+TEST_CASE("Inverted binops", "")
+{
+  std::vector<uint8_t> programs{
+    0x00,  // Value 0
+    0x01,  // Value 1
+    0x22,  // AddN 2, run as MultiplyN 2
+    0x30,  // Return
+    0x30,  // Return
+  };
+
+  std::vector<int> cards{6, 3};
+  std::vector<int> values{};
+
+  Evaluator::output_function_t gather_value{
+    [&values](const Evaluator & e) { values.push_back(e.value()); }
+  };
+
+  Evaluator evaluator{programs.data(), cards.data(), gather_value, true};
+
+  const auto more_follow = evaluator.all_valid();
+  REQUIRE( ! more_follow);
+
+  // 6 / 3, then 6 * 3; 3 / 6 is not exact.
+  std::vector<int> expected_values{2, 18};
+  REQUIRE(values == expected_values);
+}
+
+TEST_CASE("Both polarities of all programs", "")
+{
+  std::vector<uint8_t> packed_opcodes{
+    0x00, 0x01, 0x22, 0x30,  // Add/multiply cards 0 and 1
+    0x30,
+  };
+  const auto file_bytes{program_file_bytes(2, packed_opcodes)};
+  const auto programs{program_set_from_bytes(file_bytes.data(), file_bytes.size())};
+
+  std::vector<int> cards{6, 3};
+  std::vector<int> values{};
+
+  Evaluator::output_function_t gather_value{
+    [&values](const Evaluator & e) { values.push_back(e.value()); }
+  };
+
+  all_valid(programs, cards.data(), gather_value);
+
+  std::vector<int> expected_values{3, 9, 2, 18};
+  REQUIRE(values == expected_values);
+}
+
+TEST_CASE("Trie layout", "")
+{
+  std::vector<int> cards{1, 2, 4, 8, 3, 200};
+  std::vector<int> values{};
+
+  Evaluator::output_function_t gather_value{
+    [&values](const Evaluator & e) { values.push_back(e.value()); }
+  };
+
+  SECTION("Single program")
+  {
+    // Same program as "Generate add/multiply inversions", as a trie.
+    std::vector<uint8_t> trie{
+      1,
+      0x00, 1, 0x01, 1, 0x02, 1, 0x03, 1,
+      0x24, 1, 0x04, 1, 0x12, 1,
+      0x30
+    };
+
+    TrieEvaluator evaluator{cards.data(), gather_value};
+    const uint8_t * end = evaluator.all_valid_children(trie.data());
+
+    REQUIRE(end == trie.data() + trie.size());
+    REQUIRE(evaluator.state.is_clear());
+
+    std::vector<int> expected_values{
+      3, 27, 15, 39, 1, 1, 9, 33, 21, 5, 45
+    };
+    REQUIRE(values == expected_values);
+  }
+
+  SECTION("Shared prefixes")
+  {
+    std::vector<uint8_t> trie{
+      2,
+      0x00, 2,
+        0x01, 2,
+          0x22, 1, 0x30,            // 1, 2 combined
+          0x04, 1, 0x23, 1, 0x30,   // 1, 2, 3 combined
+        0x30,                       // 1
+      0x01, 1, 0x30,                // 2
+    };
+
+    TrieEvaluator evaluator{cards.data(), gather_value};
+    const uint8_t * end = evaluator.all_valid_children(trie.data());
+
+    REQUIRE(end == trie.data() + trie.size());
+    REQUIRE(evaluator.state.is_clear());
+
+    std::vector<int> expected_values{
+      1, 3,     // 2 - 1, 2 + 1
+      4, 2, 6,  // 3 + 2 - 1, 3 + 1 - 2, 3 + 2 + 1
+      1,
+      2,
+    };
+    std::sort(values.begin(), values.end());
+    std::sort(expected_values.begin(), expected_values.end());
+    REQUIRE(values == expected_values);
+  }
+
+  SECTION("Skip pruned subtrees")
+  {
+    // Multiplying by 1 is never valid, so everything below the
+    // MultiplyN is skipped, and the walk continues with the sibling.
+    std::vector<uint8_t> trie{
+      1,
+      0x00, 1,
+        0x01, 1,
+          0x12, 2,
+            0x02, 1, 0x22, 1, 0x30,
+            0x30,
+    };
+
+    TrieEvaluator evaluator{cards.data(), gather_value};
+    const uint8_t * end = evaluator.all_valid_children(trie.data());
+
+    REQUIRE(end == trie.data() + trie.size());
+    REQUIRE(values.empty());
+  }
+}
+
+TEST_CASE("Templates layout", "")
+{
+  // As written by compile_trees.templates_and_bindings(2).
+  std::vector<uint8_t> templates_and_bindings{
+    1, 2, 0, 0, 1, 0x00, 0x30, 0x30,
+    2, 1, 0, 0, 1, 0x00, 0x01, 0x22, 0x30, 0x30,
+    0
+  };
+
+  std::vector<std::string> pprinted{};
+
+  Evaluator::output_function_t gather_pprinted{
+    [&pprinted](const Evaluator & e)
+    {
+      pprinted.push_back(e.pprint_concrete_flat());
+    }
+  };
+
+  SECTION("All choices")
+  {
+    std::vector<int> cards{6, 3};
+    all_valid_templates(
+      templates_and_bindings.data(), cards.data(), gather_pprinted, false, false);
+
+    std::vector<std::string> expected_pprinted{
+      "V(6) R", "V(3) R", "V(6) V(3) A(+-) R", "V(6) V(3) A(++) R"
+    };
+    REQUIRE(pprinted == expected_pprinted);
+  }
+
+  SECTION("Skip duplicate choices")
+  {
+    std::vector<int> cards{5, 5};
+    all_valid_templates(
+      templates_and_bindings.data(), cards.data(), gather_pprinted, false, true);
+
+    std::vector<std::string> expected_pprinted{
+      "V(5) R", "V(5) V(5) A(++) R"
+    };
+    REQUIRE(pprinted == expected_pprinted);
+  }
+}
+
+TEST_CASE("Backtracking evaluator", "")
+{
+  std::vector<std::string> pprinted{};
+  auto gather_pprinted{
+    [&pprinted](const Evaluator & e)
+    {
+      if (e.value() == 952)
+        pprinted.push_back(e.pprint_concrete_flat());
+    }
+  };
+
+  SECTION("Same as copying evaluator")
+  {
+    const ProgramSet & programs{embedded_programs()};
+    std::vector<int> cards{25, 50, 75, 100, 3, 6};
+
+    const Evaluator::output_function_t output{gather_pprinted};
+    all_valid(programs, cards.data(), output);
+    const auto expected_pprinted{pprinted};
+    REQUIRE(expected_pprinted.size() == 2);
+
+    pprinted.clear();
+    all_valid_backtracking(programs, cards.data(), gather_pprinted);
+    REQUIRE(pprinted == expected_pprinted);
+  }
+
+  SECTION("State is restored")
+  {
+    // As in "Generate add/multiply inversions", followed by a program
+    // whose MultiplyN is never valid.
+    std::vector<uint8_t> packed_opcodes{
+      0x00, 0x01, 0x02, 0x03, 0x24, 0x04, 0x12, 0x30,
+      0x00, 0x01, 0x22, 0x04, 0x12, 0x30,
+      0x30,
+    };
+    std::vector<int> cards{1, 2, 4, 8, 3, 200};
+    std::vector<int> values{};
+    auto gather_value{
+      [&values](const Evaluator & e) { values.push_back(e.value()); }
+    };
+
+    BacktrackingEvaluator<decltype(gather_value)> evaluator{cards.data(), gather_value};
+    const uint8_t * next{evaluator.all_valid(packed_opcodes.data())};
+    REQUIRE(next == packed_opcodes.data() + 8);
+    REQUIRE(evaluator.state.is_clear());
+
+    std::vector<int> expected_values{
+      3, 27, 15, 39, 1, 1, 9, 33, 21, 5, 45
+    };
+    REQUIRE(values == expected_values);
+
+    // 2 - 1 = 1, and multiplying by 1 is not valid; 2 + 1 = 3, which
+    // divided by 3 either way round is 1, and times 3 is 9.
+    values.clear();
+    next = evaluator.all_valid(next);
+    REQUIRE(is_return(*next));
+    REQUIRE(evaluator.state.is_clear());
+    REQUIRE(values == std::vector<int>{1, 1, 9});
+  }
+}
+
+TEST_CASE("Lockstep evaluator", "")
+{
+  const ProgramSet & programs{embedded_programs()};
+  const std::vector<int> targets{952, 100, 812};
+  const std::vector<std::vector<int>> all_cards{
+    {25, 50, 75, 100, 3, 6},
+    {7, 7, 7, 7, 7, 7},
+    {1, 1, 10, 25, 50, 75},
+  };
+
+  std::vector<std::vector<std::string>> expected_pprinted;
+  for (size_t game_idx = 0; game_idx != all_cards.size(); ++game_idx) {
+    std::vector<std::string> pprinted;
+    const Evaluator::output_function_t gather_pprinted{
+      [&](const Evaluator & e)
+      {
+        if (e.value() == targets[game_idx])
+          pprinted.push_back(e.pprint_concrete_flat());
+      }
+    };
+    all_valid(programs, all_cards[game_idx].data(), gather_pprinted);
+    expected_pprinted.push_back(pprinted);
+  }
+
+  std::vector<const int *> all_cards_ptrs;
+  for (const auto & cards : all_cards)
+    all_cards_ptrs.push_back(cards.data());
+
+  std::vector<std::vector<std::string>> pprinted(all_cards.size());
+  auto gather_pprinted{
+    [&](size_t game_idx, const Evaluator & e)
+    {
+      if (e.value() == targets[game_idx])
+        pprinted[game_idx].push_back(e.pprint_concrete_flat());
+    }
+  };
+
+  SECTION("All games at once")
+  {
+    all_valid_lockstep(programs, all_cards_ptrs, gather_pprinted);
+    REQUIRE(pprinted == expected_pprinted);
+  }
+
+  SECTION("More games than lanes")
+  {
+    all_valid_lockstep<2>(programs, all_cards_ptrs, gather_pprinted);
+    REQUIRE(pprinted == expected_pprinted);
+  }
+
+  SECTION("Filtered by target")
+  {
+    size_t n_output{0};
+    auto count_output{[&](size_t, const Evaluator &) { ++n_output; }};
+    all_valid_lockstep<2>(programs, all_cards_ptrs, count_output, targets.data());
+
+    size_t n_expected{0};
+    for (const auto & game_pprinted : expected_pprinted)
+      n_expected += game_pprinted.size();
+    REQUIRE(n_output == n_expected);
+  }
+}
+
+TEST_CASE("Reachable values", "")
+{
+  std::vector<uint8_t> packed_opcodes{
+    0x00, 0x30,              // Card 0
+    0x01, 0x30,              // Card 1
+    0x00, 0x01, 0x22, 0x30,  // Add/multiply cards 0 and 1
+    0x30,
+  };
+  const auto file_bytes{program_file_bytes(2, packed_opcodes)};
+  const auto programs{program_set_from_bytes(file_bytes.data(), file_bytes.size())};
+  std::vector<int> cards{6, 3};
+
+  SECTION("First solutions")
+  {
+    // Each program runs as packed and inverted, so 6 and 3 are each
+    // reached twice as cards; 3 is also 6 - 3, and 2 is 6 / 3.  But
+    // 6 + 3 = 9 and 6 * 3 = 18 are above the maximum value.
+    const auto reachable_values{all_reachable_values(programs, cards.data(), 8)};
+    REQUIRE(reachable_values.max_value() == 8);
+
+    std::vector<int> values;
+    std::vector<size_t> n_solutions;
+    for (int value = 0; value <= 9; ++value) {
+      const ReachableValue * reachable{reachable_values.find(value)};
+      if (reachable != nullptr) {
+        values.push_back(value);
+        n_solutions.push_back(reachable->n_solutions);
+      }
+    }
+    REQUIRE(values == std::vector<int>{2, 3, 6});
+    REQUIRE(n_solutions == std::vector<size_t>{1, 3, 2});
+
+    const auto pprinted{
+      pprint_opcodes(reachable_values.find(6)->solutions, cards.data())
+    };
+    REQUIRE(pprinted == std::vector<std::string>{"V(6)", "R"});
+
+    REQUIRE(reachable_values.nearest(6) == 6);
+    REQUIRE(reachable_values.nearest(1) == 2);
+    REQUIRE(reachable_values.nearest(4) == 3);
+    REQUIRE(reachable_values.nearest(5) == 6);
+    REQUIRE(reachable_values.nearest(100) == 6);
+  }
+
+  SECTION("All solutions")
+  {
+    const auto reachable_values{
+      all_reachable_values(programs, cards.data(), 8, true)
+    };
+    const ReachableValue * reachable{reachable_values.find(3)};
+    REQUIRE(reachable->n_solutions == 3);
+
+    // "V(3) R", "V(6) V(3) A(+-) R", and "V(3) R" again, inverted.
+    const auto pprinted{pprint_opcodes(reachable->solutions, cards.data())};
+    const std::vector<std::string> expected_pprinted{
+      "V(3)", "R", "V(6)", "V(3)", "A(+-)", "R", "V(3)", "R"
+    };
+    REQUIRE(pprinted == expected_pprinted);
+  }
+
+  SECTION("Nothing reachable")
+  {
+    const ReachableValues reachable_values{10};
+    REQUIRE(reachable_values.find(5) == nullptr);
+    REQUIRE(reachable_values.nearest(5) == 0);
+  }
+
+  SECTION("Same counts as solving for each target")
+  {
+    const ProgramSet & programs{embedded_programs()};
+    std::vector<int> cards{25, 50, 75, 100, 3, 6};
+    const auto reachable_values{all_reachable_values(programs, cards.data(), 999)};
+
+    int n_mismatches{0};
+    for (int target : {1, 100, 101, 555, 812, 952, 999}) {
+      size_t n_solutions{0};
+      const Evaluator::output_function_t count_if_match{
+        [&](const Evaluator & e) { n_solutions += (e.value() == target); }
+      };
+      all_valid(programs, cards.data(), count_if_match);
+
+      const ReachableValue * reachable{reachable_values.find(target)};
+      if (n_solutions != (reachable ? reachable->n_solutions : 0))
+        ++n_mismatches;
+    }
+    REQUIRE(n_mismatches == 0);
+  }
+}
+
+TEST_CASE("Parallel evaluation", "")
+{
+  const buffered_output_function_t append_pprinted{
+    [](const Evaluator & e, std::string & buffer)
+    {
+      if (e.value() == 952)
+        buffer += e.pprint_concrete_flat() + "\n";
+    }
+  };
+
+  auto sequential_output{
+    [&append_pprinted](const ProgramSet & programs, const int * cards)
+    {
+      std::string buffer;
+      Evaluator::output_function_t output{
+        [&](const Evaluator & e) { append_pprinted(e, buffer); }
+      };
+      all_valid(programs, cards, output);
+      return buffer;
+    }
+  };
+
+  SECTION("Flat chunks are whole programs")
+  {
+    const ProgramSet & programs{embedded_programs()};
+    const auto chunks{program_chunks(programs, 10)};
+    REQUIRE(chunks.size() == 20);
+
+    const uint8_t * begin{programs.packed_opcodes};
+    const uint8_t * end{begin + programs.n_packed_opcodes - 1};
+    int n_bad_chunks = 0;
+    for (size_t i = 0; i != chunks.size(); ++i) {
+      const auto & chunk{chunks[i]};
+      const bool first_of_polarity{
+        i == 0 || chunk.invert_binops != chunks[i - 1].invert_binops
+      };
+      const bool last_of_polarity{
+        i + 1 == chunks.size() || chunk.invert_binops != chunks[i + 1].invert_binops
+      };
+      if (chunk.begin != (first_of_polarity ? begin : chunks[i - 1].end)
+          || (last_of_polarity && chunk.end != end)
+          || !is_return(chunk.end[-1]))
+        ++n_bad_chunks;
+    }
+    REQUIRE(n_bad_chunks == 0);
+  }
+
+  SECTION("Flat layout")
+  {
+    const ProgramSet & programs{embedded_programs()};
+    std::vector<int> cards{25, 50, 75, 100, 3, 6};
+    const auto expected_output{sequential_output(programs, cards.data())};
+    REQUIRE( ! expected_output.empty());
+
+    for (unsigned n_threads : {1, 3, 4}) {
+      ThreadPool pool{n_threads};
+      REQUIRE(all_valid_parallel(programs, cards.data(), append_pprinted, pool)
+              == expected_output);
+    }
+  }
+
+  SECTION("Thread pool is reused")
+  {
+    ThreadPool pool{3};
+    REQUIRE(pool.n_threads() == 3);
+
+    std::vector<unsigned> n_calls(3);
+    const std::function<void(unsigned)> count_call{
+      [&n_calls](unsigned thread_idx) { ++n_calls[thread_idx]; }
+    };
+    for (int i = 0; i != 5; ++i)
+      pool.run(count_call);
+    REQUIRE(n_calls == std::vector<unsigned>{5, 5, 5});
+
+    const ProgramSet & programs{embedded_programs()};
+    std::vector<int> cards{25, 50, 75, 100, 3, 6};
+    const auto expected_output{sequential_output(programs, cards.data())};
+    for (int i = 0; i != 3; ++i)
+      REQUIRE(all_valid_parallel(programs, cards.data(), append_pprinted, pool)
+              == expected_output);
+  }
+
+  SECTION("Trie layout")
+  {
+    std::vector<uint8_t> trie{
+      2,
+      0x00, 2,
+        0x01, 1, 0x22, 1, 0x30,
+        0x30,
+      0x01, 1, 0x30,
+    };
+    auto file_bytes{program_file_bytes(2, trie)};
+    file_bytes[7] = static_cast<uint8_t>(ProgramLayout::Trie);
+    const auto programs{program_set_from_bytes(file_bytes.data(), file_bytes.size())};
+
+    // Split between the roots, then between the first root's
+    // children, of which the first is split down to its lone AddN,
+    // which cannot be split.
+    const auto chunks{program_chunks(programs, 10)};
+    REQUIRE(chunks.size() == 6);
+    const std::vector<const uint8_t *> first_ancestors{
+      programs.packed_opcodes + 1, programs.packed_opcodes + 3
+    };
+    REQUIRE(chunks[0].trie_ancestors == first_ancestors);
+    REQUIRE(*chunks[0].begin == 0x22);
+    REQUIRE(chunks[2].end == programs.packed_opcodes + programs.n_packed_opcodes);
+
+    // 68 * 14 is the only way to make 952.
+    std::vector<int> cards{68, 14};
+    const auto expected_output{sequential_output(programs, cards.data())};
+    REQUIRE(expected_output == "V(68) V(14) M(++) R\n");
+    for (unsigned n_threads : {1, 2, 3}) {
+      ThreadPool pool{n_threads};
+      REQUIRE(all_valid_parallel(programs, cards.data(), append_pprinted, pool)
+              == expected_output);
+    }
+  }
+
+  // These use the program files which make.sh writes alongside the
+  // tests.
+  auto biggest_chunk_fraction{
+    [](const std::vector<ProgramChunk> & chunks)
+    {
+      size_t total{0};
+      size_t biggest{0};
+      for (const auto & chunk : chunks) {
+        const size_t size = chunk.end - chunk.begin;
+        total += size;
+        biggest = std::max(biggest, size);
+      }
+      return static_cast<double>(biggest) / total;
+    }
+  };
+
+  SECTION("Trie chunks are split below the roots")
+  {
+    const MappedProgramFile file{"programs-6-cards-trie.bin"};
+    const auto chunks{program_chunks(file.programs(), 32)};
+    REQUIRE(chunks.size() == 64);
+    REQUIRE(biggest_chunk_fraction(chunks) < 0.05);
+
+    std::vector<int> cards{25, 50, 75, 100, 3, 6};
+    const auto expected_output{sequential_output(file.programs(), cards.data())};
+    REQUIRE( ! expected_output.empty());
+    for (unsigned n_threads : {1, 3, 4}) {
+      ThreadPool pool{n_threads};
+      REQUIRE(all_valid_parallel(file.programs(), cards.data(), append_pprinted, pool)
+              == expected_output);
+    }
+  }
+
+  SECTION("Templates chunks are split between templates")
+  {
+    const MappedProgramFile file{"programs-6-cards-templates.bin"};
+    const auto chunks{program_chunks(file.programs(), 32)};
+    REQUIRE(chunks.size() >= 64);
+    REQUIRE(biggest_chunk_fraction(chunks) < 0.05);
+
+    std::vector<int> cards{25, 50, 75, 100, 3, 6};
+    const auto expected_output{sequential_output(file.programs(), cards.data())};
+    REQUIRE( ! expected_output.empty());
+    for (unsigned n_threads : {1, 3, 4}) {
+      ThreadPool pool{n_threads};
+      REQUIRE(all_valid_parallel(file.programs(), cards.data(), append_pprinted, pool)
+              == expected_output);
+    }
+
+    // Skipping duplicate choices of cards applies within each chunk.
+    std::vector<int> repeated_cards{25, 50, 75, 3, 3, 6};
+    std::string expected_skipping_output;
+    const Evaluator::output_function_t output{
+      [&](const Evaluator & e) { append_pprinted(e, expected_skipping_output); }
+    };
+    all_valid(file.programs(), repeated_cards.data(), output, true);
+    ThreadPool pool{3};
+    REQUIRE(all_valid_parallel(
+              file.programs(), repeated_cards.data(), append_pprinted, pool, true)
+            == expected_skipping_output);
+  }
+}
+
+#ifdef EVALUATOR_STATS
+static std::array<uint64_t, 6> stats_counts(const EvaluatorStats & stats)
+{
+  return {
+    stats.n_programs,
+    stats.n_opcodes_executed,
+    stats.n_masks_tried,
+    stats.n_masks_operand_invalid,
+    stats.n_masks_operation_invalid,
+    stats.n_evaluations
+  };
+}
+
+TEST_CASE("Evaluator stats", "")
+{
+  SECTION("Pruning is counted")
+  {
+    // 2 - 1 = 1, and multiplying by 1 is not valid, which prunes all
+    // three masks; 1 - 2 is not valid; 2 + 1 = 3, and all three masks
+    // of 3 and 3 are valid.  With binops inverted, 1 is an operand of
+    // the multiplication, so its three masks are all pruned.
+    std::vector<uint8_t> packed_opcodes{0x00, 0x01, 0x22, 0x04, 0x12, 0x30, 0x30};
+    const auto file_bytes{program_file_bytes(6, packed_opcodes)};
+    const auto programs{program_set_from_bytes(file_bytes.data(), file_bytes.size())};
+    std::vector<int> cards{1, 2, 4, 8, 3, 200};
+    const EvaluatorStats expected_stats{2, 10 + 3, 9 + 3, 3 + 3, 1, 3};
+
+    const Evaluator::output_function_t no_output{[](const Evaluator &) {}};
+    evaluator_stats = {};
+    all_valid(programs, cards.data(), no_output);
+    REQUIRE(stats_counts(evaluator_stats) == stats_counts(expected_stats));
+
+    auto no_backtracking_output{[](const Evaluator &) {}};
+    evaluator_stats = {};
+    all_valid_backtracking(programs, cards.data(), no_backtracking_output);
+    REQUIRE(stats_counts(evaluator_stats) == stats_counts(expected_stats));
+  }
+
+  SECTION("Same counts with several threads")
+  {
+    const ProgramSet & programs{embedded_programs()};
+    std::vector<int> cards{25, 50, 75, 100, 3, 6};
+    const Evaluator::output_function_t no_output{[](const Evaluator &) {}};
+    const buffered_output_function_t no_buffered_output{
+      [](const Evaluator &, std::string &) {}
+    };
+
+    evaluator_stats = {};
+    all_valid(programs, cards.data(), no_output);
+    const auto expected_counts{stats_counts(evaluator_stats)};
+    REQUIRE(evaluator_stats.n_evaluations > 0);
+
+    // The pool's threads are reused, and count each call afresh.
+    ThreadPool pool{3};
+    for (int i = 0; i != 2; ++i) {
+      evaluator_stats = {};
+      all_valid_parallel(programs, cards.data(), no_buffered_output, pool);
+      REQUIRE(stats_counts(evaluator_stats) == expected_counts);
+    }
+
+    // The trie's Value nodes above a chunk are not counted again for
+    // each chunk below them.
+    const MappedProgramFile trie_file{"programs-6-cards-trie.bin"};
+    evaluator_stats = {};
+    all_valid(trie_file.programs(), cards.data(), no_output);
+    const auto expected_trie_counts{stats_counts(evaluator_stats)};
+
+    evaluator_stats = {};
+    all_valid_parallel(trie_file.programs(), cards.data(), no_buffered_output, pool);
+    REQUIRE(stats_counts(evaluator_stats) == expected_trie_counts);
+  }
+}
+#endif
+
 TEST_CASE("Pretty-printing", "")
 {
   std::vector<int> cards{1, 2, 4, 8, 3, 200};
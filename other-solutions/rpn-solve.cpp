@@ -23,6 +23,10 @@
 
 #include <iostream>
 #include <algorithm>
+#include <cstdint>
+#include <cstdlib>
+#include <new>
+#include <cstring>
 #include <variant>
 #include <vector>
 
@@ -34,6 +38,38 @@ enum class operation
     op_divide
 };
 
+// As the evaluator's Opcode: kind, then for a Value, the index of the
+// card; for an operation, the number of operands and the mask of
+// non-inverted operands, whose bit 0 is for the top of the stack.
+struct binary_opcode
+{
+    uint8_t kind;
+    uint8_t arg0;
+    uint8_t arg1;
+};
+
+const uint8_t kind_value = 0;
+const uint8_t kind_multiply = 1;
+const uint8_t kind_add = 2;
+const uint8_t kind_return = 3;
+
+binary_opcode op_as_binary(operation op)
+{
+    switch (op)
+    {
+    case operation::op_add:
+        return {kind_add, 2, 3};
+    case operation::op_subtract:
+        return {kind_add, 2, 1};
+    case operation::op_multiply:
+        return {kind_multiply, 2, 3};
+    case operation::op_divide:
+        return {kind_multiply, 2, 1};
+    default:
+        return {kind_return, 0, 0};
+    }
+}
+
 const char *op_as_text(operation op)
 {
     switch (op)
@@ -56,29 +92,173 @@ using longs = std::vector<long>;
 using instruction = std::variant<long, operation>;
 using instructions = std::vector<instruction>;
 
+// Transposition table of dead states: those, given by the evaluation
+// stack and the multiset of unused cards, from which no solution is
+// reachable.  What is found from a state does not depend on how it was
+// reached, so a state found to be dead need not be searched again,
+// however it is reached next time.  Each slot holds its state exactly,
+// as well as its hash, so a hit is never wrong.  There are two slots
+// per bucket, and when a new state's bucket is full, it replaces the
+// state whose search visited fewer nodes.
+struct dead_state_table
+{
+    static const size_t n_ways = 2;
+
+    // A slot is the number of nodes visited searching its state (zero
+    // if the slot is empty), the state's hash, then its key: the stack
+    // size, the stack, and the unused cards, sorted, padded with zeros
+    // to n_cards + 1 words.  Stack entries and cards are all positive.
+    size_t key_size;
+    size_t slot_size;
+    size_t n_buckets;
+    long *slots;
+
+    uint64_t n_lookups = 0;
+    uint64_t n_hits = 0;
+    uint64_t n_stores = 0;
+    uint64_t n_evictions = 0;
+
+    dead_state_table(size_t n_cards, size_t max_bytes)
+        : key_size(n_cards + 1), slot_size(n_cards + 3)
+    {
+        size_t bucket_bytes = n_ways * slot_size * sizeof(long);
+        n_buckets = 1;
+        while (2 * n_buckets * bucket_bytes <= max_bytes)
+            n_buckets *= 2;
+
+        // Only the pages holding slots which are used get touched.
+        slots = static_cast<long *>(
+            std::calloc(n_buckets * n_ways * slot_size, sizeof(long)));
+        if (slots == nullptr)
+            throw std::bad_alloc();
+    }
+
+    ~dead_state_table() { std::free(slots); }
+
+    dead_state_table(const dead_state_table &) = delete;
+    dead_state_table &operator=(const dead_state_table &) = delete;
+
+    size_t n_slots() const { return n_buckets * n_ways; }
+
+    long *bucket(uint64_t hash)
+    {
+        return slots + (hash & (n_buckets - 1)) * n_ways * slot_size;
+    }
+
+    // Whether the state with this hash is known to be dead; its key is
+    // only made, by `make_key(key)`, if some slot has the same hash.
+    template<class make_key_fun>
+    bool contains(uint64_t hash, longs &key, make_key_fun make_key)
+    {
+        ++n_lookups;
+        bool made_key = false;
+        long *slot = bucket(hash);
+        for (size_t way = 0; way < n_ways; ++way, slot += slot_size)
+        {
+            if (slot[0] == 0 || static_cast<uint64_t>(slot[1]) != hash)
+                continue;
+            if (!made_key)
+            {
+                make_key(key);
+                made_key = true;
+            }
+            if (std::equal(key.begin(), key.end(), slot + 2))
+            {
+                ++n_hits;
+                return true;
+            }
+        }
+        return false;
+    }
+
+    void store(uint64_t hash, const longs &key, uint64_t state_work)
+    {
+        long *first_slot = bucket(hash);
+        long *slot = first_slot;
+        for (size_t way = 1; way < n_ways; ++way)
+            if (first_slot[way * slot_size] < slot[0])
+                slot = first_slot + way * slot_size;
+
+        ++n_stores;
+        if (slot[0] != 0)
+            ++n_evictions;
+        slot[0] = static_cast<long>(state_work);
+        slot[1] = static_cast<long>(hash);
+        std::copy(key.begin(), key.end(), slot + 2);
+    }
+};
+
 struct search_state
 {
     long target;
     instructions ops;
     longs eval_stack;
+    longs cards;
     longs unused_cards;
+    bool binary;
+
+    // Only used when memoizing.
+    dead_state_table *dead_states = nullptr;
+
+    // States with fewer unused cards have searches too small to be
+    // worth looking up.
+    static const size_t min_unused_cards_to_memo = 2;
+
+    longs key;
+    uint64_t n_nodes = 0;
+    uint64_t n_solutions = 0;
 
-    search_state(size_t n_int_args, char **int_args)
+    search_state(size_t n_int_args, char **int_args, bool binary)
+        : binary(binary)
     {
         target = atol(int_args[0]);
         std::transform(
             int_args + 1, int_args + n_int_args,
-            std::back_inserter(unused_cards),
+            std::back_inserter(cards),
             [](const char *x)
             { return atol(x); });
+        unused_cards = cards;
 
         size_t n_cards = unused_cards.size();
         ops.reserve(2 * n_cards);
         eval_stack.reserve(n_cards);
     }
 
+    // Write the solution as a one-byte count of opcodes followed by the
+    // opcodes, including a final Return, as evaluator-cli --binary
+    // does.  Cards with equal values are interchangeable, so a Value
+    // refers to the first card with its value.
+    void emit_ops_binary()
+    {
+        std::cout.put(static_cast<char>(ops.size() + 1));
+        for (auto op : ops)
+        {
+            binary_opcode opcode;
+            if (const long *val = std::get_if<long>(&op))
+            {
+                auto card_idx = std::find(cards.begin(), cards.end(), *val)
+                                - cards.begin();
+                opcode = {kind_value, static_cast<uint8_t>(card_idx), 0};
+            }
+            else
+                opcode = op_as_binary(std::get<operation>(op));
+            std::cout.write(reinterpret_cast<const char *>(&opcode),
+                            sizeof opcode);
+        }
+        const binary_opcode return_opcode{kind_return, 0, 0};
+        std::cout.write(reinterpret_cast<const char *>(&return_opcode),
+                        sizeof return_opcode);
+    }
+
     void emit_ops()
     {
+        ++n_solutions;
+        if (binary)
+        {
+            emit_ops_binary();
+            return;
+        }
+
         bool first_output = true;
         for (auto op : ops)
         {
@@ -93,8 +273,73 @@ struct search_state
         std::cout << " R\n";
     }
 
+    static uint64_t mix(uint64_t x)
+    {
+        x = (x ^ (x >> 30)) * 0xbf58476d1ce4e5b9;
+        x = (x ^ (x >> 27)) * 0x94d049bb133111eb;
+        return x ^ (x >> 31);
+    }
+
+    // Hash of the current state.  The unused cards are a multiset, so
+    // their hashes are summed rather than sorted.
+    uint64_t state_hash() const
+    {
+        uint64_t stack_hash = eval_stack.size();
+        for (long value : eval_stack)
+            stack_hash = mix(stack_hash + static_cast<uint64_t>(value));
+        uint64_t unused_hash = 0;
+        for (long card : unused_cards)
+            unused_hash += mix(static_cast<uint64_t>(card));
+        return mix(stack_hash ^ unused_hash);
+    }
+
+    // The current state exactly, as a dead_state_table key.
+    void make_key(longs &key) const
+    {
+        size_t n_eval_stack_elts = eval_stack.size();
+        key[0] = n_eval_stack_elts;
+        std::copy(eval_stack.begin(), eval_stack.end(), key.begin() + 1);
+        auto unused_begin = key.begin() + 1 + n_eval_stack_elts;
+        auto unused_end = std::copy(unused_cards.begin(), unused_cards.end(),
+                                    unused_begin);
+        std::sort(unused_begin, unused_end);
+        std::fill(unused_end, key.end(), 0);
+    }
+
     void search()
     {
+        if (dead_states == nullptr)
+        {
+            search_from_state();
+            return;
+        }
+
+        if (unused_cards.size() < min_unused_cards_to_memo)
+        {
+            search_from_state();
+            return;
+        }
+
+        uint64_t hash = state_hash();
+        if (dead_states->contains(hash, key,
+                                  [this](longs &key) { make_key(key); }))
+            return;
+
+        uint64_t n_nodes_before = n_nodes;
+        uint64_t n_solutions_before = n_solutions;
+        search_from_state();
+
+        // The search leaves the state as it found it.
+        if (n_solutions == n_solutions_before)
+        {
+            make_key(key);
+            dead_states->store(hash, key, n_nodes - n_nodes_before);
+        }
+    }
+
+    void search_from_state()
+    {
+        ++n_nodes;
         size_t n_eval_stack_elts = eval_stack.size();
 
         if (n_eval_stack_elts == 1)
@@ -184,15 +429,79 @@ struct search_state
     }
 };
 
+static const char *usage
+    = "usage: rpn-solve [--binary] [--memo] [--memo-mb N] [--memo-stats]"
+      " TARGET CARD_1 ... CARD_N\n"
+      "  --binary      write solutions as evaluator-cli --binary does\n"
+      "  --memo        skip states already found to have no solutions\n"
+      "  --memo-mb N   megabytes for the table of such states (default 1)\n"
+      "  --memo-stats  with --memo, write the table's counts to stderr\n";
+
 int main(int argc, char **argv)
 {
+    bool binary = false;
+    bool memo = false;
+    bool memo_stats = false;
+    long memo_mb = 1;
+
+    while (argc > 1 && std::strncmp(argv[1], "--", 2) == 0)
+    {
+        if (std::strcmp(argv[1], "--binary") == 0)
+            binary = true;
+        else if (std::strcmp(argv[1], "--memo") == 0)
+            memo = true;
+        else if (std::strcmp(argv[1], "--memo-stats") == 0)
+            memo_stats = true;
+        else if (std::strcmp(argv[1], "--memo-mb") == 0 && argc > 2)
+        {
+            memo_mb = atol(argv[2]);
+            if (memo_mb < 1)
+            {
+                std::cerr << usage;
+                return EXIT_FAILURE;
+            }
+            --argc;
+            ++argv;
+        }
+        else
+        {
+            std::cerr << usage;
+            return EXIT_FAILURE;
+        }
+        --argc;
+        ++argv;
+    }
+
     if (argc < 3)
     {
-        std::cerr << "usage: rpn-solve TARGET CARD_1 ... CARD_N\n";
+        std::cerr << usage;
         return EXIT_FAILURE;
     }
 
-    search_state(argc - 1, argv + 1).search();
+    search_state state(argc - 1, argv + 1, binary);
+
+    if (memo)
+    {
+        size_t n_cards = state.cards.size();
+        dead_state_table dead_states(n_cards, memo_mb << 20);
+        state.dead_states = &dead_states;
+        state.key.resize(n_cards + 1);
+        state.search();
+
+        if (memo_stats)
+            std::cerr << "memo: " << dead_states.n_slots() << " slots, "
+                      << dead_states.n_lookups << " lookups, "
+                      << dead_states.n_hits << " hits, "
+                      << dead_states.n_stores << " stores, "
+                      << dead_states.n_evictions << " evictions, "
+                      << state.n_nodes << " nodes\n";
+    }
+    else
+        state.search();
+
+    // As with evaluator-cli, binary output ends with a zero byte.
+    if (binary)
+        std::cout.put(0);
 
     return EXIT_SUCCESS;
 }
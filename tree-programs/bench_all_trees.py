@@ -0,0 +1,83 @@
+# Copyright 2022 Ben North
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+import time
+import click
+import compile_trees as ct
+
+
+def dataclass_templates(n_leaves):
+    for t in ct.all_trees(n_leaves):
+        program = t.with_opkind(ct.OpcodeKind.AddN).as_program()
+        yield bytes(i.as_uint8() for i in program)
+
+
+def flat_templates(n_leaves):
+    identity_values = range(n_leaves)
+    for t in ct.all_flat_trees(n_leaves):
+        yield t.as_program_u8s(identity_values)
+
+
+Enumerators = {
+    "dataclass": (ct.all_trees, dataclass_templates),
+    "flat": (ct.all_flat_trees, flat_templates),
+}
+
+
+def elapsed_time(all_xs_fun, n_leaves):
+    t0 = time.perf_counter()
+    for x in all_xs_fun(n_leaves):
+        pass
+    return time.perf_counter() - t0
+
+
+@click.command()
+@click.option("--min-n-leaves", type=click.IntRange(min=1), default=6)
+@click.option("--max-n-leaves", type=click.IntRange(min=1), default=9)
+@click.option(
+    "--skip-dataclass-above",
+    type=click.IntRange(min=1),
+    default=8,
+    metavar="N",
+    help="Only time the dataclass-based all_trees() for up to N leaves",
+)
+def main(min_n_leaves, max_n_leaves, skip_dataclass_above):
+    """Compare the speed of all_trees() and all_flat_trees()
+
+    For each enumerator, time both generating the trees, and generating
+    the trees and encoding each one as a program template.
+    """
+    click.echo(f"{'n':>2} {'n_trees':>10}"
+               f" {'enumerator':>10} {'trees':>9} {'templates':>9}")
+    for n_leaves in range(min_n_leaves, max_n_leaves + 1):
+        times = {}
+        for name, funs in Enumerators.items():
+            if name == "dataclass" and n_leaves > skip_dataclass_above:
+                continue
+            times[name] = [elapsed_time(f, n_leaves) for f in funs]
+            t_trees, t_templates = times[name]
+            click.echo(f"{n_leaves:2d} {ct.n_trees(n_leaves):10d}"
+                       f" {name:>10} {t_trees:8.2f}s {t_templates:8.2f}s")
+        if "dataclass" in times:
+            speedups = [
+                t_dataclass / t_flat
+                for t_dataclass, t_flat in zip(times["dataclass"], times["flat"])
+            ]
+            click.echo(f"{'':>2} {'':>10} {'speedup':>10}"
+                       f" {speedups[0]:8.1f}x {speedups[1]:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,11 +16,17 @@
 from dataclasses import dataclass
 from enum import Enum
 from typing import Optional, Union, List
-from functools import reduce
+from functools import reduce, lru_cache, partial
 from operator import concat
-from itertools import combinations
-import math
+from itertools import combinations, islice
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
 import sys
+import math
+import io
+import struct
+import zlib
+import time
 import click
 
 
@@ -131,6 +137,164 @@ def all_trees(n_leaves):
                 yield t1
 
 
+class FlatTree:
+    """Tree encoded as a flat array of tokens, in postorder.
+
+    The tokens are exactly the encoded opcodes of the tree's program,
+    without the terminating Return, as if the tree had been given an
+    AddN at its root by `with_opkind()`.  A leaf's token is therefore
+    its value, and an internal node's token is its kind of operation
+    combined with its number of children.
+    """
+
+    __slots__ = ("tokens",)
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    @classmethod
+    def leaf(cls, value):
+        return cls(bytes([value]))
+
+    def __eq__(self, other):
+        return isinstance(other, FlatTree) and self.tokens == other.tokens
+
+    def __repr__(self):
+        return f"FlatTree({self.tokens.hex()})"
+
+    def nodes_in_preorder(self):
+        """Node spans and kinds, in preorder
+
+        Return a list of tuples `(start, end, is_internal, kind_u8)`.
+        The subtree rooted at the node is `tokens[start:end]`, and
+        `kind_u8` is the encoded kind which an internal node at that
+        node's depth has.
+        """
+        spans = []
+        for idx, token in enumerate(self.tokens):
+            if token >> 4:
+                n_children = token & 0x0f
+                children = spans[-n_children:]
+                del spans[-n_children:]
+                spans.append((children[0][0], idx + 1, children))
+            else:
+                spans.append((idx, idx + 1, None))
+
+        nodes = []
+        pending = [(spans[0], _ADD_U8)]
+        while pending:
+            (start, end, children), kind_u8 = pending.pop()
+            nodes.append((start, end, children is not None, kind_u8))
+            if children is not None:
+                child_kind_u8 = kind_u8 ^ _FLIP_KIND_U8
+                pending.extend(
+                    (child, child_kind_u8) for child in reversed(children)
+                )
+        return nodes
+
+    def all_extended(self, value):
+        """All extensions of this tree by a leaf with the given value
+
+        The extensions are returned in the same order as those of the
+        equivalent `LeafNode` or `InternalNode`: the extensions at
+        each node come before those within its children, which is
+        exactly preorder.
+        """
+        tokens = self.tokens
+        new_leaf = bytes([value])
+        extended = []
+        for start, end, is_internal, kind_u8 in self.nodes_in_preorder():
+            # The subtree moves one level down, so its kinds all flip.
+            extended.append(FlatTree(
+                tokens[:start]
+                + tokens[start:end].translate(_FLIP_KINDS_TABLE)
+                + new_leaf
+                + bytes([kind_u8 + 2])
+                + tokens[end:]
+            ))
+            if is_internal:
+                extended.append(FlatTree(
+                    tokens[:end - 1]
+                    + new_leaf
+                    + bytes([tokens[end - 1] + 1])
+                    + tokens[end:]
+                ))
+        return extended
+
+    def as_tree(self):
+        "Equivalent tree of `LeafNode` and `InternalNode` objects"
+        stack = []
+        for token in self.tokens:
+            kind = OpcodeKind(token >> 4)
+            if kind == OpcodeKind.Value:
+                stack.append(LeafNode(token))
+            else:
+                n_children = token & 0x0f
+                children = stack[-n_children:]
+                del stack[-n_children:]
+                stack.append(InternalNode(children, kind))
+        return stack[0]
+
+    def as_program_u8s(self, values):
+        """Encoded program for this tree
+
+        Leaf `i` of the tree uses the card with index `values[i]`.
+        """
+        return self.tokens.translate(values_table(values)) + _RETURN_U8S
+
+
+_ADD_U8 = OpcodeKind.AddN.value << 4
+_FLIP_KIND_U8 = (OpcodeKind.AddN.value ^ OpcodeKind.MultiplyN.value) << 4
+_FLIP_KINDS_TABLE = bytes(
+    (u8 ^ _FLIP_KIND_U8
+     if (u8 >> 4) in (OpcodeKind.AddN.value, OpcodeKind.MultiplyN.value)
+     else u8)
+    for u8 in range(256)
+)
+_RETURN_U8S = bytes([OpcodeKind.Return.value << 4])
+
+
+def values_table(values):
+    """Table for `bytes.translate()` to give leaf `i` value `values[i]`
+
+    Only the `Value` opcodes with argument less than `len(values)` are
+    changed; all other opcodes are left as they are.
+    """
+    table = bytearray(range(256))
+    table[:len(values)] = bytes(values)
+    return bytes(table)
+
+
+def all_flat_descendants(trees, n_leaves_from, n_leaves):
+    """All trees with `n_leaves` leaves got by extending the given trees
+
+    Each of the given `trees` must have `n_leaves_from` leaves.  The
+    trees are yielded in the same order as by `all_trees()`, but with
+    an explicit stack in place of nested generators.
+    """
+    # Element `i` of the stack yields trees with `n_leaves_from + i`
+    # leaves.
+    stack = [iter(trees)]
+    while stack:
+        t = next(stack[-1], None)
+        t_n_leaves = n_leaves_from + len(stack) - 1
+        if t is None:
+            stack.pop()
+        elif t_n_leaves == n_leaves - 1:
+            yield from t.all_extended(t_n_leaves)
+        elif t_n_leaves == n_leaves:
+            # Only if we were given trees which already have `n_leaves`
+            # leaves:
+            yield t
+        else:
+            stack.append(iter(t.all_extended(t_n_leaves)))
+
+
+def all_flat_trees(n_leaves):
+    "All trees with `n_leaves` leaves, as `FlatTree` instances"
+    return all_flat_descendants([FlatTree.leaf(0)], 1, n_leaves)
+
+
 @dataclass
 class Opcode:
     kind: OpcodeKind
@@ -140,21 +304,413 @@ class Opcode:
         return (self.kind.value << 4) + (self.arg or 0)
 
 
+def tree_program_chunks(trees, n_cards, n_used):
+    """Encoded programs for the given trees, as `bytes` chunks
+
+    Each tree, which must have `n_used` leaves, has its program
+    encoded once, as a template, and then specialised to each choice of
+    `n_used` cards from `n_cards` by `bytes.translate()`.  One chunk
+    holds the programs for one tree and all choices of cards.
+    """
+    tables = [
+        values_table(used_values)
+        for used_values in combinations(range(n_cards), n_used)
+    ]
+    for t in trees:
+        template = t.tokens + _RETURN_U8S
+        yield b"".join([template.translate(table) for table in tables])
+
+
+def all_program_chunks(n_cards):
+    """Encoded programs using at most `n_cards` cards, as `bytes` chunks
+
+    The final chunk is the extra Return which terminates the whole
+    stream.
+    """
+    for n_used in range(1, n_cards + 1):
+        yield from tree_program_chunks(all_flat_trees(n_used), n_cards, n_used)
+    yield _RETURN_U8S
+
+
+@dataclass
+class ProgramShard:
+    """Contiguous portion of the programs using `n_used` of `n_cards` cards
+
+    The shard's trees are those which extend the trees with
+    `prefix_n_leaves` leaves whose indexes in `all_flat_trees()` lie
+    in `range(prefix_start, prefix_stop)`.  Since `all_flat_trees()`
+    yields all extensions of one tree before those of the next, the
+    shard's programs are contiguous in the full stream.
+    """
+    n_cards: int
+    n_used: int
+    prefix_n_leaves: int
+    prefix_start: int
+    prefix_stop: int
+
+    def trees(self):
+        prefixes = islice(
+            all_flat_trees(self.prefix_n_leaves),
+            self.prefix_start,
+            self.prefix_stop
+        )
+        return all_flat_descendants(prefixes, self.prefix_n_leaves, self.n_used)
+
+    def describe(self):
+        return (
+            f"n_used={self.n_used}"
+            f" prefixes={self.prefix_n_leaves}-leaf"
+            f"[{self.prefix_start}:{self.prefix_stop}]"
+        )
+
+
+def program_shards(n_cards, n_shards_per_n_used):
+    """Shards covering all programs using at most `n_cards` cards
+
+    The shards are in the order of their programs in the full stream.
+    For each number of cards used, aim for `n_shards_per_n_used`
+    shards, by splitting on trees with the fewest leaves of which
+    there are at least that many.
+    """
+    shards = []
+    for n_used in range(1, n_cards + 1):
+        prefix_n_leaves = next(
+            (n for n in range(1, n_used)
+             if n_trees(n) >= n_shards_per_n_used),
+            n_used
+        )
+        n_prefixes = n_trees(prefix_n_leaves)
+        n_shards = min(n_prefixes, n_shards_per_n_used)
+        bounds = [(i * n_prefixes) // n_shards for i in range(n_shards + 1)]
+        shards.extend(
+            ProgramShard(n_cards, n_used, prefix_n_leaves, start, stop)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        )
+    return shards
+
+
+def shard_program_bytes(shard):
+    """Encoded programs for the shard, and the time taken to encode them"""
+    t0 = time.perf_counter()
+    program_bytes = b"".join(
+        tree_program_chunks(shard.trees(), shard.n_cards, shard.n_used)
+    )
+    return program_bytes, time.perf_counter() - t0
+
+
+def write_all_programs(n_cards, out_file, n_jobs=1, report_fun=None):
+    """Write all programs to `out_file`, using `n_jobs` processes
+
+    With more than one job, the work is split into shards, each
+    encoded by a worker process, and the results are written in order,
+    so the output is identical to that of a single job.  If given,
+    `report_fun` is called with a message for each completed shard.
+    """
+    if n_jobs == 1:
+        for chunk in all_program_chunks(n_cards):
+            out_file.write(chunk)
+        return
+
+    # Several shards per job, to even out the workers' loads.
+    shards = program_shards(n_cards, 4 * n_jobs)
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        results = executor.map(shard_program_bytes, shards)
+        for shard, (program_bytes, elapsed) in zip(shards, results):
+            out_file.write(program_bytes)
+            if report_fun is not None:
+                report_fun(
+                    f"{shard.describe()}:"
+                    f" {len(program_bytes)} bytes in {elapsed:.3f}s"
+                )
+    out_file.write(_RETURN_U8S)
+
+
 def all_programs(n_cards):
-    value_indexes = list(range(n_cards))
+    return list(b"".join(all_program_chunks(n_cards)))
+
+
+class ProgramFileLayout(Enum):
+    Flat = 0
+    Trie = 1
+    Templates = 2
+
 
-    program_u8s = []
+def split_programs(program_bytes):
+    """Individual programs, each ending in Return, from a flat stream
+
+    The extra Return which terminates the stream is dropped.  A Return
+    opcode cannot occur other than at the end of a program, so the
+    stream can be split on its encoding.
+    """
+    return [
+        body + _RETURN_U8S
+        for body in program_bytes.split(_RETURN_U8S)
+        if body
+    ]
+
+
+def trie_from_programs(programs):
+    """Prefix-trie encoding of the given programs
+
+    Programs sharing a prefix share the trie nodes for that prefix.
+    The encoding is the number of root nodes, followed by each root
+    node's subtree.  A node's subtree is its opcode followed, unless it
+    is a Return, by its number of children and then each child's
+    subtree.  A Return only ever ends a program, so is always a leaf.
+
+    The programs are put in sorted order, which brings those with
+    common prefixes together.
+    """
+    trie_u8s = bytearray([0])
+    # Position of the child-count of each node on the path to the most
+    # recent program's Return, with the root's first.
+    count_positions = [0]
+    previous = b""
+    for program in sorted(set(programs)):
+        n_common = 0
+        for a, b in zip(previous, program):
+            if a != b:
+                break
+            n_common += 1
+        del count_positions[n_common + 1:]
+        for u8 in program[n_common:]:
+            trie_u8s[count_positions[-1]] += 1
+            trie_u8s.append(u8)
+            if u8 != _RETURN_U8S[0]:
+                count_positions.append(len(trie_u8s))
+                trie_u8s.append(0)
+        previous = program
+    return bytes(trie_u8s)
+
+
+def templates_and_bindings(n_cards):
+    """Each tree's program once, with the choices of cards to bind to it
+
+    For each number of cards used, in increasing order, the encoding
+    is: that number of cards, `n_used`; the number of choices of
+    `n_used` cards (little-endian, two bytes); each choice, as `n_used`
+    card indexes; and the program templates for all trees with `n_used`
+    leaves, then an extra Return.  Leaf `i` of a template is to use the
+    `i`th card of the choice.  A zero number of cards ends the
+    encoding.
+
+    Binding each template to each choice in turn gives the same
+    programs, in the same order, as `all_programs()`.
+    """
+    encoded = bytearray()
     for n_used in range(1, n_cards + 1):
-        for t in all_trees(n_used):
-            t1 = t.with_opkind(OpcodeKind.AddN)
-            for used_values in combinations(value_indexes, n_used):
-                t2 = t1.with_values(used_values)
-                for i in t2.as_program():
-                    program_u8s.append(i.as_uint8())
+        choices = list(combinations(range(n_cards), n_used))
+        encoded.append(n_used)
+        encoded += len(choices).to_bytes(2, "little")
+        for used_values in choices:
+            encoded += bytes(used_values)
+        for t in all_flat_trees(n_used):
+            encoded += t.tokens + _RETURN_U8S
+        encoded += _RETURN_U8S
+    encoded.append(0)
+    return bytes(encoded)
+
+
+def write_programs(
+        n_cards,
+        out_file,
+        layout=ProgramFileLayout.Flat,
+        n_jobs=1,
+        report_fun=None
+):
+    "Write all programs to `out_file` in the given layout"
+    if layout == ProgramFileLayout.Flat:
+        write_all_programs(n_cards, out_file, n_jobs, report_fun)
+    elif layout == ProgramFileLayout.Templates:
+        out_file.write(templates_and_bindings(n_cards))
+    else:
+        flat_file = io.BytesIO()
+        write_all_programs(n_cards, flat_file, n_jobs, report_fun)
+        programs = split_programs(flat_file.getvalue())
+        out_file.write(trie_from_programs(programs))
+
+
+ProgramFileMagic = b"CDPR"
+ProgramFileVersion = 1
+
+# Magic, version, number of cards, layout, number of opcodes, CRC-32 of
+# the opcodes, reserved.  All little-endian.
+ProgramFileHeader = struct.Struct("<4sHBBQII")
+
 
-    program_u8s.append(Opcode(OpcodeKind.Return).as_uint8())
+class ChecksummingWriter:
+    "Wrapper round a binary file, tracking size and CRC-32 of all writes"
 
-    return program_u8s
+    def __init__(self, out_file):
+        self.out_file = out_file
+        self.n_bytes = 0
+        self.crc32 = 0
+
+    def write(self, data):
+        self.n_bytes += len(data)
+        self.crc32 = zlib.crc32(data, self.crc32)
+        self.out_file.write(data)
+
+
+def write_program_file(
+        n_cards,
+        out_file,
+        layout=ProgramFileLayout.Flat,
+        n_jobs=1,
+        report_fun=None
+):
+    """Write all programs to `out_file`, preceded by a header
+
+    The header records the number of cards, and the number and CRC-32
+    of the opcodes.  These are only known once all programs have been
+    written, so the header is filled in at the end, and `out_file` must
+    be seekable.
+    """
+    header_pos = out_file.tell()
+    out_file.write(bytes(ProgramFileHeader.size))
+
+    writer = ChecksummingWriter(out_file)
+    write_programs(n_cards, writer, layout, n_jobs, report_fun)
+
+    end_pos = out_file.tell()
+    out_file.seek(header_pos)
+    out_file.write(ProgramFileHeader.pack(
+        ProgramFileMagic,
+        ProgramFileVersion,
+        n_cards,
+        layout.value,
+        writer.n_bytes,
+        writer.crc32,
+        0
+    ))
+    out_file.seek(end_pos)
+
+
+@dataclass
+class ProgramFile:
+    n_cards: int
+    layout: ProgramFileLayout
+    opcodes: bytes
+
+    @classmethod
+    def from_bytes(cls, file_bytes):
+        header_size = ProgramFileHeader.size
+        if len(file_bytes) < header_size:
+            raise ValueError("program file too short for header")
+        magic, version, n_cards, layout, n_opcodes, crc32, _ = (
+            ProgramFileHeader.unpack_from(file_bytes)
+        )
+        if magic != ProgramFileMagic:
+            raise ValueError("not a program file")
+        if version != ProgramFileVersion:
+            raise ValueError(f"unsupported program file version {version}")
+        opcodes = file_bytes[header_size:]
+        if len(opcodes) != n_opcodes:
+            raise ValueError(
+                f"expected {n_opcodes} opcodes but found {len(opcodes)}"
+            )
+        if zlib.crc32(opcodes) != crc32:
+            raise ValueError("program file checksum mismatch")
+        return cls(n_cards, ProgramFileLayout(layout), opcodes)
+
+
+def add_polynomials(p, q):
+    n = max(len(p), len(q))
+    p = p + [0] * (n - len(p))
+    q = q + [0] * (n - len(q))
+    return [a + b for a, b in zip(p, q)]
+
+
+def multiply_polynomials(p, q):
+    product = [0] * (len(p) + len(q) - 1)
+    for i, a in enumerate(p):
+        for j, b in enumerate(q):
+            product[i + j] += a * b
+    return product
+
+
+@lru_cache(maxsize=None)
+def _tree_and_forest_polynomials(n_leaves):
+    """Counting polynomials for trees and forests on `n_leaves` leaves.
+
+    Each polynomial is a list of coefficients, indexed by number of
+    internal nodes.  The "tree" polynomial counts the trees which
+    `all_trees(n_leaves)` generates; the "forest" polynomial counts
+    the ways of partitioning `n_leaves` labelled leaves into any
+    number of such trees.
+
+    The children of a tree's root form a partition of its leaves into
+    at least two blocks, each block being the leaves of a sub-tree.
+    Summing over the size of the block containing the first leaf gives
+    the recurrence.
+    """
+    if n_leaves == 0:
+        return [], [1]
+    if n_leaves == 1:
+        return [1], [1]
+
+    # Forests with at least two trees:
+    n_others = n_leaves - 1
+    split_forests = []
+    for n_in_first in range(1, n_leaves):
+        first_tree, _ = _tree_and_forest_polynomials(n_in_first)
+        _, rest_forest = _tree_and_forest_polynomials(n_leaves - n_in_first)
+        n_ways = math.comb(n_others, n_in_first - 1)
+        term = multiply_polynomials(first_tree, rest_forest)
+        split_forests = add_polynomials(
+            split_forests, [n_ways * c for c in term]
+        )
+
+    # Joining the trees of such a forest under a new root adds one
+    # internal node:
+    tree = [0] + split_forests
+    forest = add_polynomials(split_forests, tree)
+    return tree, forest
+
+
+def n_trees_by_n_internal(n_leaves):
+    """Number of trees on `n_leaves` leaves, by number of internal nodes.
+
+    Element `k` of the returned list is the number of trees yielded
+    by `all_trees(n_leaves)` which have `k` internal nodes.
+    """
+    tree, _ = _tree_and_forest_polynomials(n_leaves)
+    return list(tree)
+
+
+def n_trees(n_leaves):
+    "Number of trees yielded by `all_trees(n_leaves)`"
+    return sum(n_trees_by_n_internal(n_leaves))
+
+
+def n_programs_by_n_used(n_cards):
+    """Number of programs using at most `n_cards` cards, by cards used.
+
+    Returns a dict mapping each `n_used` from 1 to `n_cards` to the
+    number of programs using exactly `n_used` of the cards, counting
+    each choice of those cards separately.
+    """
+    return {
+        n_used: n_trees(n_used) * math.comb(n_cards, n_used)
+        for n_used in range(1, n_cards + 1)
+    }
+
+
+def n_programs_by_length(n_cards):
+    """Number of programs using at most `n_cards` cards, by length.
+
+    Returns a dict mapping program length, in opcodes including the
+    terminating Return, to the number of programs of that length.
+    """
+    n_programs = Counter()
+    for n_used in range(1, n_cards + 1):
+        n_choices_of_cards = math.comb(n_cards, n_used)
+        for n_internal, n in enumerate(n_trees_by_n_internal(n_used)):
+            if n == 0:
+                continue
+            length = n_used + n_internal + 1
+            n_programs[length] += n * n_choices_of_cards
+    return dict(sorted(n_programs.items()))
 
 
 def total_n_programs(n_cards):
@@ -164,12 +720,7 @@ def total_n_programs(n_cards):
     cards) are counted repeatedly, according to how many choices of
     `k` cards there are from `n_cards`.
     """
-    n_programs = 0
-    for n_used in range(1, n_cards + 1):
-        n_choices_of_cards = math.comb(n_cards, n_used)
-        n_trees = sum(1 for t in all_trees(n_used))
-        n_programs += n_trees * n_choices_of_cards
-    return n_programs
+    return sum(n_programs_by_n_used(n_cards).values())
 
 
 @click.group()
@@ -187,19 +738,133 @@ def cli(ctx, n_cards):
 
 
 @cli.command(name="dump-programs")
+@click.option(
+    "--output",
+    type=click.File("wb"),
+    default="-",
+    metavar="PATH",
+    help="File to write programs to (default stdout)",
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    metavar="N",
+    help="Number of worker processes; timings go to stderr if N > 1",
+)
+@click.option(
+    "--header/--no-header",
+    default=False,
+    help="Write a program-file header before the programs",
+)
+@click.option(
+    "--layout",
+    type=click.Choice(["flat", "trie", "templates"]),
+    default="flat",
+    help=("Write programs one after another, as a prefix-trie,"
+          " or as templates with choices of cards to bind to them"),
+)
 @click.pass_context
-def dump_programs(ctx):
-    "Emit to stdout a binary encoding of all programs"
+def dump_programs(ctx, output, jobs, header, layout):
+    "Emit a binary encoding of all programs"
     n_cards = ctx.obj["n_cards"]
-    sys.stdout.buffer.write(bytes(all_programs(n_cards)))
+    report_fun = partial(click.echo, err=True)
+    layout = ProgramFileLayout[layout.capitalize()]
+    if header:
+        if not output.seekable():
+            raise click.UsageError("--header needs a seekable --output file")
+        write_program_file(n_cards, output, layout, jobs, report_fun)
+    else:
+        write_programs(n_cards, output, layout, jobs, report_fun)
 
 
 @cli.command(name="count-programs")
+@click.option(
+    "--by",
+    type=click.Choice(["total", "n-used", "length"]),
+    default="total",
+    help="Print the total, or a breakdown by cards used or program length",
+)
 @click.pass_context
-def n_programs(ctx):
+def n_programs(ctx, by):
     "Print the number of programs"
     n_cards = ctx.obj["n_cards"]
-    click.echo(str(total_n_programs(n_cards)))
+    if by == "total":
+        click.echo(str(total_n_programs(n_cards)))
+    else:
+        breakdown = (
+            n_programs_by_n_used(n_cards) if by == "n-used"
+            else n_programs_by_length(n_cards)
+        )
+        for k, n in breakdown.items():
+            click.echo(f"{k} {n}")
+
+
+def games_from_lines(lines, n_cards):
+    """Each `(target, cards)` from lines of 'TARGET CARD...', skipping
+    blank lines, and raising click.ClickException for a line which is
+    not a game with `n_cards` cards"""
+    for line_number, line in enumerate(lines, start=1):
+        fields = line.split()
+        if not fields:
+            continue
+        try:
+            numbers = [int(f) for f in fields]
+        except ValueError:
+            raise click.ClickException(f"line {line_number}: bad number")
+        if len(numbers) != n_cards + 1:
+            raise click.ClickException(
+                f"line {line_number}: expected TARGET and {n_cards} cards,"
+                f" got {len(numbers)} numbers"
+            )
+        yield numbers[0], numbers[1:]
+
+
+@cli.command(name="solve")
+@click.option(
+    "--batch",
+    is_flag=True,
+    help=("Read games, one 'TARGET CARD...' per line, from stdin, and"
+          " print a blank line after each game's solutions"),
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=1000,
+    metavar="N",
+    help="Number of games to evaluate together",
+)
+@click.argument("game", nargs=-1, type=int)
+@click.pass_context
+def solve(ctx, batch, batch_size, game):
+    """Print all solutions, using NumPy rather than evaluator-cli
+
+    Give the game as TARGET CARD_1 ... CARD_N, or use --batch.
+    """
+    try:
+        from vector_solver import VectorSolver
+    except ImportError as e:
+        raise click.ClickException(f"solve needs NumPy ({e})")
+
+    n_cards = ctx.obj["n_cards"]
+    solver = VectorSolver(n_cards)
+
+    if batch:
+        games = games_from_lines(sys.stdin, n_cards)
+    else:
+        if len(game) != n_cards + 1:
+            raise click.UsageError(
+                f"expected TARGET and {n_cards} cards, got {len(game)} numbers"
+            )
+        games = [(game[0], list(game[1:]))]
+
+    games = iter(games)
+    while (batch_games := list(islice(games, batch_size))):
+        for solutions in solver.solve(batch_games):
+            for solution in solutions:
+                click.echo(solution)
+            if batch:
+                click.echo("")
 
 
 if __name__ == "__main__":
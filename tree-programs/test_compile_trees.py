@@ -15,6 +15,9 @@
 
 from dataclasses import dataclass
 from typing import Optional
+from collections import Counter
+import math
+import io
 import pytest
 import compile_trees as ct
 
@@ -101,6 +104,63 @@ class TestInternalNode:
         assert i.as_sexp() == "(? 10 (? 5 3))"
 
 
+F = ct.FlatTree
+
+
+class TestFlatTree:
+    # (+ 10 (* 5 3))
+    tree = F(bytes([0x0a, 0x05, 0x03, 0x12, 0x22]))
+
+    def test_leaf(self):
+        assert F.leaf(11).tokens == bytes([0x0b])
+
+    def test_nodes_in_preorder(self):
+        assert self.tree.nodes_in_preorder() == [
+            (0, 5, True, 0x20),
+            (0, 1, False, 0x10),
+            (1, 4, True, 0x10),
+            (1, 2, False, 0x20),
+            (2, 3, False, 0x20),
+        ]
+
+    def test_as_tree(self):
+        assert self.tree.as_tree() == I(
+            [L(10), I([L(5), L(3)], K.MultiplyN)],
+            K.AddN
+        )
+
+    def test_extension(self):
+        got_extensions = [t.as_tree() for t in self.tree.all_extended(11)]
+        exp_extensions = [
+            t.with_opkind(K.AddN)
+            for t in I([L(10), I([L(5), L(3)])]).all_extended(11)
+        ]
+        assert got_extensions == exp_extensions
+
+    def test_as_program_u8s(self):
+        # (+ 1 (* 0 2 3))
+        t = F(bytes([0x01, 0x00, 0x02, 0x03, 0x13, 0x22]))
+        exp_u8s = [
+            i.as_uint8()
+            for i in t.as_tree().with_values([3, 0, 4, 1]).as_program()
+        ]
+        assert list(t.as_program_u8s([3, 0, 4, 1])) == exp_u8s
+
+    def test_values_table(self):
+        table = ct.values_table([3, 5])
+        assert bytes([0x00, 0x01, 0x22, 0x30]).translate(table) == (
+            bytes([0x03, 0x05, 0x22, 0x30])
+        )
+
+    @pytest.mark.parametrize("n_leaves", range(1, 7))
+    def test_all_flat_trees(self, n_leaves):
+        got_trees = [t.as_tree() for t in ct.all_flat_trees(n_leaves)]
+        exp_trees = [
+            t.with_opkind(K.AddN) for t in ct.all_trees(n_leaves)
+        ]
+        assert got_trees == exp_trees
+
+
 class TestHelpers:
     def test_replace_element(self):
         xs = [1, 5, 12, 10]
@@ -117,6 +177,14 @@ class TestHelpers:
         with pytest.raises(ValueError):
             K.op_symbol(K.Return)
 
+    def test_add_polynomials(self):
+        assert ct.add_polynomials([1, 2], [3, 4, 5]) == [4, 6, 5]
+        assert ct.add_polynomials([], [7]) == [7]
+
+    def test_multiply_polynomials(self):
+        # (1 + 2x)(3 + x) = 3 + 7x + 2x^2
+        assert ct.multiply_polynomials([1, 2], [3, 1]) == [3, 7, 2]
+
     def test_op_other(self):
         assert K.other(K.MultiplyN) == K.AddN
         assert K.other(K.AddN) == K.MultiplyN
@@ -188,6 +256,132 @@ class TestTopLevel:
             0x30
         ]
 
+    def test_all_program_chunks(self):
+        chunks = list(ct.all_program_chunks(3))
+        # One chunk for each tree, plus the terminator:
+        assert len(chunks) == 1 + 1 + 4 + 1
+        assert chunks[0] == bytes([0x00, 0x30, 0x01, 0x30, 0x02, 0x30])
+        assert chunks[-1] == bytes([0x30])
+
+    def test_write_all_programs(self):
+        out_file = io.BytesIO()
+        ct.write_all_programs(4, out_file)
+        assert list(out_file.getvalue()) == ct.all_programs(4)
+
+    @pytest.mark.parametrize("n_shards_per_n_used", [1, 3, 30])
+    def test_program_shards(self, n_shards_per_n_used):
+        shards = ct.program_shards(6, n_shards_per_n_used)
+        for n_used in range(1, 7):
+            got_trees = [
+                t
+                for s in shards if s.n_used == n_used
+                for t in s.trees()
+            ]
+            assert got_trees == list(ct.all_flat_trees(n_used))
+
+    def test_write_all_programs_parallel(self):
+        out_file = io.BytesIO()
+        reports = []
+        ct.write_all_programs(5, out_file, 2, reports.append)
+        assert list(out_file.getvalue()) == ct.all_programs(5)
+        assert len(reports) == len(ct.program_shards(5, 8))
+
+    def test_write_program_file(self):
+        out_file = io.BytesIO()
+        ct.write_program_file(4, out_file)
+        file_bytes = out_file.getvalue()
+        assert file_bytes[:4] == b"CDPR"
+        assert len(file_bytes) == ct.ProgramFileHeader.size + len(
+            ct.all_programs(4)
+        )
+        program_file = ct.ProgramFile.from_bytes(file_bytes)
+        assert program_file.n_cards == 4
+        assert program_file.layout == ct.ProgramFileLayout.Flat
+        assert list(program_file.opcodes) == ct.all_programs(4)
+
+    def test_split_programs(self):
+        u8s = bytes(ct.all_programs(3))
+        programs = ct.split_programs(u8s)
+        assert len(programs) == ct.total_n_programs(3)
+        assert programs[0] == bytes([0x00, 0x30])
+        assert b"".join(programs) + bytes([0x30]) == u8s
+
+    def test_trie_from_programs(self):
+        programs = [
+            bytes([0x00, 0x01, 0x22, 0x30]),
+            bytes([0x00, 0x30]),
+            bytes([0x00, 0x01, 0x02, 0x23, 0x30]),
+            bytes([0x01, 0x30]),
+        ]
+        assert ct.trie_from_programs(programs) == bytes([
+            2,  # root has children "0x00", "0x01"
+            0x00, 2,  # with children "0x01", "0x30"
+            0x01, 2,  # with children "0x02", "0x22"
+            0x02, 1, 0x23, 1, 0x30,
+            0x22, 1, 0x30,
+            0x30,
+            0x01, 1, 0x30,
+        ])
+
+    def test_write_trie_program_file(self):
+        out_file = io.BytesIO()
+        ct.write_program_file(4, out_file, ct.ProgramFileLayout.Trie)
+        program_file = ct.ProgramFile.from_bytes(out_file.getvalue())
+        assert program_file.layout == ct.ProgramFileLayout.Trie
+        programs = ct.split_programs(bytes(ct.all_programs(4)))
+        assert program_file.opcodes == ct.trie_from_programs(programs)
+
+    def test_templates_and_bindings(self):
+        encoded = ct.templates_and_bindings(2)
+        assert encoded == bytes([
+            1, 2, 0,  # One card used; two choices
+            0, 1,  # Choices
+            0x00, 0x30,  # Only template
+            0x30,
+            2, 1, 0,  # Two cards used; one choice
+            0, 1,  # Choice
+            0x00, 0x01, 0x22, 0x30,  # Only template
+            0x30,
+            0,
+        ])
+
+    @pytest.mark.parametrize("n_cards", range(1, 6))
+    def test_templates_and_bindings_programs(self, n_cards):
+        # Binding templates as described must give all_programs().
+        encoded = io.BytesIO(ct.templates_and_bindings(n_cards))
+        programs = b""
+        while n_used := encoded.read(1)[0]:
+            n_choices = int.from_bytes(encoded.read(2), "little")
+            choices = [encoded.read(n_used) for _ in range(n_choices)]
+            templates = []
+            while (template := encoded.read(1)) != bytes([0x30]):
+                while template[-1] != 0x30:
+                    template += encoded.read(1)
+                templates.append(template)
+            for template in templates:
+                for choice in choices:
+                    programs += template.translate(ct.values_table(choice))
+        programs += bytes([0x30])
+        assert list(programs) == ct.all_programs(n_cards)
+
+    @pytest.mark.parametrize(
+        "corrupt_fun, exp_message",
+        [
+            (lambda b: b[:10], "too short"),
+            (lambda b: b"XXXX" + b[4:], "not a program file"),
+            (lambda b: b[:4] + b"\x07" + b[5:], "unsupported"),
+            (lambda b: b[:-1], "expected"),
+            (lambda b: b[:-1] + b"\x31", "checksum"),
+        ],
+        ids=["short", "magic", "version", "length", "checksum"],
+    )
+    def test_bad_program_file(self, corrupt_fun, exp_message):
+        out_file = io.BytesIO()
+        ct.write_program_file(3, out_file)
+        file_bytes = corrupt_fun(out_file.getvalue())
+        with pytest.raises(ValueError, match=exp_message):
+            ct.ProgramFile.from_bytes(file_bytes)
+
     def test_total_n_programs(self):
         for n_cards in range(1, 7):
             u8s = ct.all_programs(n_cards)
@@ -198,3 +392,49 @@ class TestTopLevel:
             # Final program is terminated with an extra RET:
             n_programs = n_ret_opcodes - 1
             assert ct.total_n_programs(n_cards) == n_programs
+
+
+def n_internal_nodes(tree):
+    if isinstance(tree, ct.LeafNode):
+        return 0
+    return 1 + sum(n_internal_nodes(ch) for ch in tree.children)
+
+
+class TestCounting:
+    def test_n_trees_large(self):
+        # Continuation of the sequence in test_all_trees (OEIS A000311).
+        n_trees = [ct.n_trees(n) for n in range(1, 12)]
+        assert n_trees == [
+            1, 1, 4, 26, 236, 2752, 39208,
+            660032, 12818912, 282137824, 6939897856,
+        ]
+
+    @pytest.mark.parametrize("n_leaves", range(1, 7))
+    def test_n_trees_by_n_internal(self, n_leaves):
+        got_counts = ct.n_trees_by_n_internal(n_leaves)
+        exp_counts = Counter(
+            n_internal_nodes(t) for t in ct.all_trees(n_leaves)
+        )
+        assert got_counts == [exp_counts[k] for k in range(len(got_counts))]
+        assert sum(got_counts) == sum(exp_counts.values())
+
+    @pytest.mark.parametrize("n_cards", range(1, 6))
+    def test_n_programs_by_n_used(self, n_cards):
+        exp_counts = Counter()
+        for n_used in range(1, n_cards + 1):
+            n_trees = len(list(ct.all_trees(n_used)))
+            exp_counts[n_used] = n_trees * math.comb(n_cards, n_used)
+        assert ct.n_programs_by_n_used(n_cards) == exp_counts
+
+    @pytest.mark.parametrize("n_cards", range(1, 6))
+    def test_n_programs_by_length(self, n_cards):
+        u8s = ct.all_programs(n_cards)
+        exp_counts = Counter()
+        length = 0
+        # Final program is terminated with an extra RET, so drop it:
+        for u8 in u8s[:-1]:
+            length += 1
+            if u8 == 0x30:
+                exp_counts[length] += 1
+                length = 0
+        assert ct.n_programs_by_length(n_cards) == exp_counts
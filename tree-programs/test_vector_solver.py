@@ -0,0 +1,116 @@
+# Copyright 2022 Ben North
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+import pytest
+from click.testing import CliRunner
+
+np = pytest.importorskip("numpy")
+
+import compile_trees as ct  # noqa: E402
+import vector_solver as vs  # noqa: E402
+
+
+# As printed by tree-solve (that is, evaluator-cli):
+expected_solutions_10_1_2_3_4 = [
+    "V(2) V(3) M(++) V(4) A(++) R",
+    "V(2) V(3) V(4) M(++) A(-+) R",
+    "V(1) V(2) V(3) V(4) A(++++) R",
+    "V(1) V(2) V(4) M(++) V(3) A(-++) R",
+    "V(1) V(3) A(-+) V(4) M(++) V(2) A(++) R",
+    "V(1) V(4) A(++) V(2) M(++) R",
+]
+
+expected_solutions_952 = [
+    "V(25) V(50) V(75) V(100) V(3) A(++) V(6) M(-+++) A(++) R",
+    "V(25) V(50) V(75) V(100) V(6) A(++) V(3) M(+++) A(-+) M(-+) R",
+]
+
+
+class TestVectorTemplate:
+    def test_leaf(self):
+        template = vs.VectorTemplate(ct.FlatTree.leaf(0))
+        assert template.mask_combinations.shape == (1, 0)
+        leaf_values = np.array([[[3], [7]]])
+        values, valid = template.evaluate(leaf_values, False)
+        assert values.tolist() == [[[3], [7]]]
+        assert valid.all()
+
+    def test_evaluate(self):
+        # Template "V0 V1 A"; masks are 0b01, 0b10, 0b11.
+        (tree,) = ct.all_flat_trees(2)
+        template = vs.VectorTemplate(tree)
+        assert template.mask_combinations.tolist() == [[1], [2], [3]]
+
+        leaf_values = np.array([[[3, 7]], [[6, 2]]])
+        values, valid = template.evaluate(leaf_values, False)
+        assert valid.tolist() == [[[True, False, True]], [[False, True, True]]]
+        assert values[valid].tolist() == [4, 10, 4, 8]
+
+        values, valid = template.evaluate(leaf_values, True)
+        assert valid.tolist() == [[[False, False, True]], [[False, True, True]]]
+        assert values[valid].tolist() == [21, 3, 12]
+
+        assert template.pprint([3, 7], [1], False) == "V(3) V(7) A(-+) R"
+        assert template.pprint([3, 7], [3], True) == "V(3) V(7) M(++) R"
+
+
+class TestVectorSolver:
+    def test_solve(self):
+        solver = vs.VectorSolver(4)
+        solutions = solver.solve([(10, [1, 2, 3, 4]), (999, [1, 1, 1, 1])])
+        assert solutions == [expected_solutions_10_1_2_3_4, []]
+
+    def test_wrong_n_cards(self):
+        solver = vs.VectorSolver(4)
+        with pytest.raises(ValueError, match="4 cards"):
+            solver.solve([(10, [1, 2, 3])])
+
+    def test_cli(self):
+        runner = CliRunner()
+        result = runner.invoke(
+            ct.cli,
+            ["--n-cards", "6", "solve", "952", "25", "50", "75", "100", "3", "6"],
+            obj={},
+        )
+        assert result.exit_code == 0
+        assert result.output.splitlines() == expected_solutions_952
+
+    def test_cli_batch(self):
+        runner = CliRunner()
+        result = runner.invoke(
+            ct.cli,
+            ["--n-cards", "4", "solve", "--batch", "--batch-size", "1"],
+            input="10 1 2 3 4\n\n999 1 1 1 1\n",
+            obj={},
+        )
+        assert result.exit_code == 0
+        assert result.output == "".join(
+            s + "\n" for s in expected_solutions_10_1_2_3_4 + ["", ""]
+        )
+
+    @pytest.mark.parametrize(
+        "line, message",
+        [("100 1 2 3", "expected TARGET and 6 cards"), ("100 1 2 x", "bad number")],
+    )
+    def test_cli_batch_bad_game(self, line, message):
+        runner = CliRunner()
+        result = runner.invoke(
+            ct.cli,
+            ["--n-cards", "6", "solve", "--batch"],
+            input=f"{line}\n",
+            obj={},
+        )
+        assert result.exit_code == 1
+        assert f"line 1: {message}" in result.output
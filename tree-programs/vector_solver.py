@@ -0,0 +1,174 @@
+# Copyright 2022 Ben North
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/
+
+"""Evaluation of programs, for many games at once, using NumPy
+
+This finds the same solutions, in the same order, as the C++
+`Evaluator`, and prints them in the same format as `evaluator-cli`.
+Instead of trying each choice of non-inverted operands one by one, all
+choices for all operations in a program are evaluated together, as are
+all choices of cards, and all games in a batch.
+"""
+
+from itertools import combinations, product
+import numpy as np
+import compile_trees as ct
+
+
+_MultiplyN = ct.OpcodeKind.MultiplyN.value
+_Value = ct.OpcodeKind.Value.value
+
+
+class VectorTemplate:
+    """One tree's program, ready for vectorised evaluation
+
+    `mask_combinations` has one row for every combination of
+    non-inverted-input masks of the program's operations, in the order
+    the C++ `Evaluator` tries them: the first operation executed varies
+    slowest.
+    """
+
+    def __init__(self, tree):
+        self.tokens = tree.tokens
+        arities = [u8 & 0x0f for u8 in self.tokens if u8 >> 4 != _Value]
+        all_masks = list(product(*[range(1, 1 << n) for n in arities]))
+        self.mask_combinations = np.array(
+            all_masks, dtype=np.int64
+        ).reshape(len(all_masks), len(arities))
+
+    def evaluate(self, leaf_values, invert_binops):
+        """Values and validity of all evaluations of this program
+
+        `leaf_values` has shape `(n_games, n_choices, n_used)`.  Return
+        arrays `(values, valid)` of shape `(n_games, n_choices,
+        n_mask_combinations)`.
+        """
+        n_games, n_choices, _ = leaf_values.shape
+        shape = (n_games, n_choices, len(self.mask_combinations))
+        valid = np.ones(shape, dtype=bool)
+        stack = []
+        op_idx = 0
+        for u8 in self.tokens:
+            kind = u8 >> 4
+            if kind == _Value:
+                stack.append(leaf_values[:, :, u8, None])
+                continue
+
+            n_args = u8 & 0x0f
+            args = stack[-n_args:]
+            del stack[-n_args:]
+            is_multiply = (kind == _MultiplyN) != invert_binops
+            masks = self.mask_combinations[:, op_idx]
+            op_idx += 1
+
+            # As in the C++ Evaluator, bit 0 of the mask is for the
+            # operand on top of the stack.
+            identity = 1 if is_multiply else 0
+            non_inverting = inverting = identity
+            for bit_idx, arg in enumerate(reversed(args)):
+                is_non_inverting = ((masks >> bit_idx) & 1).astype(bool)
+                non_inv_arg = np.where(is_non_inverting, arg, identity)
+                inv_arg = np.where(is_non_inverting, identity, arg)
+                if is_multiply:
+                    valid &= (arg != 1)
+                    non_inverting = non_inverting * non_inv_arg
+                    inverting = inverting * inv_arg
+                else:
+                    non_inverting = non_inverting + non_inv_arg
+                    inverting = inverting + inv_arg
+
+            if is_multiply:
+                valid &= (non_inverting % inverting == 0)
+                result = non_inverting // inverting
+            else:
+                valid &= (non_inverting > inverting)
+                result = non_inverting - inverting
+
+            # Keep invalid results positive, so they do no harm (such
+            # as dividing by zero) in later operations.
+            stack.append(np.where(valid, result, 1))
+
+        values = np.broadcast_to(stack[0], shape)
+        return values, valid
+
+    def pprint(self, cards, mask_combination, invert_binops):
+        "Text form of one evaluation, as printed by evaluator-cli"
+        opcode_strs = []
+        op_idx = 0
+        for u8 in self.tokens:
+            kind = u8 >> 4
+            if kind == _Value:
+                opcode_strs.append(f"V({cards[u8]})")
+                continue
+            n_args = u8 & 0x0f
+            is_multiply = (kind == _MultiplyN) != invert_binops
+            mask = mask_combination[op_idx]
+            op_idx += 1
+            signs = "".join(
+                "+" if mask & (1 << bit_idx) else "-"
+                for bit_idx in reversed(range(n_args))
+            )
+            opcode_strs.append(f"{'M' if is_multiply else 'A'}({signs})")
+        opcode_strs.append("R")
+        return " ".join(opcode_strs)
+
+
+class VectorSolver:
+    "Solver for games with `n_cards` cards, using NumPy"
+
+    def __init__(self, n_cards):
+        self.n_cards = n_cards
+        self.choices = {
+            n_used: np.array(
+                list(combinations(range(n_cards), n_used)),
+                dtype=np.int64,
+            )
+            for n_used in range(1, n_cards + 1)
+        }
+        self.templates = {
+            n_used: [VectorTemplate(t) for t in ct.all_flat_trees(n_used)]
+            for n_used in range(1, n_cards + 1)
+        }
+
+    def solve(self, games):
+        """All solutions of each of the given games
+
+        Each game is a pair `(target, cards)`.  Return a list, with one
+        element per game, of lists of solutions as strings.
+        """
+        targets = np.array([target for target, _ in games], dtype=np.int64)
+        all_cards = np.array([cards for _, cards in games], dtype=np.int64)
+        if all_cards.shape[1:] != (self.n_cards,):
+            raise ValueError(f"all games must have {self.n_cards} cards")
+
+        solutions = [[] for _ in games]
+        for invert_binops in [False, True]:
+            for n_used in range(1, self.n_cards + 1):
+                choices = self.choices[n_used]
+                leaf_values = all_cards[:, choices]
+                for template in self.templates[n_used]:
+                    values, valid = template.evaluate(leaf_values, invert_binops)
+                    is_solution = valid & (values == targets[:, None, None])
+                    # np.nonzero() gives indexes in lexicographic order,
+                    # which within each game is the Evaluator's order.
+                    for game_idx, choice_idx, mask_idx in zip(
+                            *np.nonzero(is_solution)
+                    ):
+                        solutions[game_idx].append(template.pprint(
+                            leaf_values[game_idx, choice_idx],
+                            template.mask_combinations[mask_idx],
+                            invert_binops,
+                        ))
+        return solutions